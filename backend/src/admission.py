@@ -0,0 +1,85 @@
+import asyncio
+
+from collections import deque
+
+
+class AdmissionStats:
+    def __init__(self) -> None:
+        self.admitted = 0
+        self.superseded = 0
+        self.dropped = 0
+        self.processed = 0
+        self.preempted = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "admitted": self.admitted,
+            "superseded": self.superseded,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "preempted": self.preempted,
+        }
+
+
+# Process-wide totals across every connection's queue
+ADMISSION_TOTALS = AdmissionStats()
+
+
+class FrameQueue:
+    def __init__(self, maxsize: int = 1, totals: AdmissionStats = ADMISSION_TOTALS):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+
+        self.maxsize = maxsize
+        self.pending = deque()
+        self.ready = asyncio.Event()
+        self.closed = False
+
+        self.stats = AdmissionStats()
+        self.totals = totals
+
+    def __len__(self) -> int:
+        return len(self.pending)
+
+    def _count(self, name: str, amount: int = 1) -> None:
+        setattr(self.stats, name, getattr(self.stats, name) + amount)
+        setattr(self.totals, name, getattr(self.totals, name) + amount)
+
+    def put(self, item) -> None:
+        if self.closed:
+            self._count("dropped")
+            return
+
+        # Latest frame wins: replace the oldest pending frame instead of queueing
+        if len(self.pending) >= self.maxsize:
+            self.pending.popleft()
+            self._count("superseded")
+
+        self.pending.append(item)
+        self._count("admitted")
+        self.ready.set()
+
+    def drop(self) -> None:
+        # Record a frame that was rejected before it could be admitted
+        self._count("dropped")
+
+    def preempt(self) -> None:
+        # Record a frame whose caption was cut short by a newer one
+        self._count("preempted")
+
+    async def get(self):
+        while not self.pending:
+            if self.closed:
+                return None
+
+            self.ready.clear()
+            await self.ready.wait()
+
+        self._count("processed")
+        return self.pending.popleft()
+
+    def close(self) -> None:
+        self.closed = True
+        self._count("dropped", len(self.pending))
+        self.pending.clear()
+        self.ready.set()
@@ -0,0 +1,321 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+import cv2
+import uvloop
+
+from collections import deque
+from collections.abc import AsyncIterator
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import IO
+from config import AnalyzeConfig, SceneConfig, ServerConfig
+from models.base import CancelToken, Frame, FrameStatus
+from models.decode import PixelFormat, RawLayout
+from models.registry import CLASSIFY_MODELS, MODELS, ModelRegistry
+from scene import SceneDetector
+
+
+class Sample:
+    def __init__(self, index: int, timestamp: float, frame: Frame) -> None:
+        self.index = index
+        self.timestamp = timestamp
+        self.frame = frame
+        self.change = None
+        self.status = None
+        self.caption = None
+        self.error = None
+
+    def as_dict(self) -> dict:
+        record = {
+            "frame": self.index,
+            "time": round(self.timestamp, 3),
+            "similar": self.change.similar,
+        }
+        if self.change.hash is not None:
+            record["hash"] = f"{self.change.hash:016x}"
+        if not self.change.similar:
+            record["significant"] = self.change.significant
+            if (region := self.change.region) is not None:
+                record["region"] = [round(value, 4) for value in region]
+                record["direction"] = region.direction
+            record["status"] = self.status.value if self.status else None
+            record["caption"] = self.caption
+        if self.error is not None:
+            record["error"] = self.error
+        return record
+
+
+class AnalyzeStats:
+    def __init__(self) -> None:
+        self.decoded = 0
+        self.sampled = 0
+        self.similar = 0
+        self.classified = 0
+        self.hazards = 0
+        self.captioned = 0
+        self.errors = 0
+
+    def count(self, sample: Sample) -> None:
+        self.sampled += 1
+        self.similar += sample.change.similar
+        self.classified += sample.status is not None
+        self.hazards += sample.status == FrameStatus.Hazard
+        self.captioned += sample.caption is not None
+        self.errors += sample.error is not None
+
+
+def decode_segment(
+    path: str, start: int, end: int | None, step: int, size: int
+) -> tuple[int, list[tuple[int, bytes]]]:
+    # Runs on a decode thread: OpenCV releases the GIL while decoding and resizing
+    capture = cv2.VideoCapture(path)
+    capture.set(cv2.CAP_PROP_POS_FRAMES, start)
+
+    samples = []
+    index = start
+    while end is None or index < end:
+        # Frames between samples are only grabbed, never converted
+        if (index - start) % step:
+            if not capture.grab():
+                break
+            index += 1
+            continue
+
+        ret, frame = capture.read()
+        if not ret:
+            break
+
+        frame = cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+        samples.append((index, cv2.cvtColor(frame, cv2.COLOR_BGR2RGB).tobytes()))
+        index += 1
+
+    capture.release()
+    return index - start, samples
+
+
+async def decode(
+    path: str, config: AnalyzeConfig, executor: Executor, stats: AnalyzeStats
+) -> AsyncIterator[Sample]:
+    capture = cv2.VideoCapture(path)
+    if not capture.isOpened():
+        raise ValueError(f"Error opening video file {path}")
+    video_fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+    capture.release()
+
+    # Segments start on a sampled frame, so every worker samples the same grid. The
+    # last one reads to the end, in case the container's frame count is short
+    step = max(1, round(video_fps / config.fps))
+    length = max(1, round(config.segment_seconds * video_fps / step)) * step
+    starts = list(range(0, max(total, 1), length))
+    ends = starts[1:] + [None]
+    layout = RawLayout(PixelFormat.RGB, config.size, config.size)
+
+    async def samples(segment: asyncio.Future) -> AsyncIterator[Sample]:
+        decoded, pixels = await segment
+        stats.decoded += decoded
+        for index, data in pixels:
+            yield Sample(index, index / video_fps, Frame(data, layout))
+
+    # Only one segment per worker is decoded ahead, so memory stays flat
+    loop = asyncio.get_running_loop()
+    pending = deque()
+    for start, end in zip(starts, ends):
+        pending.append(
+            loop.run_in_executor(
+                executor, decode_segment, path, start, end, step, config.size
+            )
+        )
+        if len(pending) == config.decode_workers:
+            async for sample in samples(pending.popleft()):
+                yield sample
+
+    while pending:
+        async for sample in samples(pending.popleft()):
+            yield sample
+
+
+async def caption(models: ModelRegistry, sample: Sample) -> None:
+    tokens = []
+    async for token in models.caption.caption(sample.frame, CancelToken()):
+        tokens.append(token)
+    sample.caption = "".join(tokens).strip()
+
+
+async def process(chunk: list[Sample], models: ModelRegistry) -> list[Sample]:
+    gated = [sample for sample in chunk if not sample.change.similar]
+    if not gated:
+        return chunk
+
+    try:
+        statuses = await models.classify.classify_batch(
+            [sample.frame for sample in gated]
+        )
+    except Exception as e:
+        for sample in gated:
+            sample.error = f"classify: {e}"
+        return chunk
+
+    for sample, status in zip(gated, statuses):
+        sample.status = status
+
+    # Same rule as the server: caption hazards and significant scene changes
+    wanted = [
+        sample
+        for sample in gated
+        if sample.status == FrameStatus.Hazard or sample.change.significant
+    ]
+    results = await asyncio.gather(
+        *(caption(models, sample) for sample in wanted),
+        return_exceptions=True,
+    )
+    for sample, result in zip(wanted, results):
+        if isinstance(result, Exception):
+            sample.error = f"caption: {result}"
+
+    return chunk
+
+
+async def analyze(
+    path: str, models: ModelRegistry, config: AnalyzeConfig, output: IO[str]
+) -> dict:
+    stats = AnalyzeStats()
+    detector = SceneDetector(config.scene)
+    decoder = ThreadPoolExecutor(config.decode_workers, thread_name_prefix="decode")
+
+    # Chunks are processed concurrently but written in order, dropping their pixels
+    inflight = deque()
+
+    async def write(limit: int) -> None:
+        while len(inflight) > limit:
+            for sample in await inflight.popleft():
+                output.write(json.dumps(sample.as_dict()) + "\n")
+                stats.count(sample)
+                sample.frame.release()
+                sample.frame = None
+
+    start = time.perf_counter()
+    chunk = []
+    gated = 0
+    async for sample in decode(path, config, decoder, stats):
+        sample.change = detector.check(sample.frame.as_image())
+        chunk.append(sample)
+        gated += not sample.change.similar
+
+        # A long static stretch still flushes its similar frames every few batches
+        if gated < config.batch_size and len(chunk) < config.batch_size * 4:
+            continue
+
+        inflight.append(asyncio.create_task(process(chunk, models)))
+        chunk = []
+        gated = 0
+        await write(config.max_batches - 1)
+
+    if chunk:
+        inflight.append(asyncio.create_task(process(chunk, models)))
+    await write(0)
+
+    elapsed = time.perf_counter() - start
+    decoder.shutdown()
+
+    return {
+        "video": path,
+        "elapsed_s": round(elapsed, 3),
+        "decoded": stats.decoded,
+        "sampled": stats.sampled,
+        "similar": stats.similar,
+        "classified": stats.classified,
+        "hazards": stats.hazards,
+        "captioned": stats.captioned,
+        "errors": stats.errors,
+        "decoded_frames_per_sec": round(stats.decoded / elapsed, 2),
+        "frames_per_sec": round(stats.sampled / elapsed, 2),
+    }
+
+
+async def main(path: str, models: ModelRegistry, config: AnalyzeConfig, output: str):
+    print(f"Loading models: {models.caption_name}, {models.classify_name}")
+    await models.load()
+
+    with open(output, "w") as f:
+        report = await analyze(path, models, config, f)
+
+    print(f"Wrote timeline to {output}")
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Run a recorded video through the models and write a JSONL timeline"
+    )
+    parser.add_argument("video")
+    parser.add_argument("--output", help="Timeline file, <video name>.jsonl by default")
+    parser.add_argument(
+        "--caption-model", choices=list(MODELS), default=ServerConfig.caption_model
+    )
+    parser.add_argument(
+        "--classify-model", choices=CLASSIFY_MODELS, default=ServerConfig.classify_model
+    )
+    parser.add_argument(
+        "--fps",
+        type=float,
+        default=AnalyzeConfig.fps,
+        help="Frames sampled per second of video",
+    )
+    parser.add_argument("--size", type=int, default=AnalyzeConfig.size)
+    parser.add_argument(
+        "--decode-workers", type=int, default=AnalyzeConfig.decode_workers
+    )
+    parser.add_argument(
+        "--segment-seconds",
+        type=float,
+        default=AnalyzeConfig.segment_seconds,
+        help="Video each decode worker takes at a time",
+    )
+    parser.add_argument("--batch-size", type=int, default=AnalyzeConfig.batch_size)
+    parser.add_argument(
+        "--max-batches",
+        type=int,
+        default=AnalyzeConfig.max_batches,
+        help="Batches classified or captioned at once",
+    )
+    parser.add_argument(
+        "--similar-threshold", type=int, default=SceneConfig.similar_threshold
+    )
+    parser.add_argument(
+        "--different-threshold", type=int, default=SceneConfig.different_threshold
+    )
+    parser.add_argument("--device", default=ServerConfig.device)
+    parser.add_argument("--quantize", action="store_true")
+    parser.add_argument("--threads", type=int, default=ServerConfig.threads)
+    parser.add_argument("--compile-cache-dir", default=ServerConfig.compile_cache_dir)
+    args = parser.parse_args()
+
+    config = AnalyzeConfig(
+        fps=args.fps,
+        size=args.size,
+        decode_workers=args.decode_workers,
+        segment_seconds=args.segment_seconds,
+        batch_size=args.batch_size,
+        max_batches=args.max_batches,
+        scene=SceneConfig(
+            similar_threshold=args.similar_threshold,
+            different_threshold=args.different_threshold,
+        ),
+    )
+    models = ModelRegistry(
+        args.caption_model,
+        args.classify_model,
+        {
+            "device": args.device,
+            "quantize": args.quantize,
+            "threads": args.threads,
+            "cache_dir": args.compile_cache_dir or None,
+        },
+    )
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    output = args.output or os.path.splitext(os.path.basename(args.video))[0] + ".jsonl"
+    asyncio.run(main(args.video, models, config, output))
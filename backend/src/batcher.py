@@ -0,0 +1,139 @@
+import asyncio
+import time
+
+from collections import deque
+from config import BatchConfig
+from metrics import METRICS
+from models.base import Frame, FrameStatus, VendorModel
+
+
+class BatchStats:
+    def __init__(self) -> None:
+        self.batches = 0
+        self.frames = 0
+        self.wait_seconds = 0.0
+
+    def as_dict(self) -> dict:
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "mean_batch_size": (
+                round(self.frames / self.batches, 2) if self.batches else 0.0
+            ),
+            "mean_wait_ms": (
+                round(self.wait_seconds / self.frames * 1000, 3) if self.frames else 0.0
+            ),
+        }
+
+
+class ClassifyBatcher:
+    # Gathers classify requests from every connection into batched forward passes.
+    # A lone frame on a quiet server goes straight through; as the queue runs deeper,
+    # batches aim bigger and are held open a little longer for stragglers
+    def __init__(self, config: BatchConfig) -> None:
+        self.config = config
+        self.alpha = 2 / (config.window + 1)
+
+        # (model, frame, future, enqueued_at) waiting for a batch
+        self.pending = deque()
+        self.arrived = asyncio.Event()
+        self.slots = asyncio.Semaphore(config.max_in_flight)
+        self.task = None
+        self.running = set()
+
+        # Smoothed number of frames waiting whenever a batch starts forming
+        self.depth = 1.0
+        self.stats = BatchStats()
+
+    def target(self) -> int:
+        return max(1, min(self.config.max_batch_size, round(self.depth)))
+
+    def window(self) -> float:
+        # Nothing to wait for at a depth of one, the full window once batches fill up
+        fill = (self.depth - 1) / max(1, self.config.max_batch_size - 1)
+        return self.config.max_wait * min(1.0, max(0.0, fill))
+
+    async def classify(self, model, frame: Frame) -> FrameStatus:
+        # Vendor models, including the inference process proxy, batch on their own side
+        if isinstance(model, VendorModel):
+            return await model.classify(frame)
+
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self.pending.append((model, frame, future, time.perf_counter()))
+        self.arrived.set()
+        if self.task is None:
+            self.task = loop.create_task(self.run())
+        return await future
+
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.slots.acquire()
+            while not self.pending:
+                self.arrived.clear()
+                await self.arrived.wait()
+
+            # Size the batch by how deep the queue has been running, then give it until
+            # the window closes to fill up
+            self.depth += self.alpha * (len(self.pending) - self.depth)
+            target = self.target()
+            deadline = loop.time() + self.window()
+            while (
+                len(self.pending) < target and (timeout := deadline - loop.time()) > 0
+            ):
+                self.arrived.clear()
+                try:
+                    await asyncio.wait_for(self.arrived.wait(), timeout)
+                except TimeoutError:
+                    break
+
+            task = loop.create_task(self.dispatch(self.take()))
+            self.running.add(task)
+            task.add_done_callback(self.running.discard)
+
+    def take(self) -> list[tuple]:
+        # One model per batch, in arrival order
+        batch = []
+        while self.pending and len(batch) < self.config.max_batch_size:
+            model = self.pending[0][0]
+            if batch and model is not batch[0][0]:
+                break
+            batch.append(self.pending.popleft())
+        return batch
+
+    async def dispatch(self, batch: list[tuple]) -> None:
+        model = batch[0][0]
+        frames = [frame for _, frame, _, _ in batch]
+
+        started = time.perf_counter()
+        for *_, enqueued_at in batch:
+            METRICS.observe("classify_batch_wait", started - enqueued_at)
+            self.stats.wait_seconds += started - enqueued_at
+        METRICS.increment("classify_batches", size=len(batch))
+        self.stats.batches += 1
+        self.stats.frames += len(batch)
+
+        try:
+            with METRICS.span("classify_batch"):
+                statuses = await model.classify_batch(frames)
+        except Exception as e:
+            for _, _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        else:
+            for (_, _, future, _), status in zip(batch, statuses):
+                if not future.done():
+                    future.set_result(status)
+        finally:
+            self.slots.release()
+
+    def as_dict(self) -> dict:
+        stats = self.stats.as_dict()
+        return {
+            **stats,
+            "fill": round(stats["mean_batch_size"] / self.config.max_batch_size, 3),
+            "queue_depth": round(self.depth, 2),
+            "target_batch_size": self.target(),
+            "window_ms": round(self.window() * 1000, 3),
+        }
@@ -0,0 +1,154 @@
+import time
+
+from collections import OrderedDict, defaultdict
+from config import CacheConfig
+from metrics import METRICS
+from models.base import FrameStatus
+
+HASH_BITS = 64
+
+# Rough per-entry bookkeeping cost (entry object, dict slots, index sets)
+ENTRY_OVERHEAD = 512
+
+
+class MultiIndex:
+    # Multi-index hashing: split hashes into radius + 1 chunks. By pigeonhole, any hash
+    # within the radius matches at least one chunk exactly, so only those buckets are scanned
+    def __init__(self, radius: int, bits: int = HASH_BITS) -> None:
+        self.radius = radius
+        chunks = radius + 1
+        bounds = [round(i * bits / chunks) for i in range(chunks + 1)]
+        self.slices = [
+            (low, (1 << (high - low)) - 1) for low, high in zip(bounds, bounds[1:])
+        ]
+        self.tables = [defaultdict(set) for _ in self.slices]
+
+    def _chunks(self, value: int) -> list[int]:
+        return [(value >> shift) & mask for shift, mask in self.slices]
+
+    def add(self, value: int) -> None:
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            table[chunk].add(value)
+
+    def remove(self, value: int) -> None:
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            bucket = table[chunk]
+            bucket.discard(value)
+            if not bucket:
+                del table[chunk]
+
+    def search(self, value: int) -> list[tuple[int, int]]:
+        candidates = set()
+        for table, chunk in zip(self.tables, self._chunks(value)):
+            candidates.update(table.get(chunk, ()))
+
+        matches = [
+            (candidate, (candidate ^ value).bit_count()) for candidate in candidates
+        ]
+        return sorted(
+            (match for match in matches if match[1] <= self.radius),
+            key=lambda match: match[1],
+        )
+
+
+class CacheEntry:
+    def __init__(self, key: int, status: FrameStatus, created_at: float) -> None:
+        self.key = key
+        self.status = status
+        self.tokens = None
+        self.created_at = created_at
+        self.size = ENTRY_OVERHEAD
+
+
+class CaptionCache:
+    # Process-wide verdicts and captions keyed by perceptual hash; only touched from the loop
+    def __init__(self, config: CacheConfig) -> None:
+        self.config = config
+        self.entries = OrderedDict()
+        self.index = MultiIndex(config.radius)
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = {"lru": 0, "ttl": 0, "memory": 0}
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _discard(self, key: int) -> None:
+        entry = self.entries.pop(key)
+        self.index.remove(key)
+        self.bytes -= entry.size
+
+    def _remove(self, key: int, reason: str) -> None:
+        self._discard(key)
+        self.evictions[reason] += 1
+        METRICS.increment("cache_evictions", reason=reason)
+
+    def _expired(self, entry: CacheEntry, now: float) -> bool:
+        return now - entry.created_at > self.config.ttl
+
+    def lookup(self, key: int) -> CacheEntry | None:
+        now = time.monotonic()
+        for match, _ in self.index.search(key):
+            entry = self.entries[match]
+            if self._expired(entry, now):
+                self._remove(match, "ttl")
+                continue
+
+            # Nearest live neighbour wins; reading it makes it most recently used
+            self.entries.move_to_end(match)
+            self.hits += 1
+            METRICS.increment("cache_lookups", result="hit")
+            return entry
+
+        self.misses += 1
+        METRICS.increment("cache_lookups", result="miss")
+        return None
+
+    def store_status(self, key: int, status: FrameStatus) -> None:
+        # A fresh verdict replaces the old one, along with any caption made under it
+        if key in self.entries:
+            self._discard(key)
+
+        entry = CacheEntry(key, status, time.monotonic())
+        self.entries[key] = entry
+        self.index.add(key)
+        self.bytes += entry.size
+        self._evict()
+
+    def store_caption(self, key: int, tokens: list[str]) -> None:
+        if (entry := self.entries.get(key)) is None:
+            return
+
+        self.bytes -= entry.size
+        entry.tokens = tokens
+        entry.size = ENTRY_OVERHEAD + sum(len(token) for token in tokens)
+        self.bytes += entry.size
+        self.entries.move_to_end(key)
+        self._evict()
+
+    def _evict(self) -> None:
+        # Expired entries at the cold end go first, then least recently used ones
+        now = time.monotonic()
+        while self.entries:
+            key, entry = next(iter(self.entries.items()))
+            if self._expired(entry, now):
+                self._remove(key, "ttl")
+            elif len(self.entries) > self.config.max_entries:
+                self._remove(key, "lru")
+            elif self.bytes > self.config.max_bytes:
+                self._remove(key, "memory")
+            else:
+                break
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self.entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": dict(self.evictions),
+        }
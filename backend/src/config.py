@@ -0,0 +1,181 @@
+from dataclasses import dataclass, field
+
+
+@dataclass
+class SceneConfig:
+    # Recent accepted frames each new frame is compared against
+    history: int = 3
+
+    # Hamming distances (out of 64 bits) between perceptual hashes
+    similar_threshold: int = 20
+    different_threshold: int = 50
+
+    # Optional dHash distance under which a frame is skipped before the pHash
+    dhash_threshold: int | None = None
+
+    # Where the change since the last accepted frame is, from a tiles x tiles grid
+    # over the frame; reported to clients for directional guidance
+    tiles: int = 8
+
+    # Mean absolute luma difference (0-255) at which a tile counts as changed
+    tile_threshold: float = 16.0
+
+    # Changes spread over more of the frame than this are the whole scene changing
+    max_region_area: float = 0.5
+
+
+@dataclass
+class SpeculationConfig:
+    # "auto" follows the recent hazard rate; "always" and "never" override it
+    mode: str = "auto"
+
+    # Caption ahead of the verdict while the smoothed hazard rate is at least this
+    hazard_rate_threshold: float = 0.25
+
+    # Verdicts the hazard rate is averaged over
+    window: int = 10
+
+
+@dataclass
+class RateConfig:
+    # Frame interval bounds recommended to clients that opt into rate control, in seconds
+    min_interval: float = 0.25
+    max_interval: float = 2.0
+
+    # Square frame sizes: full model input, and a smaller one for static or busy periods
+    max_size: int = 128
+    min_size: int = 96
+
+    # Sample at the fastest rate while the smoothed hazard rate is at least this
+    hazard_rate_threshold: float = 0.5
+
+    # Frames the redundant share is averaged over
+    window: int = 10
+
+    # Seconds between control messages, and the relative interval change worth sending
+    min_update: float = 1.0
+    hysteresis: float = 0.2
+
+
+@dataclass
+class CacheConfig:
+    # Share verdicts and captions across connections for near-identical scenes
+    enabled: bool = True
+
+    # pHash Hamming distance within which a cached scene is reused
+    radius: int = 6
+
+    # Seconds before a cached scene is considered stale
+    ttl: float = 120.0
+
+    max_entries: int = 10_000
+    max_bytes: int = 16 * 1024 * 1024
+
+
+@dataclass
+class BackpressureConfig:
+    # What a caption does once a client stops draining its socket: "pause" stops
+    # sending until it catches up, "coalesce" batches tokens into one message, "drop"
+    # cuts the caption short with a truncated end marker
+    policy: str = "pause"
+
+    # Per-connection write buffer watermarks, in bytes
+    high_water: int = 64 * 1024
+    low_water: int = 16 * 1024
+
+    # A paused caption still backed up after this many seconds is dropped, freeing its slot
+    pause_timeout: float = 2.0
+
+
+@dataclass
+class BatchConfig:
+    # Classify frames from every connection together in batched forward passes
+    enabled: bool = True
+
+    # Frames per forward pass, and the longest a batch is held open to fill, in seconds
+    max_batch_size: int = 8
+    max_wait: float = 0.01
+
+    # Batches the queue depth is averaged over when sizing the next one
+    window: int = 10
+
+    # Batches handed to the model at once; extras wait on its worker, ready to start
+    max_in_flight: int = 1
+
+
+@dataclass
+class InferenceConfig:
+    # Unix socket of a separate model process; None runs the models in-process
+    socket: str | None = None
+
+    # Front-end processes sharing the port (SO_REUSEPORT) in front of one model process
+    frontends: int = 1
+
+    # Shared-memory frame ring per front end; frames larger than a slot are rejected
+    ring_slots: int = 32
+    ring_slot_bytes: int = 512 * 1024
+
+    # Seconds a frame waits for a free slot before its request fails
+    ring_wait: float = 2.0
+
+
+@dataclass
+class AnalyzeConfig:
+    # Frames analysed per second of video, and their square size
+    fps: float = 2.0
+    size: int = 128
+
+    # Decode threads, each taking a segment of this many seconds at a time
+    decode_workers: int = 4
+    segment_seconds: float = 10.0
+
+    # Frames classified together, and batches classified or captioned at once
+    batch_size: int = 8
+    max_batches: int = 2
+
+    scene: SceneConfig = field(default_factory=SceneConfig)
+
+
+@dataclass
+class ServerConfig:
+    host: str = "0.0.0.0"
+    port: int = 2222
+
+    # Models by registry name, loaded lazily and concurrently at startup
+    caption_model: str = "llava"
+    classify_model: str = "groq"
+
+    # While models warm up, "queue" holds frames until ready and "reject" closes new connections
+    warmup_policy: str = "queue"
+
+    # Inductor/Triton compile and autotune artifacts reused across restarts; None disables
+    compile_cache_dir: str | None = ".cache/compile"
+
+    # Threads for per-frame work off the loop (hashing, scene checks), shared by every
+    # connection; models run on their own workers
+    workers: int = 4
+
+    # Pending frames held per connection before older ones are superseded
+    queue_size: int = 1
+
+    # Device for local models ("cuda:0", "cpu"); int8 weights are CPU only
+    device: str = "cuda:0"
+    quantize: bool = False
+
+    # Intra-op threads for CPU inference; defaults to every available core
+    threads: int | None = None
+
+    # Stage timings and counters over HTTP, bound to loopback; port 0 disables
+    metrics_host: str = "127.0.0.1"
+    metrics_port: int = 9100
+
+    # Also serve a sampling profiler at /profile
+    profile: bool = False
+
+    scene: SceneConfig = field(default_factory=SceneConfig)
+    speculation: SpeculationConfig = field(default_factory=SpeculationConfig)
+    cache: CacheConfig = field(default_factory=CacheConfig)
+    rate: RateConfig = field(default_factory=RateConfig)
+    backpressure: BackpressureConfig = field(default_factory=BackpressureConfig)
+    batching: BatchConfig = field(default_factory=BatchConfig)
+    inference: InferenceConfig = field(default_factory=InferenceConfig)
@@ -0,0 +1,88 @@
+import asyncio
+import time
+
+from config import BackpressureConfig
+from metrics import METRICS
+
+
+class FlowStats:
+    def __init__(self) -> None:
+        self.pauses = 0
+        self.paused_seconds = 0.0
+        self.coalesced = 0
+        self.truncated = 0
+
+    def as_dict(self) -> dict:
+        return {
+            "pauses": self.pauses,
+            "paused_seconds": round(self.paused_seconds, 3),
+            "coalesced": self.coalesced,
+            "truncated": self.truncated,
+        }
+
+
+# Process-wide totals across every connection
+FLOW_TOTALS = FlowStats()
+
+
+class WriteFlow:
+    # Tracks whether a client keeps up with its socket. The transport calls back when
+    # its write buffer crosses the high watermark and again once it drains below the low one
+    def __init__(
+        self,
+        config: BackpressureConfig,
+        transport: asyncio.WriteTransport,
+        totals: FlowStats = FLOW_TOTALS,
+    ) -> None:
+        self.config = config
+        self.transport = transport
+        transport.set_write_buffer_limits(high=config.high_water, low=config.low_water)
+
+        self.writable = asyncio.Event()
+        self.writable.set()
+        self.paused_at = None
+
+        self.stats = FlowStats()
+        self.totals = totals
+
+    def count(self, name: str, amount: int | float = 1) -> None:
+        setattr(self.stats, name, getattr(self.stats, name) + amount)
+        setattr(self.totals, name, getattr(self.totals, name) + amount)
+
+    @property
+    def paused(self) -> bool:
+        return not self.writable.is_set()
+
+    @property
+    def buffered(self) -> int:
+        return self.transport.get_write_buffer_size()
+
+    def pause(self) -> None:
+        self.writable.clear()
+        self.paused_at = time.perf_counter()
+        self.count("pauses")
+        METRICS.increment("write_paused", policy=self.config.policy)
+
+    def resume(self) -> None:
+        self.writable.set()
+        if self.paused_at is not None:
+            elapsed = time.perf_counter() - self.paused_at
+            self.count("paused_seconds", elapsed)
+            METRICS.observe("write_pause", elapsed, policy=self.config.policy)
+            self.paused_at = None
+
+    async def wait(self) -> bool:
+        # False if the client stays backed up past the timeout
+        try:
+            await asyncio.wait_for(self.writable.wait(), self.config.pause_timeout)
+            return True
+        except TimeoutError:
+            return False
+
+    def as_dict(self) -> dict:
+        return {
+            "policy": self.config.policy,
+            "paused": self.paused,
+            "buffered_bytes": self.buffered,
+            **self.stats.as_dict(),
+        }
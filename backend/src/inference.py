@@ -0,0 +1,371 @@
+import asyncio
+import json
+import os
+import struct
+import weakref
+
+from batcher import ClassifyBatcher
+from collections.abc import AsyncGenerator, Coroutine
+from config import InferenceConfig, ServerConfig
+from enum import IntEnum
+from metrics import METRICS, serve_metrics
+from models.base import CancelToken, Frame, FrameStatus, VendorModel
+from models.decode import PixelFormat, RawLayout
+from models.registry import ModelRegistry
+from ring import FrameRing
+
+# Payload length, request id (or ring slot), op; followed by the payload
+CHANNEL = struct.Struct("!IIB")
+
+# Classify and caption requests name a ring slot and the frame length inside it,
+# plus the raw pixel layout (format 0 for encoded images)
+SLOT = struct.Struct("!IIBHH")
+
+
+class Op(IntEnum):
+    # Front end -> inference process
+    Hello = 0
+    Classify = 1
+    Caption = 2
+    Cancel = 3
+    Release = 4
+
+    # Inference process -> front end; every request ends with Done, after any Error
+    Ready = 5
+    Status = 6
+    Token = 7
+    Error = 8
+    Done = 9
+
+
+def write_message(
+    writer: asyncio.StreamWriter, op: Op, request_id: int = 0, payload: bytes = b""
+) -> None:
+    writer.write(CHANNEL.pack(len(payload), request_id, op) + payload)
+
+
+async def read_message(reader: asyncio.StreamReader) -> tuple[Op, int, bytes]:
+    length, request_id, op = CHANNEL.unpack(await reader.readexactly(CHANNEL.size))
+    return Op(op), request_id, await reader.readexactly(length)
+
+
+def local_models(config: ServerConfig) -> ModelRegistry:
+    return ModelRegistry(
+        config.caption_model,
+        config.classify_model,
+        {
+            "device": config.device,
+            "quantize": config.quantize,
+            "threads": config.threads,
+            "cache_dir": config.compile_cache_dir,
+        },
+    )
+
+
+class InferenceClient(VendorModel):
+    # Front-end proxy for the models of an inference process. The server awaits it
+    # like a vendor model, while frames travel through the ring instead of the socket
+    def __init__(self, config: InferenceConfig) -> None:
+        self.config = config
+        self.ring = FrameRing.create(config.ring_slots, config.ring_slot_bytes)
+        self.free = asyncio.Queue()
+        for slot in range(config.ring_slots):
+            self.free.put_nowait(slot)
+
+        # Live frames and requests per slot; a slot is reused once nothing refers to it
+        self.refs = {}
+        self.pending = {}
+        self.next_request = 0
+
+        self.loop = None
+        self.reader = None
+        self.writer = None
+        self.connected = False
+
+    async def connect(self, models: ModelRegistry) -> None:
+        self.loop = asyncio.get_running_loop()
+
+        # The inference process may still be starting up
+        while True:
+            try:
+                self.reader, self.writer = await asyncio.open_unix_connection(
+                    self.config.socket
+                )
+                break
+            except (FileNotFoundError, ConnectionRefusedError):
+                await asyncio.sleep(0.2)
+
+        hello = {
+            "path": self.ring.path,
+            "slots": self.ring.slots,
+            "slot_bytes": self.ring.slot_bytes,
+        }
+        write_message(self.writer, Op.Hello, payload=json.dumps(hello).encode())
+        print(f"Attached to inference process at {self.config.socket}")
+
+        # Answered once the inference process has its models warm
+        op, _, payload = await read_message(self.reader)
+        if op == Op.Error:
+            models.fail(RuntimeError(payload.decode("utf-8")))
+            return
+
+        self.connected = True
+        names = json.loads(payload)
+        models.caption_name = names["caption"]
+        models.classify_name = names["classify"]
+        models.attach(self, self)
+        self.loop.create_task(self.read_messages(models))
+
+    async def read_messages(self, models: ModelRegistry) -> None:
+        try:
+            while True:
+                op, request_id, payload = await read_message(self.reader)
+                if request_id not in self.pending:
+                    continue
+
+                queue, slot = self.pending[request_id]
+                queue.put_nowait((op, payload))
+                if op == Op.Done:
+                    del self.pending[request_id]
+                    self.unref(slot)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            print(f"Lost the inference process: {e!r}")
+            self.connected = False
+            models.fail(ConnectionError("inference process disconnected"))
+
+            # Fail everything still waiting; the ring dies with this process
+            for queue, _ in self.pending.values():
+                queue.put_nowait((Op.Error, b"inference process disconnected"))
+                queue.put_nowait((Op.Done, b""))
+            self.pending.clear()
+
+    async def place(self, frame: Frame) -> int:
+        # One slot per frame, shared by its classify and caption requests
+        if (placing := frame.features.get(self)) is None:
+            placing = frame.features[self] = self.loop.create_task(self._place(frame))
+        return await placing
+
+    async def _place(self, frame: Frame) -> int:
+        with METRICS.span("ring_wait"):
+            try:
+                async with asyncio.timeout(self.config.ring_wait):
+                    slot = await self.free.get()
+            except TimeoutError:
+                raise RuntimeError(
+                    f"No free ring slot within {self.config.ring_wait}s"
+                ) from None
+
+        try:
+            self.ring.write(slot, frame.data)
+        except ValueError:
+            self.free.put_nowait(slot)
+            raise
+
+        # The frame itself holds a reference until it is released once handled, or
+        # garbage collected if nobody releases it; a finalizer only ever runs once
+        self.refs[slot] = 1
+        finalizer = weakref.finalize(
+            frame, self.loop.call_soon_threadsafe, self.unref, slot
+        )
+        finalizer.atexit = False
+        frame.on_release(finalizer)
+        return slot
+
+    def unref(self, slot: int) -> None:
+        self.refs[slot] -= 1
+        if self.refs[slot]:
+            return
+
+        # Release goes out before any request that reuses the slot, so the inference
+        # process has dropped its view of the old frame by the time it sees the new one
+        del self.refs[slot]
+        if self.connected:
+            write_message(self.writer, Op.Release, slot)
+        self.free.put_nowait(slot)
+
+    async def request(
+        self, op: Op, frame: Frame, cancel: CancelToken | None = None
+    ) -> AsyncGenerator[tuple[Op, bytes], None]:
+        if not self.connected:
+            raise ConnectionError("inference process disconnected")
+
+        slot = await self.place(frame)
+
+        self.next_request = (self.next_request + 1) % 2**32
+        request_id = self.next_request
+        queue = asyncio.Queue()
+        self.pending[request_id] = (queue, slot)
+        self.refs[slot] += 1
+        layout = frame.layout or (0, 0, 0)
+        write_message(
+            self.writer, op, request_id, SLOT.pack(slot, len(frame.data), *layout)
+        )
+
+        finished = False
+        try:
+            while (message := await queue.get())[0] != Op.Done:
+                if message[0] == Op.Error:
+                    finished = True
+                    raise RuntimeError(message[1].decode("utf-8"))
+
+                yield message
+                if cancel is not None and cancel.cancelled:
+                    break
+            else:
+                finished = True
+        finally:
+            # Abandoned or cancelled: stop the remote work, the slot frees on its Done
+            if not finished and request_id in self.pending:
+                write_message(self.writer, Op.Cancel, request_id)
+
+    async def classify(self, frame: Frame) -> FrameStatus:
+        async for _, payload in self.request(Op.Classify, frame):
+            status = FrameStatus(payload.decode("utf-8"))
+        return status
+
+    async def caption(
+        self, frame: Frame, cancel: CancelToken | None = None
+    ) -> AsyncGenerator[str, None]:
+        async for _, payload in self.request(Op.Caption, frame, cancel):
+            yield payload.decode("utf-8")
+
+
+class InferenceSession:
+    # One attached front end: its mapped ring, the frames it placed and running requests
+    def __init__(
+        self,
+        models: ModelRegistry,
+        ring: FrameRing,
+        writer: asyncio.StreamWriter,
+        batcher: ClassifyBatcher | None = None,
+    ) -> None:
+        self.models = models
+        self.ring = ring
+        self.writer = writer
+        self.batcher = batcher
+
+        # Frames by slot, kept until released so classify and caption share features
+        self.frames = {}
+        self.cancels = {}
+        self.tasks = set()
+
+    def frame(self, payload: bytes) -> Frame:
+        slot, length, format, width, height = SLOT.unpack(payload)
+        if slot not in self.frames:
+            layout = RawLayout(PixelFormat(format), width, height) if format else None
+            self.frames[slot] = Frame(self.ring.view(slot, length), layout)
+        return self.frames[slot]
+
+    def handle(self, op: Op, request_id: int, payload: bytes) -> None:
+        if op in (Op.Classify, Op.Caption):
+            METRICS.increment("inference_requests", op=op.name.lower())
+            cancel = self.cancels[request_id] = CancelToken()
+            run = self.classify if op == Op.Classify else self.caption
+            task = asyncio.create_task(
+                self.run(request_id, run(request_id, self.frame(payload), cancel))
+            )
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+        elif op == Op.Cancel:
+            if (cancel := self.cancels.get(request_id)) is not None:
+                cancel.cancel()
+        elif op == Op.Release:
+            if (frame := self.frames.pop(request_id, None)) is not None:
+                frame.release()
+
+    async def run(self, request_id: int, work: Coroutine) -> None:
+        try:
+            await work
+        except Exception as e:
+            write_message(self.writer, Op.Error, request_id, str(e).encode("utf-8"))
+        finally:
+            del self.cancels[request_id]
+            write_message(self.writer, Op.Done, request_id)
+
+    async def classify(self, request_id: int, frame: Frame, _: CancelToken) -> None:
+        with METRICS.span("classify", model=self.models.classify_name):
+            if self.batcher is not None:
+                status = await self.batcher.classify(self.models.classify, frame)
+            else:
+                status = await self.models.classify.classify(frame)
+        write_message(self.writer, Op.Status, request_id, status.value.encode())
+
+    async def caption(self, request_id: int, frame: Frame, cancel: CancelToken) -> None:
+        async for token in self.models.caption.caption(frame, cancel):
+            if cancel.cancelled:
+                break
+            write_message(self.writer, Op.Token, request_id, token.encode("utf-8"))
+
+    async def close(self) -> None:
+        # Stop generating for a front end that is gone, then let go of its ring
+        for cancel in self.cancels.values():
+            cancel.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+        for frame in self.frames.values():
+            frame.release()
+        self.frames.clear()
+        self.ring.close()
+
+
+async def serve_inference(models: ModelRegistry, config: ServerConfig) -> None:
+    # Model process: owns the weights and serves any number of front ends
+    # Every front end's frames are batched together here, next to the model
+    batcher = ClassifyBatcher(config.batching) if config.batching.enabled else None
+
+    async def on_front_end(
+        reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        op, _, payload = await read_message(reader)
+        hello = json.loads(payload)
+        ring = FrameRing(hello["path"], hello["slots"], hello["slot_bytes"])
+
+        # Both processes have it mapped now, so the file name is no longer needed
+        ring.unlink()
+
+        await models.ready.wait()
+        if models.state != "ready":
+            write_message(writer, Op.Error, payload=str(models.error).encode("utf-8"))
+            writer.close()
+            ring.close()
+            return
+
+        names = {"caption": models.caption_name, "classify": models.classify_name}
+        write_message(writer, Op.Ready, payload=json.dumps(names).encode())
+        print("Front end attached")
+
+        session = InferenceSession(models, ring, writer, batcher)
+        try:
+            while True:
+                session.handle(*await read_message(reader))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            await session.close()
+            writer.close()
+            print("Front end detached")
+
+    # A stale socket from a previous run would make the bind fail
+    if os.path.exists(config.inference.socket):
+        os.unlink(config.inference.socket)
+
+    server = await asyncio.start_unix_server(on_front_end, config.inference.socket)
+    print(f"Inference process listening on {config.inference.socket}")
+
+    if config.metrics_port:
+        await serve_metrics(
+            config.metrics_host,
+            config.metrics_port,
+            lambda: {
+                "models": models.state,
+                "batching": batcher.as_dict() if batcher is not None else None,
+            },
+            lambda: models.state,
+            profile=config.profile,
+        )
+        print(f"Metrics on http://{config.metrics_host}:{config.metrics_port}/stats")
+
+    if models.state == "loading":
+        print(f"Loading models: {models.caption_name}, {models.classify_name}")
+        await models.load()
+    await server.serve_forever()
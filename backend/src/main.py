@@ -1,84 +1,558 @@
-import transformers
-import imagehash
+import argparse
 import asyncio
+import multiprocessing
+import os
 import picows
+import tempfile
 import uvloop
+import json
+import time
 
-from models.base import Frame, DeviceModel, VendorModel, FrameStatus
-from models.groq import LlamaVisionModel
-from models.llava import LlavaModel
-from collections import deque
+from models.base import IMAGE_SIZE, AsyncModel, CancelToken, Frame, FrameStatus
+from models.decode import PixelFormat, parse_raw
+from models.registry import CLASSIFY_MODELS, MODELS, ModelRegistry
+from admission import ADMISSION_TOTALS, FrameQueue
+from batcher import ClassifyBatcher
+from cache import CaptionCache
+from flow import FLOW_TOTALS, WriteFlow
+from rate import RateController
+from metrics import METRICS, serve_metrics
+from config import (
+    BackpressureConfig,
+    BatchConfig,
+    CacheConfig,
+    InferenceConfig,
+    RateConfig,
+    SceneConfig,
+    ServerConfig,
+    SpeculationConfig,
+)
+from dataclasses import replace
+from inference import InferenceClient, local_models, serve_inference
+from scene import Region, SceneChange, SceneDetector
+from speculation import SPECULATION_TOTALS, SpeculationPolicy, TokenBuffer
+from protocol import (
+    BinaryStream,
+    EndReason,
+    MessageType,
+    TextStream,
+    encode,
+    parse_hello,
+)
+from collections.abc import AsyncGenerator, AsyncIterator
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import NamedTuple
 
-transformers.logging.set_verbosity_error()
+
+class InFlight(NamedTuple):
+    caption_id: str
+    cancel: CancelToken
+    hash: int
+    received_at: float
+
+    # Where in the frame the change was, if it was confined to part of it
+    region: Region | None = None
+
+
+# Live connections, for per-connection stats
+CONNECTIONS = set()
 
 
 class Server(picows.WSListener):
     def __init__(
         self,
-        caption_model: DeviceModel | VendorModel,
-        classify_model: DeviceModel | VendorModel,
+        models: ModelRegistry,
+        executor: Executor,
+        config: ServerConfig,
+        cache: CaptionCache | None = None,
+        batcher: ClassifyBatcher | None = None,
     ) -> None:
-        self.caption_model = caption_model
-        self.classify_model = classify_model
+        self.models = models
+        self.executor = executor
+        self.config = config
+        self.cache = cache
+        self.batcher = batcher
+
+        self.scene = SceneDetector(config.scene)
+        self.speculation = SpeculationPolicy(config.speculation)
+
+        # Legacy "caption_id|token" TEXT framing until the client says hello
+        self.framing = "text"
+        self.coalesce_window = 0.0
+
+        # Frames arrive as encoded images until the client asks for raw uploads
+        self.upload = "jpeg"
+        self.next_stream_id = 0
+
+        # Frame currently being classified or captioned, so newer frames can preempt it
+        self.inflight = None
+
+        # Write buffer state, and the caption stream that may be holding tokens back
+        self.flow = None
+        self.stream = None
 
-        self.hashes = deque(maxlen=3)
-        self.similarity_threshold = 20
-        self.different_threshold = 50
+        # Frame rate and size recommendations, for clients that ask for them
+        self.rate = RateController(config.rate)
+        self.rate_control = False
+        self.similar = 0
+
+        # Where in the frame each caption's change was, for clients that ask for it
+        self.regions = False
+        self.busy = False
+
+        self.transport = None
+        self.connected = False
+        self.loop = None
+        self.queue = None
+        self.worker = None
 
         super().__init__()
 
-    def handle_frame(
-        self, transport: picows.WSTransport, scene_frame: Frame, caption_id: str
+    @property
+    def caption_model(self) -> AsyncModel:
+        return self.models.caption
+
+    @property
+    def classify_model(self) -> AsyncModel:
+        return self.models.classify
+
+    # Metric labels, so per-stage timings can be split by model
+    @property
+    def caption_label(self) -> str:
+        return self.models.caption_name
+
+    @property
+    def classify_label(self) -> str:
+        return self.models.classify_name
+
+    def send(
+        self, payload: bytes, msg_type: picows.WSMsgType = picows.WSMsgType.TEXT
     ) -> None:
-        # Compute perceptual hash of the new frame
-        new_hash = imagehash.phash(scene_frame.as_image())
+        if self.connected:
+            with METRICS.span("send"):
+                self.transport.send(msg_type, payload)
 
-        # Check if the new frame is too similar to any of the last 3 frames
-        for cached_hash in self.hashes:
-            if (cached_hash - new_hash) <= self.similarity_threshold:
-                print(f"Skipping similar frame for {caption_id}")
-                return
+    def open_stream(
+        self, caption_id: str, status: FrameStatus
+    ) -> TextStream | BinaryStream:
+        if self.framing != "binary":
+            return TextStream(self.send, caption_id)
+
+        # Small numeric ids instead of resending the caption UUID with every token
+        self.next_stream_id = self.next_stream_id % 0xFFFF + 1
+        return BinaryStream(
+            partial(self.send, msg_type=picows.WSMsgType.BINARY),
+            self.next_stream_id,
+            caption_id,
+            status,
+            self.coalesce_window,
+        )
+
+    def on_hello(self, message: dict) -> None:
+        if message.get("framing") == "binary":
+            self.framing = "binary"
+            self.coalesce_window = max(0.0, float(message.get("coalesce_ms", 0))) / 1000
+        self.rate_control = bool(message.get("rate_control", False))
+        if message.get("upload") == "raw":
+            self.upload = "raw"
+        self.regions = bool(message.get("regions", False))
+
+        self.send(
+            json.dumps(
+                {
+                    "type": "hello",
+                    "framing": self.framing,
+                    "ready": self.models.state == "ready",
+                    "rate_control": self.rate_control,
+                    "upload": self.upload,
+                    "regions": self.regions,
+                    "formats": [format.name.lower() for format in PixelFormat],
+                    "frame_size": list(IMAGE_SIZE),
+                }
+            ).encode()
+        )
+        self.adapt_rate()
+
+    def adapt_rate(self) -> None:
+        if not self.rate_control:
+            return
+
+        # Superseded frames mean the client outpaces us, similar ones that nothing changed
+        self.rate.observe(
+            self.queue.stats.admitted, self.queue.stats.superseded + self.similar
+        )
+        load = sum(connection.busy for connection in CONNECTIONS) / self.config.workers
+        if (
+            message := self.rate.update(self.speculation.hazard_rate, load)
+        ) is not None:
+            METRICS.increment("rate_updates")
+            self.send(json.dumps(message).encode())
+
+    def report_error(self, caption_id: str, error: Exception) -> None:
+        print(f"Error handling frame {caption_id}: {error}")
+
+        # Binary clients get errors that happen before a stream opens on stream 0
+        if self.framing == "binary":
+            self.send(
+                encode(MessageType.Error, 0, f"{caption_id}|{error}".encode("utf-8")),
+                picows.WSMsgType.BINARY,
+            )
+
+    async def run_in_worker(self, func, *args):
+        return await self.loop.run_in_executor(self.executor, func, *args)
+
+    async def classify(self, scene_frame: Frame) -> FrameStatus:
+        with METRICS.span("classify", model=self.classify_label):
+            if self.batcher is not None:
+                status = await self.batcher.classify(self.classify_model, scene_frame)
+            else:
+                status = await self.classify_model.classify(scene_frame)
+
+        METRICS.increment("classified", model=self.classify_label, status=status.value)
+        return status
+
+    async def caption(
+        self, scene_frame: Frame, cancel: CancelToken
+    ) -> AsyncGenerator[str, None]:
+        async for token in self.caption_model.caption(scene_frame, cancel):
+            yield token
+
+    async def stream_caption(
+        self,
+        inflight: InFlight,
+        status: FrameStatus,
+        tokens: AsyncIterator[str],
+        model: str | None = None,
+    ) -> list[str] | None:
+        model = model or self.caption_label
+        if self.regions and inflight.region is not None:
+            self.send_region(inflight.caption_id, inflight.region)
+        stream = self.stream = self.open_stream(inflight.caption_id, status)
+        first = True
+        truncated = False
+        sent = []
+        try:
+            async for token in tokens:
+                if inflight.cancel.cancelled:
+                    break
+                # A server without a transport (benches) never has its writes paused
+                paused = self.flow is not None and self.flow.paused
+                if paused and not await self.backpressure(stream):
+                    # Give the generation slot back to clients that keep up
+                    truncated = True
+                    inflight.cancel.cancel()
+                    break
+                sent.append(token)
+                if first:
+                    first = False
+                    METRICS.observe(
+                        "first_token",
+                        time.perf_counter() - inflight.received_at,
+                        model=model,
+                    )
+                stream.token(token)
+        except Exception as e:
+            print(f"Caption {inflight.caption_id} failed: {e}")
+            METRICS.increment("captions", model=model, outcome="error")
+            stream.error(str(e))
+            return None
+        finally:
+            self.stream = None
+
+        METRICS.observe(
+            "last_token", time.perf_counter() - inflight.received_at, model=model
+        )
 
-        # Check if the new frame is "very different" (>= different_threshold) from at least one of the last 3
-        significant_difference_found = any(
-            abs(cached_hash - new_hash) >= self.different_threshold
-            for cached_hash in self.hashes
+        # Send end token, marking captions that were cut short
+        if truncated:
+            print(f"Truncating caption {inflight.caption_id} for a slow client")
+            METRICS.increment("captions", model=model, outcome="truncated")
+            stream.end(EndReason.Truncated)
+            return None
+
+        if inflight.cancel.cancelled:
+            METRICS.increment("captions", model=model, outcome="preempted")
+            stream.end(EndReason.Preempted)
+            return None
+
+        METRICS.increment("captions", model=model, outcome="complete")
+        stream.end(EndReason.Complete)
+        return sent
+
+    def send_region(self, caption_id: str, region: Region) -> None:
+        # Sent ahead of the caption, so the client can point the user the right way
+        message = {
+            "type": "region",
+            "caption_id": caption_id,
+            "box": [round(value, 4) for value in region],
+            "direction": region.direction,
+        }
+        self.send(json.dumps(message).encode())
+
+    async def backpressure(self, stream: TextStream | BinaryStream) -> bool:
+        # The client isn't draining its socket; False means drop the caption
+        config = self.config.backpressure
+        if config.policy == "coalesce" and stream.buffered_bytes < config.high_water:
+            # Keep generating, but send what piles up (up to a watermark) as one message
+            if not stream.held:
+                self.flow.count("coalesced")
+            stream.hold()
+            return True
+
+        if config.policy == "pause" and await self.flow.wait():
+            return True
+
+        self.flow.count("truncated")
+        return False
+
+    def pause_writing(self) -> None:
+        self.flow.pause()
+
+    def resume_writing(self) -> None:
+        self.flow.resume()
+        if self.stream is not None:
+            self.stream.release()
+
+    def remember(self, key: int, tokens: list[str] | None) -> None:
+        # Only whole captions are worth replaying
+        if self.cache is not None and tokens is not None:
+            self.cache.store_caption(key, tokens)
+
+    async def replay(self, inflight: InFlight, status: FrameStatus, tokens: list[str]):
+        async def cached() -> AsyncIterator[str]:
+            for token in tokens:
+                yield token
+
+        print(f"Replaying cached caption for {inflight.caption_id}")
+        await self.stream_caption(inflight, status, cached(), model="cache")
+
+    async def speculate(
+        self, scene_frame: Frame, significant: bool, inflight: InFlight
+    ) -> None:
+        # Caption alongside classification so a hazard doesn't wait on the verdict
+        self.speculation.speculated()
+        buffer = TokenBuffer(self.caption(scene_frame, inflight.cancel))
+        try:
+            classification = await self.classify(scene_frame)
+        except Exception:
+            inflight.cancel.cancel()
+            buffer.cancel()
+            raise
+
+        self.speculation.record(classification)
+        if self.cache is not None:
+            self.cache.store_status(inflight.hash, classification)
+        print(f"Classification result for {inflight.caption_id}: {classification}")
+
+        if classification == FrameStatus.Safe and not significant:
+            inflight.cancel.cancel()
+            buffer.cancel()
+            self.speculation.discarded()
+            METRICS.increment("frames_skipped", reason="safe")
+            print(
+                f"Discarding speculative caption for safe frame {inflight.caption_id}"
+            )
+            return
+
+        # Flush what was buffered, then keep streaming as tokens arrive
+        self.speculation.committed()
+        self.remember(
+            inflight.hash,
+            await self.stream_caption(inflight, classification, buffer.drain()),
+        )
+
+    def check_scene(self, scene_frame: Frame) -> SceneChange:
+        with METRICS.span("decode"):
+            image = scene_frame.as_image()
+
+        with METRICS.span("phash"):
+            return self.scene.check(image)
+
+    async def handle_frame(
+        self, scene_frame: Frame, caption_id: str, received_at: float
+    ) -> None:
+        METRICS.observe("queue_wait", time.perf_counter() - received_at)
+
+        # Compare the frame's perceptual hash against the recent history
+        change = await self.run_in_worker(self.check_scene, scene_frame)
+        if change.similar:
+            self.similar += 1
+            METRICS.increment("frames_skipped", reason="similar")
+            print(f"Skipping similar frame for {caption_id}")
+            return
+
+        if change.region is not None:
+            METRICS.increment("changed_regions", direction=change.region.direction)
+
+        self.inflight = InFlight(
+            caption_id, CancelToken(), change.hash, received_at, change.region
         )
+        try:
+            await self.classify_and_caption(scene_frame, change, self.inflight)
+        finally:
+            self.inflight = None
 
-        self.hashes.append(new_hash)
+    async def classify_and_caption(
+        self, scene_frame: Frame, change: SceneChange, inflight: InFlight
+    ) -> None:
+        # Another connection may have seen this scene moments ago
+        key = inflight.hash
+        cached = self.cache.lookup(key) if self.cache is not None else None
+        if cached is not None:
+            wanted = cached.status == FrameStatus.Hazard or change.significant
+            if wanted and cached.tokens is not None:
+                await self.replay(inflight, cached.status, cached.tokens)
+                return
 
-        classification = self.classify_model.classify(scene_frame)
-        print(f"Classification result for {caption_id}: {classification}")
+            # Reuse the verdict; a fresh caption is filed under the cached scene
+            classification = cached.status
+            key = cached.key
+        elif self.speculation.should_speculate(change.significant):
+            await self.speculate(scene_frame, change.significant, inflight)
+            return
+        else:
+            classification = await self.classify(scene_frame)
+            self.speculation.record(classification)
+            if self.cache is not None:
+                self.cache.store_status(key, classification)
+        print(f"Classification result for {inflight.caption_id}: {classification}")
 
         # Decide whether to stream inference
-        if classification == FrameStatus.Safe and not significant_difference_found:
+        if classification == FrameStatus.Safe and not change.significant:
+            METRICS.increment("frames_skipped", reason="safe")
             print(
                 "Skipping frame since classification is safe or significant difference found"
             )
             return
 
         # Stream inference tokens
-        for token in self.caption_model.caption(scene_frame):
-            payload = f"{caption_id}|{token}".encode("utf-8")
-            transport.send(picows.WSMsgType.TEXT, payload)
+        tokens = self.caption(scene_frame, inflight.cancel)
+        self.remember(key, await self.stream_caption(inflight, classification, tokens))
 
-        # Send end token
-        end_payload = f"{caption_id}|<end>".encode("utf-8")
-        transport.send(picows.WSMsgType.TEXT, end_payload)
+    async def check_preemption(self, scene_frame: Frame, inflight: InFlight) -> None:
+        # A newer frame of a different scene makes the running caption stale
+        if not await self.run_in_worker(
+            lambda: self.scene.differs(scene_frame.as_image(), inflight.hash)
+        ):
+            return
+
+        if self.inflight is inflight and not inflight.cancel.cancelled:
+            print(f"Preempting caption {inflight.caption_id} for a newer scene")
+            inflight.cancel.cancel()
+            self.queue.preempt()
+
+    async def process_frames(self) -> None:
+        # Frames queue up (superseding each other) until the models are warm
+        await self.models.ready.wait()
+
+        # Drain the admission queue one frame at a time, keeping inference off the loop
+        while (item := await self.queue.get()) is not None:
+            scene_frame, caption_id, received_at = item
+            self.busy = True
+            try:
+                if self.models.state == "failed":
+                    raise RuntimeError(f"Models failed to load: {self.models.error}")
+                await self.handle_frame(scene_frame, caption_id, received_at)
+            except Exception as e:
+                METRICS.increment("frames_failed")
+                self.report_error(caption_id, e)
+            finally:
+                self.busy = False
+                scene_frame.release()
+                METRICS.observe("frame", time.perf_counter() - received_at)
+                self.adapt_rate()
 
     def on_ws_connected(self, transport: picows.WSTransport) -> None:
+        # Frames and write callbacks can still arrive while a rejected client closes
+        self.flow = WriteFlow(self.config.backpressure, transport.underlying_transport)
+        self.queue = FrameQueue(self.config.queue_size)
+
+        # Turn clients away while warming so they retry against a ready replica
+        if self.config.warmup_policy == "reject" and self.models.state != "ready":
+            METRICS.increment("connections_rejected", reason=self.models.state)
+            self.queue.close()
+            transport.send_close(
+                picows.WSCloseCode.TRY_AGAIN_LATER, b"models are loading"
+            )
+            transport.disconnect()
+            return
+
         print("New client connected")
+        self.transport = transport
+        self.connected = True
+        self.loop = asyncio.get_running_loop()
+        self.worker = self.loop.create_task(self.process_frames())
+        CONNECTIONS.add(self)
+
+    def on_ws_disconnected(self, transport: picows.WSTransport) -> None:
+        # Rejected clients never started a worker, so there is nothing to report
+        if self.worker is None:
+            return
+
+        self.connected = False
+        self.queue.close()
+        CONNECTIONS.discard(self)
+
+        # Nobody is left to read the caption, so stop generating it
+        if self.inflight is not None:
+            self.inflight.cancel.cancel()
+
+        print(
+            f"Client disconnected, frames: {self.queue.stats.as_dict()}, "
+            f"totals: {ADMISSION_TOTALS.as_dict()}"
+        )
+        print(
+            f"Speculation: {self.speculation.stats.as_dict()}, "
+            f"totals: {SPECULATION_TOTALS.as_dict()}"
+        )
+        print(f"Flow: {self.flow.as_dict()}, totals: {FLOW_TOTALS.as_dict()}")
+
+    def stats(self) -> dict:
+        peer = self.transport.underlying_transport.get_extra_info("peername")
+        return {
+            "peer": f"{peer[0]}:{peer[1]}" if peer else None,
+            "framing": self.framing,
+            "flow": self.flow.as_dict(),
+            "frames": self.queue.stats.as_dict(),
+            "rate": self.rate.as_dict() if self.rate_control else None,
+        }
 
     def on_ws_frame(self, transport: picows.WSTransport, frame: picows.WSFrame) -> None:
         if frame.msg_type == picows.WSMsgType.BINARY:
+            # One copy out of the read buffer; the image is then a view into it
+            received_at = time.perf_counter()
             data = frame.get_payload_as_bytes()
-            parts = data.split(b"|", 1)
-            caption_id = parts[0].decode("utf-8")
-            image_bytes = parts[1]
-            scene_frame = Frame(image_bytes)
+            separator = data.find(b"|", 0, 64)
+            if separator == -1:
+                METRICS.increment("frames_dropped", reason="malformed")
+                self.queue.drop()
+                return
+
+            caption_id = data[:separator].decode("utf-8")
+            payload = memoryview(data)[separator + 1 :]
+            if self.upload == "raw":
+                # Pre-resized pixels: the frame wraps them and nothing is decoded
+                try:
+                    layout, pixels = parse_raw(payload)
+                except ValueError as e:
+                    print(f"Dropping raw frame {caption_id}: {e}")
+                    METRICS.increment("frames_dropped", reason="malformed")
+                    self.queue.drop()
+                    return
+                scene_frame = Frame(pixels, layout)
+            else:
+                scene_frame = Frame(payload)
+            METRICS.observe("parse", time.perf_counter() - received_at)
+            METRICS.increment("frames_received")
 
-            # Stream captions on main thread while classification runs in background
-            self.handle_frame(transport, scene_frame, caption_id)
+            # Hand the frame to the connection's worker, superseding any stale one
+            self.queue.put((scene_frame, caption_id, received_at))
+            if self.inflight is not None:
+                self.loop.create_task(self.check_preemption(scene_frame, self.inflight))
+        elif frame.msg_type == picows.WSMsgType.TEXT:
+            if (message := parse_hello(frame.get_payload_as_utf8_text())) is not None:
+                self.on_hello(message)
         elif frame.msg_type == picows.WSMsgType.CLOSE:
             transport.send_close(frame.get_close_code(), frame.get_close_message())
             transport.disconnect()
@@ -86,21 +560,362 @@ class Server(picows.WSListener):
             transport.send_pong(frame.get_payload_as_bytes())
 
 
-async def main():
-    print("Beginning model warmup")
-    caption_model = LlavaModel()
-    caption_model.warmup()
-    classify_model = LlamaVisionModel()
+async def main(config: ServerConfig):
+    # Either load the models here or front a separate inference process
+    if config.inference.socket is not None:
+        models = ModelRegistry(config.caption_model, config.classify_model)
+        client = InferenceClient(config.inference)
+        load = client.connect(models)
+    else:
+        models = local_models(config)
+        load = models.load()
+
+    executor = ThreadPoolExecutor(
+        max_workers=config.workers, thread_name_prefix="frames"
+    )
+    cache = CaptionCache(config.cache) if config.cache.enabled else None
+    batcher = ClassifyBatcher(config.batching) if config.batching.enabled else None
 
     server = await picows.ws_create_server(
-        lambda _: Server(caption_model, classify_model), "0.0.0.0", 2222
+        lambda _: Server(models, executor, config, cache, batcher),
+        config.host,
+        config.port,
+        reuse_port=config.inference.frontends > 1,
     )
     for s in server.sockets:
         print(f"Server started on {s.getsockname()}")
 
+    if config.metrics_port:
+        await serve_metrics(
+            config.metrics_host,
+            config.metrics_port,
+            lambda: {
+                "admission": ADMISSION_TOTALS.as_dict(),
+                "speculation": SPECULATION_TOTALS.as_dict(),
+                "cache": cache.stats() if cache is not None else None,
+                "batching": batcher.as_dict() if batcher is not None else None,
+                "models": models.state,
+                "flow": FLOW_TOTALS.as_dict(),
+                "connections": [connection.stats() for connection in CONNECTIONS],
+            },
+            lambda: models.state,
+            profile=config.profile,
+        )
+        print(f"Metrics on http://{config.metrics_host}:{config.metrics_port}/stats")
+
+    # Bind first and warm up behind the readiness state, so restarts accept clients early
+    print(f"Loading models: {config.caption_model}, {config.classify_model}")
+    await load
     await server.serve_forever()
 
 
-if __name__ == "__main__":
+def run(config: ServerConfig) -> None:
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
-    asyncio.run(main())
+    asyncio.run(main(config))
+
+
+def run_inference(config: ServerConfig) -> None:
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(serve_inference(local_models(config), config))
+
+
+def spawn(config: ServerConfig) -> None:
+    # One model process holding the weights, plus front ends that share the port
+    # and hand it frames through their own shared-memory rings
+    socket = config.inference.socket or os.path.join(
+        tempfile.gettempdir(), f"iris-{config.port}.sock"
+    )
+    config = replace(config, inference=replace(config.inference, socket=socket))
+    frontends = config.inference.frontends
+
+    # Every process gets its own metrics port, the model process after the front ends
+    def metrics_port(index: int) -> int:
+        return config.metrics_port + index if config.metrics_port else 0
+
+    context = multiprocessing.get_context("spawn")
+    processes = [
+        context.Process(
+            target=run_inference,
+            args=(replace(config, metrics_port=metrics_port(frontends)),),
+            name="inference",
+        )
+    ]
+    processes += [
+        context.Process(
+            target=run,
+            args=(replace(config, metrics_port=metrics_port(index)),),
+            name=f"frontend-{index}",
+        )
+        for index in range(frontends)
+    ]
+
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default=ServerConfig.host)
+    parser.add_argument("--port", type=int, default=ServerConfig.port)
+    parser.add_argument(
+        "--caption-model", choices=list(MODELS), default=ServerConfig.caption_model
+    )
+    parser.add_argument(
+        "--classify-model", choices=CLASSIFY_MODELS, default=ServerConfig.classify_model
+    )
+    parser.add_argument(
+        "--warmup-policy",
+        choices=["queue", "reject"],
+        default=ServerConfig.warmup_policy,
+        help="Hold frames or refuse connections until the models are ready",
+    )
+    parser.add_argument(
+        "--compile-cache-dir",
+        default=ServerConfig.compile_cache_dir,
+        help="Persisted torch.compile/autotune cache, reused across restarts",
+    )
+    parser.add_argument(
+        "--min-interval-ms",
+        type=int,
+        default=int(RateConfig.min_interval * 1000),
+        help="Fastest frame interval recommended to rate-controlled clients",
+    )
+    parser.add_argument(
+        "--max-interval-ms",
+        type=int,
+        default=int(RateConfig.max_interval * 1000),
+        help="Slowest frame interval recommended to rate-controlled clients",
+    )
+    parser.add_argument(
+        "--backpressure",
+        choices=["pause", "coalesce", "drop"],
+        default=BackpressureConfig.policy,
+        help="What captions do for clients that stop draining their socket",
+    )
+    parser.add_argument(
+        "--write-high-water-kb",
+        type=int,
+        default=BackpressureConfig.high_water // 1024,
+        help="Buffered bytes per connection at which backpressure starts",
+    )
+    parser.add_argument(
+        "--write-low-water-kb",
+        type=int,
+        default=BackpressureConfig.low_water // 1024,
+    )
+    parser.add_argument(
+        "--pause-timeout",
+        type=float,
+        default=BackpressureConfig.pause_timeout,
+        help="Seconds a paused caption waits before it is truncated",
+    )
+    parser.add_argument(
+        "--frontends",
+        type=int,
+        default=InferenceConfig.frontends,
+        help="Front-end processes in front of one separate model process",
+    )
+    parser.add_argument(
+        "--inference-socket",
+        default=InferenceConfig.socket,
+        help="Use the model process listening on this Unix socket",
+    )
+    parser.add_argument(
+        "--inference-only",
+        action="store_true",
+        help="Run only the model process, serving --inference-socket",
+    )
+    parser.add_argument(
+        "--ring-slots",
+        type=int,
+        default=InferenceConfig.ring_slots,
+        help="Frames each front end can have in flight to the model process",
+    )
+    parser.add_argument(
+        "--ring-slot-kb",
+        type=int,
+        default=InferenceConfig.ring_slot_bytes // 1024,
+        help="Largest frame the shared-memory ring accepts",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=ServerConfig.workers,
+        help="Frame hashing threads shared by all connections",
+    )
+    parser.add_argument(
+        "--queue-size",
+        type=int,
+        default=ServerConfig.queue_size,
+        help="Pending frames per connection before the oldest is superseded",
+    )
+    parser.add_argument(
+        "--device",
+        default=ServerConfig.device,
+        help='Device for local models, e.g. "cuda:0" or "cpu"',
+    )
+    parser.add_argument(
+        "--quantize",
+        action="store_true",
+        help="Quantize local model weights to int8 (CPU only)",
+    )
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=ServerConfig.threads,
+        help="Intra-op threads for CPU inference",
+    )
+    parser.add_argument(
+        "--metrics-port",
+        type=int,
+        default=ServerConfig.metrics_port,
+        help="Local /metrics and /stats endpoint, 0 to disable",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Expose a sampling profiler at /profile on the metrics endpoint",
+    )
+    parser.add_argument("--history", type=int, default=SceneConfig.history)
+    parser.add_argument(
+        "--similar-threshold", type=int, default=SceneConfig.similar_threshold
+    )
+    parser.add_argument(
+        "--different-threshold", type=int, default=SceneConfig.different_threshold
+    )
+    parser.add_argument(
+        "--dhash-threshold",
+        type=int,
+        default=SceneConfig.dhash_threshold,
+        help="Skip frames this close to a recent dHash before computing the pHash",
+    )
+    parser.add_argument(
+        "--region-tiles",
+        type=int,
+        default=SceneConfig.tiles,
+        help="Tiles per side of the change map",
+    )
+    parser.add_argument(
+        "--tile-threshold",
+        type=float,
+        default=SceneConfig.tile_threshold,
+        help="Mean luma difference at which a tile counts as changed",
+    )
+    parser.add_argument(
+        "--max-region-area",
+        type=float,
+        default=SceneConfig.max_region_area,
+        help="Largest share of the frame reported as a region, not a scene change",
+    )
+    parser.add_argument(
+        "--speculation",
+        choices=["auto", "always", "never"],
+        default=SpeculationConfig.mode,
+        help="Start captioning before the classification verdict arrives",
+    )
+    parser.add_argument(
+        "--speculation-hazard-rate",
+        type=float,
+        default=SpeculationConfig.hazard_rate_threshold,
+        help="Recent hazard rate above which auto mode speculates",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="Disable the cross-connection caption cache",
+    )
+    parser.add_argument(
+        "--cache-radius",
+        type=int,
+        default=CacheConfig.radius,
+        help="pHash distance within which cached captions are reused",
+    )
+    parser.add_argument("--cache-ttl", type=float, default=CacheConfig.ttl)
+    parser.add_argument(
+        "--cache-max-mb",
+        type=float,
+        default=CacheConfig.max_bytes / 2**20,
+        help="Memory cap for cached captions",
+    )
+    parser.add_argument(
+        "--no-classify-batching",
+        action="store_true",
+        help="Classify each frame on its own instead of batching across connections",
+    )
+    parser.add_argument(
+        "--classify-batch-size", type=int, default=BatchConfig.max_batch_size
+    )
+    parser.add_argument(
+        "--classify-wait-ms",
+        type=float,
+        default=BatchConfig.max_wait * 1000,
+        help="Longest a classify batch is held open to fill",
+    )
+    args = parser.parse_args()
+
+    config = ServerConfig(
+        host=args.host,
+        port=args.port,
+        caption_model=args.caption_model,
+        classify_model=args.classify_model,
+        warmup_policy=args.warmup_policy,
+        compile_cache_dir=args.compile_cache_dir or None,
+        workers=args.workers,
+        queue_size=args.queue_size,
+        device=args.device,
+        quantize=args.quantize,
+        threads=args.threads,
+        metrics_port=args.metrics_port,
+        profile=args.profile,
+        scene=SceneConfig(
+            history=args.history,
+            similar_threshold=args.similar_threshold,
+            different_threshold=args.different_threshold,
+            dhash_threshold=args.dhash_threshold,
+            tiles=args.region_tiles,
+            tile_threshold=args.tile_threshold,
+            max_region_area=args.max_region_area,
+        ),
+        speculation=SpeculationConfig(
+            mode=args.speculation,
+            hazard_rate_threshold=args.speculation_hazard_rate,
+        ),
+        cache=CacheConfig(
+            enabled=not args.no_cache,
+            radius=args.cache_radius,
+            ttl=args.cache_ttl,
+            max_bytes=int(args.cache_max_mb * 2**20),
+        ),
+        rate=RateConfig(
+            min_interval=args.min_interval_ms / 1000,
+            max_interval=args.max_interval_ms / 1000,
+        ),
+        backpressure=BackpressureConfig(
+            policy=args.backpressure,
+            high_water=args.write_high_water_kb * 1024,
+            low_water=args.write_low_water_kb * 1024,
+            pause_timeout=args.pause_timeout,
+        ),
+        batching=BatchConfig(
+            enabled=not args.no_classify_batching,
+            max_batch_size=args.classify_batch_size,
+            max_wait=args.classify_wait_ms / 1000,
+        ),
+        inference=InferenceConfig(
+            socket=args.inference_socket,
+            frontends=args.frontends,
+            ring_slots=args.ring_slots,
+            ring_slot_bytes=args.ring_slot_kb * 1024,
+        ),
+    )
+
+    if args.inference_only:
+        if config.inference.socket is None:
+            parser.error("--inference-only needs --inference-socket")
+        run_inference(config)
+    elif config.inference.frontends > 1:
+        spawn(config)
+    else:
+        run(config)
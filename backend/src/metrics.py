@@ -0,0 +1,198 @@
+import asyncio
+import bisect
+import collections
+import sys
+import threading
+import time
+
+from aiohttp import web
+from collections.abc import Callable
+from contextlib import contextmanager
+
+# Upper bounds in seconds, x1.41 apart from 100us to about a minute
+BUCKETS = [0.0001 * 2 ** (i / 2) for i in range(40)]
+
+
+class Histogram:
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+
+    def quantile(self, q: float) -> float | None:
+        if not self.count:
+            return None
+
+        # Interpolate within the bucket holding the q-th observation
+        rank = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            if seen + count >= rank and count:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+
+        return BUCKETS[-1]
+
+    def as_dict(self) -> dict:
+        def ms(value: float | None) -> float | None:
+            return None if value is None else round(value * 1000, 3)
+
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total / self.count if self.count else None),
+            "p50_ms": ms(self.quantile(0.5)),
+            "p95_ms": ms(self.quantile(0.95)),
+            "p99_ms": ms(self.quantile(0.99)),
+        }
+
+
+def _key(name: str, labels: dict) -> tuple:
+    return (name, tuple(sorted(labels.items())))
+
+
+def _label_text(labels: tuple) -> str:
+    return ",".join(f'{key}="{value}"' for key, value in labels)
+
+
+class Metrics:
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.counters = collections.Counter()
+
+    def observe(self, name: str, seconds: float, **labels) -> None:
+        key = _key(name, labels)
+        with self.lock:
+            if key not in self.histograms:
+                self.histograms[key] = Histogram()
+            self.histograms[key].observe(seconds)
+
+    def increment(self, name: str, amount: int = 1, **labels) -> None:
+        with self.lock:
+            self.counters[_key(name, labels)] += amount
+
+    @contextmanager
+    def span(self, name: str, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "stages": {
+                    name
+                    + (f"{{{_label_text(labels)}}}" if labels else ""): (
+                        histogram.as_dict()
+                    )
+                    for (name, labels), histogram in sorted(self.histograms.items())
+                },
+                "counters": {
+                    name + (f"{{{_label_text(labels)}}}" if labels else ""): count
+                    for (name, labels), count in sorted(self.counters.items())
+                },
+            }
+
+    def prometheus(self) -> str:
+        # Text exposition format, so the endpoint can be scraped as-is
+        lines = []
+        with self.lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                metric = f"iris_{name}_seconds"
+                cumulative = 0
+                for bound, count in zip(BUCKETS + [float("inf")], histogram.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                    bucket_labels = _label_text(labels + (("le", le),))
+                    lines.append(f"{metric}_bucket{{{bucket_labels}}} {cumulative}")
+
+                suffix = f"{{{_label_text(labels)}}}" if labels else ""
+                lines.append(f"{metric}_sum{suffix} {histogram.total}")
+                lines.append(f"{metric}_count{suffix} {histogram.count}")
+
+            for (name, labels), count in sorted(self.counters.items()):
+                suffix = f"{{{_label_text(labels)}}}" if labels else ""
+                lines.append(f"iris_{name}_total{suffix} {count}")
+
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry shared by every connection
+METRICS = Metrics()
+
+
+def sample_stacks(seconds: float, interval: float = 0.005) -> dict[str, int]:
+    # Poor man's sampling profiler: collapsed stacks of every other thread, flamegraph-ready
+    stacks = collections.Counter()
+    names = {}
+    current = threading.get_ident()
+
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names.update((thread.ident, thread.name) for thread in threading.enumerate())
+        for ident, frame in sys._current_frames().items():
+            if ident == current:
+                continue
+
+            calls = []
+            while frame is not None:
+                code = frame.f_code
+                calls.append(f"{code.co_name} ({code.co_filename}:{frame.f_lineno})")
+                frame = frame.f_back
+
+            stacks[";".join([names.get(ident, str(ident))] + calls[::-1])] += 1
+        time.sleep(interval)
+
+    return dict(stacks)
+
+
+async def serve_metrics(
+    host: str,
+    port: int,
+    stats: Callable[[], dict],
+    state: Callable[[], str] = lambda: "ready",
+    profile: bool = False,
+) -> web.AppRunner:
+    # Local-only HTTP endpoint next to the websocket server
+    async def metrics(request: web.Request) -> web.Response:
+        return web.Response(text=METRICS.prometheus(), content_type="text/plain")
+
+    async def snapshot(request: web.Request) -> web.Response:
+        return web.json_response({**METRICS.snapshot(), **stats()})
+
+    async def ready(request: web.Request) -> web.Response:
+        # Readiness probe: 503 while models are loading so balancers hold off
+        current = state()
+        return web.json_response(
+            {"state": current}, status=200 if current == "ready" else 503
+        )
+
+    async def sample(request: web.Request) -> web.Response:
+        seconds = min(float(request.query.get("seconds", 5)), 60.0)
+        interval = float(request.query.get("interval_ms", 5)) / 1000
+        stacks = await asyncio.get_running_loop().run_in_executor(
+            None, sample_stacks, seconds, interval
+        )
+        lines = [f"{stack} {count}" for stack, count in sorted(stacks.items())]
+        return web.Response(text="\n".join(lines) + "\n", content_type="text/plain")
+
+    app = web.Application()
+    app.router.add_get("/metrics", metrics)
+    app.router.add_get("/stats", snapshot)
+    app.router.add_get("/ready", ready)
+    if profile:
+        app.router.add_get("/profile", sample)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
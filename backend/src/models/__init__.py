@@ -1,13 +1,34 @@
-from .base import DeviceModel, Frame, FrameStatus, VendorModel
-from .blip import BlipModel
-from .llava import LlavaModel
-from .groq import LlamaVisionModel
+import importlib
+
+from .base import (
+    CancelToken,
+    Classification,
+    DeviceModel,
+    Frame,
+    FrameStatus,
+    VendorModel,
+)
+from .registry import MODELS, ModelRegistry
+
+# Concrete models pull in torch/transformers, so they are only imported on first use
+LAZY_MODELS = {class_name: module for module, class_name, _ in MODELS.values()}
+
+
+def __getattr__(name: str):
+    if name in LAZY_MODELS:
+        return getattr(importlib.import_module(LAZY_MODELS[name], __name__), name)
+
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 __all__ = [
     "Frame",
     "FrameStatus",
+    "Classification",
+    "CancelToken",
     "DeviceModel",
     "VendorModel",
+    "ModelRegistry",
     "BlipModel",
     "LlavaModel",
     "LlamaVisionModel",
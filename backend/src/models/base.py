@@ -1,37 +1,111 @@
+import asyncio
 import base64
-import io
+import threading
 
 from abc import ABC, abstractmethod
-from collections.abc import Generator, AsyncGenerator
+from collections.abc import AsyncGenerator, AsyncIterator, Callable, Generator
 from enum import Enum
+from typing import Any, NamedTuple
 from PIL import Image
+from .decode import RawLayout, decode_image, encode_jpeg, raw_image
+from .streaming import GenerationWorker
+
+# Every model consumes frames at this size
+IMAGE_SIZE = (128, 128)
 
 
 class Frame:
-    def __init__(self, data: bytes) -> None:
+    def __init__(
+        self, data: bytes | memoryview, layout: RawLayout | None = None
+    ) -> None:
+        # Encoded image bytes, or raw pixels described by the layout
         self.data = data
+        self.layout = layout
         self.image = None
         self.encoded = None
 
+        # Model-specific tensors (pixel values, image embeddings) derived from this frame
+        self.features = {}
+
+        # Resources held for the frame elsewhere (ring slots), let go on release
+        self.releases = []
+
     def as_image(self) -> Image.Image:
         if not self.image:
-            self.image = (
-                Image.open(io.BytesIO(self.data)).convert("RGB").resize((128, 128))
-            )
+            if self.layout is not None:
+                self.image = raw_image(self.data, self.layout, IMAGE_SIZE)
+            else:
+                self.image = decode_image(self.data, IMAGE_SIZE)
 
         return self.image
 
     def as_encoded(self) -> str:
-        self.encoded = self.encoded or base64.b64encode(self.data).decode("utf-8")
+        if self.encoded is None:
+            data = self.data if self.layout is None else encode_jpeg(self.as_image())
+            self.encoded = base64.b64encode(data).decode("utf-8")
+
         return self.encoded
 
+    def cached(self, key, compute: Callable[[], Any]) -> Any:
+        if key not in self.features:
+            self.features[key] = compute()
+
+        return self.features[key]
+
+    def on_release(self, callback: Callable[[], None]) -> None:
+        self.releases.append(callback)
+
+    def release(self) -> None:
+        # Free model tensors and anything held for the frame once it has been handled
+        self.features.clear()
+        for callback in self.releases:
+            callback()
+        self.releases.clear()
+
+
+class CancelToken:
+    # Shared by the server and a running caption, which checks it at token boundaries
+    def __init__(self) -> None:
+        self.event = threading.Event()
+
+    def cancel(self) -> None:
+        self.event.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self.event.is_set()
+
 
 class FrameStatus(Enum):
     Hazard = "hazard"
     Safe = "safe"
 
 
+class Classification(NamedTuple):
+    status: FrameStatus
+    confidence: float
+
+
+class AsyncModel(ABC):
+    # What the server awaits for every model: verdicts as coroutines, captions as
+    # async token streams. Vendor clients implement it directly; device models are
+    # wrapped by a DeviceRunner from the registry
+    @abstractmethod
+    async def classify(self, frame: Frame) -> FrameStatus:
+        pass
+
+    async def classify_batch(self, frames: list[Frame]) -> list[FrameStatus]:
+        return list(await asyncio.gather(*(self.classify(frame) for frame in frames)))
+
+    @abstractmethod
+    def caption(
+        self, frame: Frame, cancel: CancelToken | None = None
+    ) -> AsyncIterator[str]:
+        pass
+
+
 class DeviceModel(ABC):
+    # Blocking implementations, only ever called from the model's own threads
     @abstractmethod
     def warmup(self) -> None:
         pass
@@ -41,15 +115,52 @@ class DeviceModel(ABC):
         pass
 
     @abstractmethod
-    def caption(self, frame: Frame) -> Generator[str, None, None]:
+    def caption(
+        self, frame: Frame, cancel: CancelToken | None = None
+    ) -> Generator[str, None, None]:
         pass
 
+    def classify_batch(self, frames: list[Frame]) -> list[FrameStatus]:
+        # Models with a batched forward pass override this; the rest go frame by frame
+        return [self.classify(frame) for frame in frames]
 
-class VendorModel(ABC):
+    @property
+    def worker(self) -> GenerationWorker:
+        # The model's one persistent thread, shared by its async runner and blocking
+        # callers, so generation on it never overlaps
+        if (worker := self.__dict__.get("_worker")) is None:
+            worker = self._worker = GenerationWorker(f"{type(self).__name__}-worker")
+        return worker
+
+    def stream_caption(
+        self, frame: Frame, cancel: CancelToken | None, worker: GenerationWorker
+    ) -> AsyncIterator[str]:
+        # Runs caption() on the model's worker; models with their own decode loop
+        # override this to hand tokens straight to the event loop
+        def produce(emit: Callable[[str], None]) -> None:
+            for token in self.caption(frame, cancel):
+                emit(token)
+
+        return worker.stream(produce)
+
+    def encode_image(self, frame: Frame) -> Any:
+        # Every entry point shares one vision pass per frame through the frame's cache
+        return frame.cached(
+            (self.model_id, "image_features"), lambda: self._encode_image(frame)
+        )
+
+    def _encode_image(self, frame: Frame) -> Any:
+        raise NotImplementedError()
+
+
+class VendorModel(AsyncModel):
+    # Remote APIs, natively async
     @abstractmethod
-    def classify(self, frame: Frame) -> FrameStatus:
+    async def classify(self, frame: Frame) -> FrameStatus:
         pass
 
     @abstractmethod
-    def caption(self, frame: Frame) -> AsyncGenerator[str, None]:
+    def caption(
+        self, frame: Frame, cancel: CancelToken | None = None
+    ) -> AsyncGenerator[str, None]:
         pass
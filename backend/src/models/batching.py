@@ -0,0 +1,232 @@
+import asyncio
+import queue
+import threading
+import time
+
+from abc import ABC, abstractmethod
+from collections import deque
+from collections.abc import AsyncIterator, Iterator
+from .base import CancelToken
+from .streaming import TokenStream
+
+
+class Sequence:
+    def __init__(
+        self,
+        request,
+        max_new_tokens: int,
+        min_new_tokens: int,
+        cancel: CancelToken | None = None,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ) -> None:
+        self.request = request
+        self.cancel = cancel
+        self.max_new_tokens = max_new_tokens
+        self.min_new_tokens = min_new_tokens
+
+        # Decoder-owned state (KV cache, position, ...) while the sequence is live
+        self.state = None
+        self.token_ids = []
+        self.text = ""
+        self.printed = 0
+
+        self.finished = False
+        self.error = None
+
+        # Async consumers get tokens pushed onto their loop; sync ones block on a queue
+        self.tokens = TokenStream(loop) if loop is not None else queue.Queue()
+
+        self.submitted_at = time.perf_counter()
+        self.first_token_at = None
+
+    @property
+    def cancelled(self) -> bool:
+        return self.cancel is not None and self.cancel.cancelled
+
+    def __iter__(self) -> Iterator[str]:
+        while (token := self.tokens.get()) is not None:
+            yield token
+
+        if self.error is not None:
+            raise self.error
+
+    async def __aiter__(self) -> AsyncIterator[str]:
+        async for token in self.tokens:
+            yield token
+
+        if self.error is not None:
+            raise self.error
+
+
+class BatchDecoder(ABC):
+    eos_token_ids: set[int]
+
+    @abstractmethod
+    def prefill(self, sequence: Sequence) -> int:
+        pass
+
+    @abstractmethod
+    def decode(self, sequences: list[Sequence]) -> list[int]:
+        pass
+
+    @abstractmethod
+    def detokenize(self, token_ids: list[int]) -> str:
+        pass
+
+    def release(self, sequence: Sequence) -> None:
+        sequence.state = None
+
+
+class EngineStats:
+    def __init__(self) -> None:
+        self.sequences = 0
+        self.steps = 0
+        self.tokens = 0
+        self.batched_tokens = 0
+        self.cancelled = 0
+
+    def as_dict(self) -> dict[str, float]:
+        return {
+            "sequences": self.sequences,
+            "steps": self.steps,
+            "tokens": self.tokens,
+            "cancelled": self.cancelled,
+            "mean_batch_size": self.batched_tokens / self.steps if self.steps else 0.0,
+        }
+
+
+class CaptionEngine:
+    def __init__(
+        self,
+        decoder: BatchDecoder,
+        max_batch_size: int = 8,
+        max_new_tokens: int = 20,
+        min_new_tokens: int = 5,
+    ) -> None:
+        self.decoder = decoder
+        self.max_batch_size = max_batch_size
+        self.max_new_tokens = max_new_tokens
+        self.min_new_tokens = min_new_tokens
+
+        self.pending = deque()
+        self.active = []
+        self.condition = threading.Condition()
+        self.stats = EngineStats()
+
+        self.thread = threading.Thread(
+            target=self._run, name="caption-engine", daemon=True
+        )
+        self.thread.start()
+
+    def submit(
+        self,
+        request,
+        cancel: CancelToken | None = None,
+        loop: asyncio.AbstractEventLoop | None = None,
+    ) -> Sequence:
+        # With a loop, the sequence is iterated with async for instead of blocking
+        sequence = Sequence(
+            request, self.max_new_tokens, self.min_new_tokens, cancel, loop
+        )
+
+        with self.condition:
+            self.pending.append(sequence)
+            self.condition.notify()
+
+        return sequence
+
+    def _emit(self, sequence: Sequence, token_id: int) -> None:
+        if sequence.first_token_at is None:
+            sequence.first_token_at = time.perf_counter()
+
+        self.stats.tokens += 1
+        if token_id in self.decoder.eos_token_ids:
+            self._finish(sequence)
+            return
+
+        sequence.token_ids.append(token_id)
+        sequence.text = self.decoder.detokenize(sequence.token_ids)
+
+        # Only release whole words, like TextIteratorStreamer, so clients can join on spaces
+        if not sequence.text.endswith("\ufffd"):
+            end = sequence.text.rfind(" ") + 1
+            if end > sequence.printed:
+                sequence.tokens.put(sequence.text[sequence.printed : end])
+                sequence.printed = end
+
+        if len(sequence.token_ids) >= sequence.max_new_tokens:
+            self._finish(sequence)
+
+    def _finish(self, sequence: Sequence, error: Exception | None = None) -> None:
+        if sequence.finished:
+            return
+
+        sequence.finished = True
+        sequence.error = error
+
+        remainder = sequence.text[sequence.printed :]
+        if remainder and error is None and not sequence.cancelled:
+            sequence.tokens.put(remainder)
+            sequence.printed = len(sequence.text)
+
+        sequence.tokens.put(None)
+        self.decoder.release(sequence)
+
+    def _admit(self) -> None:
+        # New sequences join the running batch at token boundaries
+        while self.pending and len(self.active) < self.max_batch_size:
+            with self.condition:
+                sequence = self.pending.popleft()
+
+            if sequence.cancelled:
+                self.stats.cancelled += 1
+                self._finish(sequence)
+                continue
+
+            self.stats.sequences += 1
+            try:
+                self._emit(sequence, self.decoder.prefill(sequence))
+            except Exception as e:
+                self._finish(sequence, e)
+                continue
+
+            if not sequence.finished:
+                self.active.append(sequence)
+
+    def _evict(self) -> None:
+        # Stopping criterion: cancelled sequences leave before the next decode step
+        for sequence in self.active:
+            if sequence.cancelled:
+                self.stats.cancelled += 1
+                self._finish(sequence)
+
+        self.active = [sequence for sequence in self.active if not sequence.finished]
+
+    def _step(self) -> None:
+        try:
+            token_ids = self.decoder.decode(self.active)
+        except Exception as e:
+            for sequence in self.active:
+                self._finish(sequence, e)
+            self.active = []
+            return
+
+        self.stats.steps += 1
+        self.stats.batched_tokens += len(self.active)
+
+        for sequence, token_id in zip(self.active, token_ids):
+            self._emit(sequence, token_id)
+
+        # Finished sequences leave the batch, freeing their slot
+        self.active = [sequence for sequence in self.active if not sequence.finished]
+
+    def _run(self) -> None:
+        while True:
+            with self.condition:
+                while not self.pending and not self.active:
+                    self.condition.wait()
+
+            self._evict()
+            self._admit()
+            if self.active:
+                self._step()
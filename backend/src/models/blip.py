@@ -1,43 +1,74 @@
 import io
 import torch
-import threading
+import transformers
 
 from PIL import Image
-from typing import AsyncGenerator
+from typing import AsyncIterator, Callable, Generator
 from transformers import (
     BlipForConditionalGeneration,
     BlipProcessor,
-    TextIteratorStreamer,
+    StoppingCriteria,
+    StoppingCriteriaList,
+    TextStreamer,
 )
-from .base import DeviceModel, Frame, FrameStatus
+from .base import CancelToken, DeviceModel, Frame, FrameStatus
+from .device import DeviceBackend
+from .streaming import GenerationWorker
+
+transformers.logging.set_verbosity_error()
+
+
+class CancelCriteria(StoppingCriteria):
+    # Lets the server, or a caller that stopped reading, end generate() between tokens
+    def __init__(self, *cancels: CancelToken) -> None:
+        self.cancels = cancels
+
+    def __call__(
+        self, input_ids: torch.LongTensor, scores: torch.FloatTensor, **kwargs
+    ) -> torch.BoolTensor:
+        return torch.full(
+            (input_ids.shape[0],),
+            any(cancel.cancelled for cancel in self.cancels),
+            dtype=torch.bool,
+            device=input_ids.device,
+        )
+
+
+class CallbackStreamer(TextStreamer):
+    # Hands each completed word to a callback on the generating thread
+    def __init__(self, tokenizer, on_text: Callable[[str], None]) -> None:
+        super().__init__(tokenizer, skip_special_tokens=True)
+        self.on_text = on_text
+
+    def on_finalized_text(self, text: str, stream_end: bool = False) -> None:
+        if text:
+            self.on_text(text)
 
 
 class BlipModel(DeviceModel):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        device: str = "cuda:0",
+        quantize: bool = False,
+        threads: int | None = None,
+        cache_dir: str | None = None,
+    ) -> None:
         self.model_id = "Salesforce/blip-image-captioning-base"
-        self.device = torch.device("cuda:0")
-
-        # Enable Tensor Cores and cuDNN optimizations
-        torch.backends.cuda.matmul.allow_tf32 = True
-        torch.backends.cudnn.allow_tf32 = True
-        torch.set_float32_matmul_precision("medium")
-        torch.backends.cudnn.benchmark = True
+        self.backend = DeviceBackend(
+            device, quantize=quantize, threads=threads, cache_dir=cache_dir
+        )
+        self.device = self.backend.device
+        self.dtype = self.backend.dtype
 
         # Initialize BLIP model and processor
         self.model = BlipForConditionalGeneration.from_pretrained(
             self.model_id,
-            torch_dtype=torch.float16,
-        ).to(self.device)
+            torch_dtype=self.dtype,
+        )
         self.processor = BlipProcessor.from_pretrained(self.model_id)
 
-        # Put model in eval/compiled mode
-        self.model.eval()
-        self.model = torch.compile(
-            self.model,
-            fullgraph=True,
-            dynamic=True,
-            mode="max-autotune",
-        )
+        # Move, quantize and compile the model for the configured device
+        self.model = self.backend.prepare(self.model)
 
         # Load model prompts from files
         with open("src/prompts/classify.txt", "r") as f:
@@ -53,7 +84,7 @@ class BlipModel(DeviceModel):
             return_tensors="pt",
         )
 
-        return inputs.to(self.device, dtype=torch.float16, non_blocking=True)
+        return inputs.to(self.device, dtype=self.dtype, non_blocking=True)
 
     @torch.inference_mode()
     def warmup(self) -> None:
@@ -66,7 +97,7 @@ class BlipModel(DeviceModel):
         frame = Frame(buffer.getvalue())
         inputs = self._process_input(frame)
 
-        for _ in range(3):
+        for _ in range(self.backend.warmup_iterations):
             _ = self.model.generate(
                 **inputs,
                 max_new_tokens=10,
@@ -75,19 +106,20 @@ class BlipModel(DeviceModel):
                 use_cache=True,
             )
 
-        torch.cuda.synchronize()
+        self.backend.synchronize()
+        self.backend.save_compiled()
 
-    @torch.inference_mode()
-    async def classify(self, _: Frame) -> FrameStatus:
+    def classify(self, _: Frame) -> FrameStatus:
         raise NotImplementedError()
 
     @torch.inference_mode()
-    async def caption(self, frame: Frame) -> AsyncGenerator[str, None]:
-        streamer = TextIteratorStreamer(
-            tokenizer=self.processor.tokenizer,
-            skip_special_tokens=True,
-        )
-
+    def generate(
+        self,
+        frame: Frame,
+        cancel: CancelToken | None,
+        on_text: Callable[[str], None],
+        stop: CancelToken | None = None,
+    ) -> None:
         # Prepare generation config (limit to 25 tokens)
         generation_config = dict(
             max_new_tokens=25,
@@ -96,20 +128,33 @@ class BlipModel(DeviceModel):
             min_length=5,
             length_penalty=1.0,
             use_cache=True,
-            streamer=streamer,
+            streamer=CallbackStreamer(self.processor.tokenizer, on_text),
         )
+        if cancels := [token for token in (cancel, stop) if token is not None]:
+            generation_config["stopping_criteria"] = StoppingCriteriaList(
+                [CancelCriteria(*cancels)]
+            )
 
         inputs = self._process_input(frame, text=self.caption_prompt)
-
-        # Generate the model response in a separate thread
-        def generate():
-            self.model.generate(**inputs, **generation_config)
-
-        generator = threading.Thread(target=generate)
-        generator.start()
-
-        # Stream tokens in the current thread
-        for token_text in streamer:
-            yield token_text
-
-        generator.join()
+        self.model.generate(**inputs, **generation_config)
+
+    def caption(
+        self, frame: Frame, cancel: CancelToken | None = None
+    ) -> Generator[str, None, None]:
+        # Blocking callers get each word as it is decoded on the model's worker. A
+        # caller that stops reading ends generation without touching its own token
+        stop = CancelToken()
+        words = self.worker.iterate(
+            lambda on_text: self.generate(frame, cancel, on_text, stop)
+        )
+        try:
+            yield from words
+        except GeneratorExit:
+            stop.cancel()
+            raise
+
+    def stream_caption(
+        self, frame: Frame, cancel: CancelToken | None, worker: GenerationWorker
+    ) -> AsyncIterator[str]:
+        # Generate on the model's worker, each word going to the loop as it is decoded
+        return worker.stream(self.generate, frame, cancel)
@@ -0,0 +1,133 @@
+import cv2
+import io
+import numpy as np
+import struct
+
+from enum import IntEnum
+from PIL import Image
+from typing import NamedTuple
+
+# libjpeg can decode directly at 1/2, 1/4 or 1/8 scale by skipping DCT coefficients
+REDUCED_DECODE_FLAGS = (
+    (8, cv2.IMREAD_REDUCED_COLOR_8),
+    (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2),
+)
+
+# Raw uploads start with the pixel format, width and height, then the pixels
+RAW_HEADER = struct.Struct("!BHH")
+
+
+class PixelFormat(IntEnum):
+    RGB = 1
+
+    # Planar I420: full-size Y, then quarter-size U and V
+    YUV420 = 2
+
+
+class RawLayout(NamedTuple):
+    format: PixelFormat
+    width: int
+    height: int
+
+    @property
+    def length(self) -> int:
+        pixels = self.width * self.height
+        return pixels * 3 if self.format == PixelFormat.RGB else pixels * 3 // 2
+
+
+# Start-of-frame markers; 0xC4, 0xC8 and 0xCC share the range but are not SOF
+SOF_MARKERS = {0xC0 + n for n in range(16)} - {0xC4, 0xC8, 0xCC}
+
+
+def jpeg_size(data: bytes | memoryview) -> tuple[int, int] | None:
+    # Walk the marker segments up to the frame header without decoding anything
+    view = memoryview(data)
+    if view[:2] != b"\xff\xd8":
+        return None
+
+    i = 2
+    while i + 9 <= len(view):
+        if view[i] != 0xFF:
+            return None
+
+        marker = view[i + 1]
+        if marker == 0xFF:
+            i += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            i += 2
+            continue
+
+        if marker in SOF_MARKERS:
+            height = int.from_bytes(view[i + 5 : i + 7], "big")
+            width = int.from_bytes(view[i + 7 : i + 9], "big")
+            return width, height
+
+        i += 2 + int.from_bytes(view[i + 2 : i + 4], "big")
+
+    return None
+
+
+def decode_image(data: bytes | memoryview, size: tuple[int, int]) -> Image.Image:
+    # Pick the coarsest DCT scale that still covers the target size
+    if (dimensions := jpeg_size(data)) is not None:
+        flag = cv2.IMREAD_COLOR
+        for scale, reduced_flag in REDUCED_DECODE_FLAGS:
+            if min(dimensions) // scale >= min(size):
+                flag = reduced_flag
+                break
+
+        # np.frombuffer wraps the payload in place, so no copy is made before decode
+        pixels = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), flag)
+        if pixels is not None:
+            pixels = cv2.resize(pixels, size, interpolation=cv2.INTER_AREA)
+            return Image.fromarray(cv2.cvtColor(pixels, cv2.COLOR_BGR2RGB))
+
+    # Anything else (PNG warmup frames, unusual JPEGs) takes the full decode path
+    return Image.open(io.BytesIO(data)).convert("RGB").resize(size)
+
+
+def parse_raw(data: memoryview) -> tuple[RawLayout, memoryview]:
+    if len(data) < RAW_HEADER.size:
+        raise ValueError("Raw frame is missing its header")
+
+    format, width, height = RAW_HEADER.unpack_from(data)
+    try:
+        layout = RawLayout(PixelFormat(format), width, height)
+    except ValueError:
+        raise ValueError(f"Unknown pixel format {format}") from None
+    if layout.format == PixelFormat.YUV420 and (width % 2 or height % 2):
+        raise ValueError("YUV420 frames need even dimensions")
+
+    pixels = data[RAW_HEADER.size :]
+    if len(pixels) != layout.length:
+        raise ValueError(f"Expected {layout.length} pixel bytes, got {len(pixels)}")
+    return layout, pixels
+
+
+def raw_image(
+    data: bytes | memoryview, layout: RawLayout, size: tuple[int, int]
+) -> Image.Image:
+    # Pre-resized RGB is wrapped in place; anything else is one conversion or resize
+    if layout.format == PixelFormat.RGB and (layout.width, layout.height) == size:
+        return Image.frombuffer("RGB", size, data, "raw", "RGB", 0, 1)
+
+    pixels = np.frombuffer(data, dtype=np.uint8)
+    if layout.format == PixelFormat.YUV420:
+        pixels = cv2.cvtColor(
+            pixels.reshape(layout.height * 3 // 2, layout.width),
+            cv2.COLOR_YUV2RGB_I420,
+        )
+    else:
+        pixels = pixels.reshape(layout.height, layout.width, 3)
+
+    if (layout.width, layout.height) != size:
+        pixels = cv2.resize(pixels, size, interpolation=cv2.INTER_AREA)
+    return Image.fromarray(pixels)
+
+
+def encode_jpeg(image: Image.Image) -> bytes:
+    # Only vendor models need a JPEG, so raw uploads are encoded on demand
+    pixels = cv2.cvtColor(np.asarray(image), cv2.COLOR_RGB2BGR)
+    return cv2.imencode(".jpg", pixels)[1].tobytes()
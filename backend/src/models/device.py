@@ -0,0 +1,130 @@
+import os
+import torch
+import warnings
+
+
+class DeviceBackend:
+    def __init__(
+        self,
+        device: str = "cuda:0",
+        quantize: bool = False,
+        threads: int | None = None,
+        compile: bool | None = None,
+        cache_dir: str | None = None,
+    ) -> None:
+        self.device = torch.device(device)
+        self.is_cuda = self.device.type == "cuda"
+        if quantize and self.is_cuda:
+            raise ValueError("int8 dynamic quantization is only supported on CPU")
+
+        # Half precision on GPUs; CPU kernels are fastest in fp32 (or int8 weights)
+        self.dtype = torch.float16 if self.is_cuda else torch.float32
+        self.quantize = quantize
+
+        # torch.compile pays off with CUDA graphs; quantized CPU modules don't trace well
+        self.compile = self.is_cuda if compile is None else compile
+
+        self.threads = threads or len(os.sched_getaffinity(0))
+        self.cache_dir = cache_dir if self.compile else None
+        self.configure()
+
+    def configure(self) -> None:
+        if self.is_cuda:
+            # Enable Tensor Cores and cuDNN optimizations
+            torch.backends.cuda.matmul.allow_tf32 = True
+            torch.backends.cudnn.allow_tf32 = True
+            torch.set_float32_matmul_precision("medium")
+            torch.backends.cudnn.benchmark = True
+            return
+
+        # One intra-op pool sized to the cores we own; requests already run concurrently
+        torch.set_num_threads(self.threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Only settable before the first parallel op, e.g. when a second model loads
+            pass
+
+    @property
+    def artifacts_path(self) -> str:
+        return os.path.join(self.cache_dir, "artifacts.bin")
+
+    def load_compiled(self) -> None:
+        # Point Inductor and Triton at a persistent directory instead of /tmp, so
+        # compiled graphs and max-autotune results survive restarts and redeploys
+        os.makedirs(self.cache_dir, exist_ok=True)
+        os.environ.setdefault(
+            "TORCHINDUCTOR_CACHE_DIR", os.path.join(self.cache_dir, "inductor")
+        )
+        os.environ.setdefault(
+            "TRITON_CACHE_DIR", os.path.join(self.cache_dir, "triton")
+        )
+        torch._inductor.config.fx_graph_cache = True
+        torch._inductor.config.autotune_local_cache = True
+
+        # Portable bundle from a previous run (e.g. baked into the image) pre-seeds those
+        # caches; bundles need torch 2.7, older versions only get the directories above
+        if hasattr(torch.compiler, "load_cache_artifacts") and os.path.exists(
+            self.artifacts_path
+        ):
+            with open(self.artifacts_path, "rb") as f:
+                torch.compiler.load_cache_artifacts(f.read())
+
+    def save_compiled(self) -> None:
+        # Called after warmup, once every graph the server needs has been compiled
+        if self.cache_dir is None or not hasattr(
+            torch.compiler, "save_cache_artifacts"
+        ):
+            return
+
+        if (artifacts := torch.compiler.save_cache_artifacts()) is not None:
+            data, _ = artifacts
+            with open(self.artifacts_path, "wb") as f:
+                f.write(data)
+
+    def prepare(self, model: torch.nn.Module) -> torch.nn.Module:
+        model = model.to(self.device).eval()
+
+        if self.quantize:
+            model = self._quantize(model)
+
+        if self.compile:
+            if self.cache_dir is not None:
+                self.load_compiled()
+
+            model = torch.compile(
+                model,
+                fullgraph=True,
+                dynamic=True,
+                mode="max-autotune",
+            )
+
+        return model
+
+    def _quantize(self, model: torch.nn.Module) -> torch.nn.Module:
+        # int8 weights for every Linear except the output head, which the
+        # classify logit margin and caption sampling are most sensitive to.
+        # Exact type only: MultiheadAttention's out_proj subclasses Linear but is
+        # read as a raw weight tensor, which a quantized module doesn't have
+        head = model.get_output_embeddings()
+        names = {
+            name
+            for name, module in model.named_modules()
+            if type(module) is torch.nn.Linear and module is not head
+        }
+
+        with warnings.catch_warnings():
+            # torch.ao quantization is deprecated in favour of torchao, but needs no extra dependency
+            warnings.simplefilter("ignore")
+            return torch.ao.quantization.quantize_dynamic(
+                model, names, dtype=torch.qint8
+            )
+
+    @property
+    def warmup_iterations(self) -> int:
+        # Compiled graphs need a few passes to settle; eager CPU kernels only need one
+        return 3 if self.compile else 1
+
+    def synchronize(self) -> None:
+        if self.is_cuda:
+            torch.cuda.synchronize(self.device)
@@ -1,25 +1,49 @@
-import requests
-import json
+import os
+import time
 
-from typing import Generator
-from .base import VendorModel, Frame, FrameStatus
+from collections.abc import AsyncGenerator
+from .base import CancelToken, VendorModel, Frame, FrameStatus
+from .keys import KeyPool
+from .vendor import RateLimited, VendorClient
+
+
+def remaining(deadline: float) -> float:
+    # aiohttp reads a zero total timeout as no timeout at all, so a spent deadline
+    # has to fail here rather than be passed on
+    if (left := deadline - time.monotonic()) <= 0:
+        raise TimeoutError("Vendor request deadline passed")
+    return left
 
 
 class LlamaVisionModel(VendorModel):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        base_url: str = "https://api.groq.com/openai/v1/chat/completions",
+        connect_timeout: float = 2.0,
+        read_timeout: float = 10.0,
+        classify_timeout: float = 5.0,
+        caption_timeout: float = 5.0,
+        requests_per_minute: float = 30.0,
+    ) -> None:
         self.keys = [
-            "API_KEY_HERE",
+            key.strip()
+            for key in os.environ.get("GROQ_API_KEYS", "API_KEY_HERE").split(",")
+            if key.strip()
         ]
-        self.current_key_index = 0
-        self.api_key = self.keys[self.current_key_index]
-        self.base_url = "https://api.groq.com/openai/v1/chat/completions"
-
-        self.session = requests.Session()
-        self.session.headers.update(
-            {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-            }
+        self.base_url = base_url
+
+        # Deadlines cover key scheduling, retries and (for captions) the first token
+        self.classify_timeout = classify_timeout
+        self.caption_timeout = caption_timeout
+
+        # Spread requests over per-key rate budgets instead of retrying one key
+        self.pool = KeyPool(self.keys, requests_per_minute=requests_per_minute)
+
+        # Keep-alive pool shared by every request this model makes
+        self.client = VendorClient(
+            self.base_url,
+            connect_timeout=connect_timeout,
+            read_timeout=read_timeout,
         )
 
         # Load prompts
@@ -28,10 +52,13 @@ class LlamaVisionModel(VendorModel):
         with open("src/prompts/caption.txt", "r") as f:
             self.caption_prompt = f.read().strip()
 
-    def classify(self, frame: Frame, attempt: int = 0) -> FrameStatus:
-        if attempt >= len(self.keys):
-            return FrameStatus.Safe
+    def _headers(self, key: str) -> dict:
+        return {
+            "Authorization": f"Bearer {key}",
+            "Content-Type": "application/json",
+        }
 
+    async def classify(self, frame: Frame) -> FrameStatus:
         image_data = frame.as_encoded()
         payload = {
             "model": "llama-3.2-11b-vision-preview",
@@ -55,15 +82,20 @@ class LlamaVisionModel(VendorModel):
             "stream": False,
         }
 
-        response = self.session.post(
-            self.base_url,
-            json=payload,
-        )
+        deadline = time.monotonic() + self.classify_timeout
+        while True:
+            async with self.pool.use(deadline) as key:
+                try:
+                    resp_data = await self.client.post(
+                        payload,
+                        self._headers(key.key),
+                        total_timeout=remaining(deadline),
+                        on_headers=lambda headers: self.pool.update(key, headers),
+                    )
+                    break
+                except RateLimited as e:
+                    self.pool.throttle(key, e.headers)
 
-        if response.status_code == 429:
-            return self.classify(frame, attempt + 1)
-
-        resp_data = response.json()
         text_response = resp_data["choices"][0]["message"]["content"].lower()
 
         if "yes" in text_response:
@@ -73,11 +105,9 @@ class LlamaVisionModel(VendorModel):
 
         return FrameStatus.Hazard
 
-    def caption(self, frame: Frame, attempt: int = 0) -> Generator[str, None, None]:
-        if attempt >= len(self.keys):
-            yield "<end>"
-            return
-
+    async def caption(
+        self, frame: Frame, cancel: CancelToken | None = None
+    ) -> AsyncGenerator[str, None]:
         image_data = frame.as_encoded()
         payload = {
             "model": "llama-3.2-11b-vision-preview",
@@ -100,29 +130,21 @@ class LlamaVisionModel(VendorModel):
             "stream": True,
         }
 
-        response = self.session.post(
-            self.base_url,
-            json=payload,
-            stream=True,
-        )
-
-        if response.status_code == 429:
-            yield from self.caption(frame, attempt + 1)
-            return
-
-        for line in response.iter_lines(decode_unicode=True):
-            if not line or not line.startswith("data: "):
-                continue
-
-            data_str = line[len("data: ") :].strip()
-            if data_str == "[DONE]":
-                break
-
-            try:
-                chunk = json.loads(data_str)
-                if chunk.get("choices") and chunk["choices"][0].get("delta"):
-                    content = chunk["choices"][0]["delta"].get("content")
-                    if content:
-                        yield content
-            except json.JSONDecodeError:
-                continue
+        deadline = time.monotonic() + self.caption_timeout
+        while True:
+            async with self.pool.use(deadline) as key:
+                try:
+                    async for chunk in self.client.stream(
+                        payload,
+                        self._headers(key.key),
+                        on_headers=lambda headers: self.pool.update(key, headers),
+                        cancel=cancel,
+                        first_byte_timeout=remaining(deadline),
+                    ):
+                        if chunk.get("choices") and chunk["choices"][0].get("delta"):
+                            content = chunk["choices"][0]["delta"].get("content")
+                            if content:
+                                yield content
+                    return
+                except RateLimited as e:
+                    self.pool.throttle(key, e.headers)
@@ -0,0 +1,174 @@
+import asyncio
+import re
+import time
+
+from collections.abc import Mapping
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+
+
+class KeyPoolExhausted(Exception):
+    pass
+
+
+def parse_duration(value: str) -> float | None:
+    # Vendor reset headers look like "2m59.56s", "7.66s" or "250ms"
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    parts = re.findall(r"(\d+(?:\.\d+)?)(ms|h|m|s)", value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+
+    return sum(float(amount) * units[unit] for amount, unit in parts)
+
+
+def parse_retry_after(value: str) -> float | None:
+    # Retry-After is either delay-seconds or an HTTP date
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        self._refill(now)
+        return max(0.0, (1.0 - self.tokens) / self.rate)
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1.0
+
+
+class APIKey:
+    def __init__(self, key: str, rate: float, burst: float) -> None:
+        self.key = key
+        self.bucket = TokenBucket(rate, burst)
+        self.cooldown_until = 0.0
+        self.in_flight = 0
+
+        self.requests = 0
+        self.throttled = 0
+
+    def wait_time(self, now: float) -> float:
+        return max(self.cooldown_until - now, self.bucket.wait_time(now))
+
+    def as_dict(self, now: float) -> dict:
+        return {
+            "in_flight": self.in_flight,
+            "requests": self.requests,
+            "throttled": self.throttled,
+            "cooldown": max(0.0, self.cooldown_until - now),
+            "tokens": self.bucket.tokens,
+        }
+
+
+class KeyPool:
+    def __init__(
+        self,
+        keys: list[str],
+        requests_per_minute: float = 30.0,
+        burst: float = 5.0,
+        default_cooldown: float = 1.0,
+    ) -> None:
+        if not keys:
+            raise ValueError("KeyPool needs at least one key")
+
+        self.keys = [APIKey(key, requests_per_minute / 60.0, burst) for key in keys]
+        self.default_cooldown = default_cooldown
+
+        self.waits = 0
+        self.wait_seconds = 0.0
+        self.deadline_misses = 0
+
+    async def acquire(self, deadline: float) -> APIKey:
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                self.deadline_misses += 1
+                raise KeyPoolExhausted("Deadline passed before an API key was free")
+
+            ready = [key for key in self.keys if key.wait_time(now) == 0.0]
+
+            # Least-loaded key first, preferring the one with the most budget left
+            if ready:
+                key = min(ready, key=lambda key: (key.in_flight, -key.bucket.tokens))
+                key.bucket.take(now)
+                key.in_flight += 1
+                key.requests += 1
+                return key
+
+            wait = min(key.wait_time(now) for key in self.keys)
+            if now + wait > deadline:
+                self.deadline_misses += 1
+                raise KeyPoolExhausted(
+                    f"No API key available within deadline (next in {wait:.2f}s)"
+                )
+
+            self.waits += 1
+            self.wait_seconds += wait
+            await asyncio.sleep(wait)
+
+    def update(self, key: APIKey, headers: Mapping) -> None:
+        # Cool a key down early when the vendor reports its budget is spent
+        now = time.monotonic()
+        for kind in ("requests", "tokens"):
+            remaining = headers.get(f"x-ratelimit-remaining-{kind}")
+            reset = headers.get(f"x-ratelimit-reset-{kind}")
+            if remaining is None or reset is None:
+                continue
+
+            delay = parse_duration(reset)
+            if delay is not None and remaining.strip() in ("0", "0.0"):
+                key.cooldown_until = max(key.cooldown_until, now + delay)
+
+    def throttle(self, key: APIKey, headers: Mapping) -> None:
+        key.throttled += 1
+
+        delay = None
+        if (retry_after := headers.get("retry-after")) is not None:
+            delay = parse_retry_after(retry_after)
+
+        now = time.monotonic()
+        key.cooldown_until = max(
+            key.cooldown_until,
+            now + (delay if delay is not None else self.default_cooldown),
+        )
+        self.update(key, headers)
+
+    @asynccontextmanager
+    async def use(self, deadline: float):
+        key = await self.acquire(deadline)
+        try:
+            yield key
+        finally:
+            key.in_flight -= 1
+
+    def stats(self) -> dict:
+        now = time.monotonic()
+        saturated = sum(1 for key in self.keys if key.wait_time(now) > 0.0)
+
+        return {
+            "keys": [key.as_dict(now) for key in self.keys],
+            "saturation": saturated / len(self.keys),
+            "waits": self.waits,
+            "wait_seconds": self.wait_seconds,
+            "deadline_misses": self.deadline_misses,
+        }
@@ -0,0 +1,66 @@
+import torch
+import torch.nn.functional as F
+
+from transformers import DynamicCache
+
+# Per-layer (key, value) tensors shaped (batch, heads, tokens, head_dim)
+KVLayers = list[tuple[torch.Tensor, torch.Tensor]]
+
+
+def to_layers(cache) -> KVLayers:
+    # Newer transformers expose cache layers, older ones a legacy tuple
+    if hasattr(cache, "layers"):
+        return [(layer.keys, layer.values) for layer in cache.layers]
+    if hasattr(cache, "to_legacy_cache"):
+        return list(cache.to_legacy_cache())
+
+    return list(cache)
+
+
+def to_cache(layers: KVLayers) -> DynamicCache:
+    if hasattr(DynamicCache, "from_legacy_cache"):
+        return DynamicCache.from_legacy_cache(tuple(layers))
+
+    return DynamicCache(layers)
+
+
+def left_pad(layers: KVLayers, length: int) -> KVLayers:
+    # Pad the token axis on the left so shorter sequences line up in a batch
+    padding = length - layers[0][0].shape[-2]
+    if padding == 0:
+        return layers
+
+    return [
+        (F.pad(key, (0, 0, padding, 0)), F.pad(value, (0, 0, padding, 0)))
+        for key, value in layers
+    ]
+
+
+def stack(per_sequence: list[KVLayers]) -> tuple[KVLayers, torch.Tensor]:
+    # Merge single-sequence caches into one left-padded batch and its attention mask
+    lengths = [layers[0][0].shape[-2] for layers in per_sequence]
+    length = max(lengths)
+    padded = [left_pad(layers, length) for layers in per_sequence]
+
+    merged = [
+        (
+            torch.cat([layers[i][0] for layers in padded]),
+            torch.cat([layers[i][1] for layers in padded]),
+        )
+        for i in range(len(per_sequence[0]))
+    ]
+
+    device = per_sequence[0][0][0].device
+    mask = torch.zeros((len(lengths), length), dtype=torch.long, device=device)
+    for row, n in enumerate(lengths):
+        mask[row, length - n :] = 1
+
+    return merged, mask
+
+
+def unstack(layers: KVLayers, index: int, length: int) -> KVLayers:
+    # Slice one sequence back out of a left-padded batch, dropping its padding
+    return [
+        (key[index : index + 1, :, -length:], value[index : index + 1, :, -length:])
+        for key, value in layers
+    ]
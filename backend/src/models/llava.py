@@ -1,44 +1,56 @@
+import asyncio
 import io
+import re
 import torch
-import threading
+import transformers
 
 from PIL import Image
-from typing import Generator
+from typing import AsyncIterator, Generator
 from transformers import (
     AutoProcessor,
     LlavaForConditionalGeneration,
-    TextIteratorStreamer,
 )
-from .base import DeviceModel, Frame, FrameStatus
+from .base import CancelToken, Classification, DeviceModel, Frame, FrameStatus
+from .batching import BatchDecoder, CaptionEngine, Sequence
+from .device import DeviceBackend
+from .kv import stack, to_cache, to_layers, unstack
+from .streaming import GenerationWorker
 
+transformers.logging.set_verbosity_error()
 
-class LlavaModel(DeviceModel):
-    def __init__(self) -> None:
-        self.model_id = "llava-hf/llava-interleave-qwen-0.5b-hf"
-        self.device = torch.device("cuda:0")
 
-        # Enable Tensor Cores and cuDNN optimizations
-        torch.backends.cuda.matmul.allow_tf32 = True
-        torch.backends.cudnn.allow_tf32 = True
-        torch.set_float32_matmul_precision("medium")
-        torch.backends.cudnn.benchmark = True
+class LlavaModel(DeviceModel, BatchDecoder):
+    def __init__(
+        self,
+        max_batch_size: int = 8,
+        classify_mode: str = "logits",
+        hazard_threshold: float = 0.5,
+        calibration: tuple[float, float] = (1.0, 0.0),
+        device: str = "cuda:0",
+        quantize: bool = False,
+        threads: int | None = None,
+        cache_dir: str | None = None,
+    ) -> None:
+        if classify_mode not in ("logits", "generate"):
+            raise ValueError(f"Unknown classify mode: {classify_mode}")
+
+        self.model_id = "llava-hf/llava-interleave-qwen-0.5b-hf"
+        self.backend = DeviceBackend(
+            device, quantize=quantize, threads=threads, cache_dir=cache_dir
+        )
+        self.device = self.backend.device
+        self.dtype = self.backend.dtype
 
         # Initialize Llava model and processor
         self.model = LlavaForConditionalGeneration.from_pretrained(
             self.model_id,
-            torch_dtype=torch.float16,
+            torch_dtype=self.dtype,
             low_cpu_mem_usage=True,
-        ).to(self.device)
+        )
         self.processor = AutoProcessor.from_pretrained(self.model_id, use_fast=True)
 
-        # Put model in eval/compiled mode
-        self.model.eval()
-        self.model = torch.compile(
-            self.model,
-            fullgraph=True,
-            dynamic=True,
-            mode="max-autotune",
-        )
+        # Move, quantize and compile the model for the configured device
+        self.model = self.backend.prepare(self.model)
 
         # Load and pre-process model prompts
         with open("src/prompts/classify.txt", "r") as f:
@@ -56,6 +68,37 @@ class LlavaModel(DeviceModel):
                 add_generation_prompt=False,
             )
 
+            # Answer with the JSON "answer" value directly, so its first token decides
+            self.classify_answer_prompt = (
+                self.processor.apply_chat_template(
+                    [
+                        {
+                            "role": "user",
+                            "content": [
+                                {"type": "text", "text": classify_text},
+                                {"type": "image"},
+                            ],
+                        }
+                    ],
+                    add_generation_prompt=True,
+                )
+                + '{"answer": "'
+            )
+
+        # The prompt lists the hazard answer first, e.g. "answer": "yes" or "no"
+        answers = re.search(r'"answer":\s*"(\w+)"\s*or\s*"(\w+)"', classify_text)
+        if answers is None:
+            raise ValueError("Classify prompt does not list its answer tokens")
+        self.hazard_answer = answers.group(1).lower()
+        self.safe_answer = answers.group(2).lower()
+        self.hazard_token_ids = self._answer_token_ids(answers.group(1))
+        self.safe_token_ids = self._answer_token_ids(answers.group(2))
+
+        # Platt scaling (scale, bias) fitted offline on the yes/no logit margin
+        self.classify_mode = classify_mode
+        self.hazard_threshold = hazard_threshold
+        self.calibration = calibration
+
         with open("src/prompts/caption.txt", "r") as f:
             caption_text = f.read().strip()
             self.caption_prompt = self.processor.apply_chat_template(
@@ -71,6 +114,41 @@ class LlavaModel(DeviceModel):
                 add_generation_prompt=False,
             )
 
+        # Caption sampling settings, applied per sequence by the batch decoder
+        self.temperature = 0.8
+        self.top_p = 0.9
+
+        eos_token_id = self.model.generation_config.eos_token_id
+        if isinstance(eos_token_id, int):
+            eos_token_id = [eos_token_id]
+        self.eos_token_ids = set(eos_token_id or []) | {
+            self.processor.tokenizer.eos_token_id
+        }
+
+        self.image_token_id = getattr(
+            self.model.config, "image_token_id", None
+        ) or getattr(self.model.config, "image_token_index")
+
+        # Encode the static text before the image once; frames only prefill the rest
+        self.classify_prefix = self._build_prefix(self.classify_answer_prompt)
+        self.caption_prefix = self._build_prefix(self.caption_prompt)
+
+        # Captions from every connection share one continuously batched decode loop
+        self.batch_members = []
+        self.batch_cache = None
+        self.batch_mask = None
+        self.engine = CaptionEngine(
+            self, max_batch_size=max_batch_size, max_new_tokens=20, min_new_tokens=5
+        )
+
+    def _answer_token_ids(self, answer: str) -> list[int]:
+        # Accept the casing variants the model may use for the same answer
+        token_ids = {
+            self.processor.tokenizer.encode(variant, add_special_tokens=False)[0]
+            for variant in (answer, answer.lower(), answer.capitalize())
+        }
+        return sorted(token_ids)
+
     def _process_input(self, frame: Frame, text: str) -> dict:
         # Process the frame with the provided prompt text
         inputs = self.processor(
@@ -79,7 +157,114 @@ class LlavaModel(DeviceModel):
             return_tensors="pt",
         )
 
-        return inputs.to(self.device, dtype=torch.float16, non_blocking=True)
+        return inputs.to(self.device, dtype=self.dtype, non_blocking=True)
+
+    @torch.inference_mode()
+    def _encode_image(self, frame: Frame) -> torch.Tensor:
+        return self._image_features(self._cached_pixel_values(frame))
+
+    def encode_images(self, frames: list[Frame]) -> torch.Tensor:
+        # One vision pass over every frame that has no cached features yet
+        key = (self.model_id, "image_features")
+        missing = [frame for frame in frames if key not in frame.features]
+        if missing:
+            pixel_values = torch.cat(
+                [self._cached_pixel_values(frame) for frame in missing]
+            )
+            features = self._image_features(pixel_values)
+            for frame, image_features in zip(missing, features.split(1)):
+                frame.features[key] = image_features
+
+        return torch.cat([frame.features[key] for frame in frames])
+
+    def _cached_pixel_values(self, frame: Frame) -> torch.Tensor:
+        return frame.cached(
+            (self.model_id, "pixel_values"), lambda: self._pixel_values(frame)
+        )
+
+    @torch.inference_mode()
+    def _image_features(self, pixel_values: torch.Tensor) -> torch.Tensor:
+        config = self.model.config
+        features = self.model.get_image_features(
+            pixel_values=pixel_values,
+            vision_feature_layer=config.vision_feature_layer,
+            vision_feature_select_strategy=config.vision_feature_select_strategy,
+        )
+
+        # Newer transformers wrap the projected features in a model output
+        features = getattr(features, "pooler_output", features)
+        if isinstance(features, (list, tuple)):
+            features = torch.stack(list(features))
+
+        return features.reshape(pixel_values.shape[0], -1, features.shape[-1])
+
+    def _pixel_values(self, frame: Frame) -> torch.Tensor:
+        # Only the image needs processing per frame; the prompt tokens are precomputed
+        pixel_values = self.processor.image_processor(
+            frame.as_image(), return_tensors="pt"
+        )["pixel_values"]
+
+        return pixel_values.to(self.device, dtype=self.dtype, non_blocking=True)
+
+    @torch.inference_mode()
+    def _build_prefix(self, prompt: str) -> dict:
+        image_token = self.processor.image_token
+        prefix_text, suffix_text = prompt.split(image_token, 1)
+
+        # The expanded image placeholder has a fixed length, so tokenize it once
+        dummy = Image.new("RGB", (128, 128), color="white")
+        suffix_ids = self.processor(
+            images=dummy, text=image_token + suffix_text, return_tensors="pt"
+        )["input_ids"].to(self.device)
+        prefix_ids = self.processor.tokenizer(
+            prefix_text, add_special_tokens=False, return_tensors="pt"
+        )["input_ids"].to(self.device)
+
+        outputs = self.model(input_ids=prefix_ids, use_cache=True, logits_to_keep=1)
+
+        return {
+            "cache": to_layers(outputs.past_key_values),
+            "length": prefix_ids.shape[1],
+            "input_ids": suffix_ids,
+        }
+
+    def _prefill(self, prefix: dict, image_features: torch.Tensor):
+        # Prefill only the image and suffix tokens on top of a copy of the prefix cache
+        batch_size = image_features.shape[0]
+        input_ids = prefix["input_ids"].expand(batch_size, -1)
+        length = prefix["length"] + input_ids.shape[1]
+
+        # Splice the cached image embeddings into the placeholder positions
+        inputs_embeds = self.model.get_input_embeddings()(input_ids)
+        image_mask = (input_ids == self.image_token_id).unsqueeze(-1)
+        inputs_embeds = inputs_embeds.masked_scatter(
+            image_mask.expand_as(inputs_embeds),
+            image_features.to(inputs_embeds.dtype),
+        )
+
+        cache = to_cache(
+            [
+                (
+                    key.expand(batch_size, -1, -1, -1),
+                    value.expand(batch_size, -1, -1, -1),
+                )
+                for key, value in prefix["cache"]
+            ]
+        )
+        position_ids = torch.arange(
+            prefix["length"], length, device=self.device
+        ).expand(batch_size, -1)
+
+        return self.model(
+            inputs_embeds=inputs_embeds,
+            attention_mask=torch.ones(
+                (batch_size, length), dtype=torch.long, device=self.device
+            ),
+            position_ids=position_ids,
+            past_key_values=cache,
+            use_cache=True,
+            logits_to_keep=1,
+        )
 
     @torch.inference_mode()
     def warmup(self) -> None:
@@ -92,7 +277,7 @@ class LlavaModel(DeviceModel):
         frame = Frame(buffer.getvalue())
         inputs = self._process_input(frame, text=self.caption_prompt)
 
-        for _ in range(3):
+        for _ in range(self.backend.warmup_iterations):
             _ = self.model.generate(
                 **inputs,
                 max_new_tokens=10,
@@ -101,10 +286,54 @@ class LlavaModel(DeviceModel):
                 use_cache=True,
             )
 
-        torch.cuda.synchronize()
+        # Run the classify and batched caption paths once so their kernels are ready too
+        self.classify(frame)
+        for _ in self.caption(frame):
+            pass
+
+        self.backend.synchronize()
+        self.backend.save_compiled()
+
+    @torch.inference_mode()
+    def score(self, frame: Frame) -> Classification:
+        return self.score_batch([frame])[0]
+
+    @torch.inference_mode()
+    def score_batch(self, frames: list[Frame]) -> list[Classification]:
+        # A single forward pass for the batch; only the next-token logits are needed
+        outputs = self._prefill(self.classify_prefix, self.encode_images(frames))
+        logits = outputs.logits[:, -1].float()
+
+        hazard = torch.logsumexp(logits[:, self.hazard_token_ids], dim=-1)
+        safe = torch.logsumexp(logits[:, self.safe_token_ids], dim=-1)
+
+        scale, bias = self.calibration
+        hazard_probabilities = torch.sigmoid((hazard - safe) * scale + bias).tolist()
+
+        # Confidence is reported for whichever status the threshold picks
+        classifications = []
+        for probability in hazard_probabilities:
+            if probability >= self.hazard_threshold:
+                classifications.append(Classification(FrameStatus.Hazard, probability))
+            else:
+                classifications.append(
+                    Classification(FrameStatus.Safe, 1.0 - probability)
+                )
+        return classifications
+
+    def classify_batch(self, frames: list[Frame]) -> list[FrameStatus]:
+        if self.classify_mode == "logits":
+            return [
+                classification.status for classification in self.score_batch(frames)
+            ]
+
+        return super().classify_batch(frames)
 
     @torch.inference_mode()
     def classify(self, frame: Frame) -> FrameStatus:
+        if self.classify_mode == "logits":
+            return self.score(frame).status
+
         inputs = self._process_input(frame, text=self.classify_prompt)
 
         # Generation configuration for classification
@@ -128,40 +357,100 @@ class LlavaModel(DeviceModel):
             .lower()
         )
 
-        return FrameStatus.Hazard if "no" in response else FrameStatus.Safe
+        # Same answers as the logits path; anything unclear is treated as a hazard
+        words = re.findall(r"\w+", response)
+        if self.hazard_answer in words:
+            return FrameStatus.Hazard
+        if self.safe_answer in words:
+            return FrameStatus.Safe
+        return FrameStatus.Hazard
+
+    def _sample(self, logits: torch.Tensor, sequences: list[Sequence]) -> list[int]:
+        logits = logits.float() / self.temperature
+
+        # Hold back end-of-sequence until each caption reaches its minimum length
+        for row, sequence in enumerate(sequences):
+            if len(sequence.token_ids) < sequence.min_new_tokens:
+                logits[row, list(self.eos_token_ids)] = float("-inf")
+
+        # Nucleus sampling over the batch
+        probs = torch.softmax(logits, dim=-1)
+        sorted_probs, sorted_ids = torch.sort(probs, descending=True, dim=-1)
+        cumulative = torch.cumsum(sorted_probs, dim=-1)
+        sorted_probs[cumulative - sorted_probs > self.top_p] = 0.0
+        choice = torch.multinomial(sorted_probs, num_samples=1)
+
+        return sorted_ids.gather(-1, choice).squeeze(-1).tolist()
+
+    @torch.inference_mode()
+    def prefill(self, sequence: Sequence) -> int:
+        # The request is the frame; classify may already have encoded it
+        prefix = self.caption_prefix
+        outputs = self._prefill(prefix, self.encode_image(sequence.request))
+
+        sequence.state = {
+            "cache": to_layers(outputs.past_key_values),
+            "length": prefix["length"] + prefix["input_ids"].shape[1],
+        }
+
+        return self._sample(outputs.logits[:, -1], [sequence])[0]
 
     @torch.inference_mode()
-    def caption(self, frame) -> Generator[str, None, None]:
-        streamer = TextIteratorStreamer(
-            tokenizer=self.processor.tokenizer,
-            skip_special_tokens=True,
-            skip_prompt=True,
+    def decode(self, sequences: list[Sequence]) -> list[int]:
+        # Rebuild the padded batch cache only when sequences join or leave
+        if sequences != self.batch_members:
+            if self.batch_cache is not None:
+                layers = to_layers(self.batch_cache)
+                for row, member in enumerate(self.batch_members):
+                    if member.state is not None and member.state["cache"] is None:
+                        member.state["cache"] = unstack(
+                            layers, row, member.state["length"]
+                        )
+
+            layers, self.batch_mask = stack(
+                [sequence.state["cache"] for sequence in sequences]
+            )
+            self.batch_cache = to_cache(layers)
+            self.batch_members = list(sequences)
+            for sequence in sequences:
+                sequence.state["cache"] = None
+
+        input_ids = torch.tensor(
+            [[sequence.token_ids[-1]] for sequence in sequences], device=self.device
+        )
+        position_ids = torch.tensor(
+            [[sequence.state["length"]] for sequence in sequences], device=self.device
+        )
+        self.batch_mask = torch.cat(
+            [self.batch_mask, self.batch_mask.new_ones((len(sequences), 1))], dim=-1
         )
 
-        # Prepare generation config
-        generation_config = dict(
-            max_new_tokens=20,
-            num_beams=1,
-            do_sample=True,
-            temperature=0.8,
-            top_p=0.9,
-            min_length=5,
-            length_penalty=1.0,
+        outputs = self.model(
+            input_ids=input_ids,
+            attention_mask=self.batch_mask,
+            position_ids=position_ids,
+            past_key_values=self.batch_cache,
             use_cache=True,
-            streamer=streamer,
         )
 
-        inputs = self._process_input(frame, text=self.caption_prompt)
+        # The cache object grows in place, so keep it across steps
+        self.batch_cache = outputs.past_key_values
+        for sequence in sequences:
+            sequence.state["length"] += 1
 
-        # Generate the model response in a separate thread
-        def generate():
-            self.model.generate(**inputs, **generation_config)
+        return self._sample(outputs.logits[:, -1], sequences)
 
-        generator = threading.Thread(target=generate)
-        generator.start()
+    def detokenize(self, token_ids: list[int]) -> str:
+        return self.processor.tokenizer.decode(token_ids, skip_special_tokens=True)
 
-        # Stream tokens in the current thread
-        for token_text in streamer:
-            yield token_text
+    def caption(
+        self, frame: Frame, cancel: CancelToken | None = None
+    ) -> Generator[str, None, None]:
+        # Join the shared decode batch and stream this caption's tokens back
+        yield from self.engine.submit(frame, cancel)
 
-        generator.join()
+    def stream_caption(
+        self, frame: Frame, cancel: CancelToken | None, worker: GenerationWorker
+    ) -> AsyncIterator[str]:
+        # The decode loop is this model's caption worker, feeding the event loop directly
+        return self.engine.submit(frame, cancel, asyncio.get_running_loop())
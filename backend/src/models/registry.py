@@ -0,0 +1,122 @@
+import asyncio
+import importlib
+import time
+
+from collections.abc import AsyncIterator
+from typing import Any
+from .base import AsyncModel, CancelToken, DeviceModel, Frame, FrameStatus
+from .streaming import GenerationWorker
+
+# Name -> (module, class, kind); a module is only imported once its model is selected
+MODELS = {
+    "llava": (".llava", "LlavaModel", "device"),
+    "blip": (".blip", "BlipModel", "device"),
+    "groq": (".groq", "LlamaVisionModel", "vendor"),
+}
+
+# BLIP only captions; it has no hazard classifier
+CLASSIFY_MODELS = [name for name in MODELS if name != "blip"]
+
+
+def model_class(name: str) -> type:
+    if name not in MODELS:
+        raise ValueError(f"Unknown model: {name}")
+
+    module, class_name, _ = MODELS[name]
+    return getattr(importlib.import_module(module, __package__), class_name)
+
+
+def create_model(name: str, device_options: dict) -> Any:
+    start = time.perf_counter()
+
+    # Device models take the device layer options and need warming before serving
+    if MODELS[name][2] == "device":
+        model = model_class(name)(**device_options)
+        model.warmup()
+    else:
+        model = model_class(name)()
+
+    print(f"Loaded {name} in {time.perf_counter() - start:.1f}s")
+    return model
+
+
+class DeviceRunner(AsyncModel):
+    # Compatibility layer for device models: their blocking calls run in order on one
+    # persistent worker thread, and caption tokens are handed to the event loop
+    def __init__(self, model: DeviceModel) -> None:
+        self.model = model
+        self.worker = model.worker
+
+    async def classify(self, frame: Frame) -> FrameStatus:
+        return await self.worker.run(self.model.classify, frame)
+
+    async def classify_batch(self, frames: list[Frame]) -> list[FrameStatus]:
+        return await self.worker.run(self.model.classify_batch, frames)
+
+    def caption(
+        self, frame: Frame, cancel: CancelToken | None = None
+    ) -> AsyncIterator[str]:
+        return self.model.stream_caption(frame, cancel, self.worker)
+
+
+def as_async(model: Any) -> AsyncModel:
+    return DeviceRunner(model) if isinstance(model, DeviceModel) else model
+
+
+class ModelRegistry:
+    def __init__(
+        self, caption: str, classify: str, device_options: dict | None = None
+    ) -> None:
+        if classify in MODELS and classify not in CLASSIFY_MODELS:
+            raise ValueError(f"{classify} can only caption, not classify")
+
+        self.caption_name = caption
+        self.classify_name = classify
+        self.device_options = device_options or {}
+
+        self.caption = None
+        self.classify = None
+
+        # "loading" until every model is warm, then "ready" (or "failed")
+        self.state = "loading"
+        self.error = None
+        self.ready = asyncio.Event()
+
+    @classmethod
+    def loaded(cls, caption: Any, classify: Any) -> "ModelRegistry":
+        # Wrap already constructed models, e.g. stubs in benchmarks
+        registry = cls(type(caption).__name__, type(classify).__name__)
+        registry.attach(caption, classify)
+        return registry
+
+    def attach(self, caption: Any, classify: Any) -> None:
+        # A model serving both roles shares one runner, and so one worker
+        self.caption = as_async(caption)
+        self.classify = self.caption if classify is caption else as_async(classify)
+        self.state = "ready"
+        self.ready.set()
+
+    def fail(self, error: Exception) -> None:
+        self.state = "failed"
+        self.error = error
+        self.ready.set()
+
+    async def load(self) -> None:
+        start = time.perf_counter()
+
+        # Load and warm each distinct model on its own thread so they overlap
+        names = list(dict.fromkeys([self.caption_name, self.classify_name]))
+        try:
+            models = await asyncio.gather(
+                *(
+                    asyncio.to_thread(create_model, name, self.device_options)
+                    for name in names
+                )
+            )
+        except Exception as e:
+            self.fail(e)
+            raise
+
+        loaded = dict(zip(names, models))
+        self.attach(loaded[self.caption_name], loaded[self.classify_name])
+        print(f"Models ready in {time.perf_counter() - start:.1f}s")
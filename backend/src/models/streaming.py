@@ -0,0 +1,111 @@
+import asyncio
+import queue
+import threading
+
+from collections.abc import Callable, Generator
+from typing import Any
+
+
+class TokenStream:
+    # Tokens produced on a worker thread and awaited on an event loop. Each one is handed
+    # over with call_soon_threadsafe, so no thread sits blocked waiting for the consumer
+    def __init__(self, loop: asyncio.AbstractEventLoop | None = None) -> None:
+        self.loop = loop or asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.error = None
+
+    def put(self, token: str | None) -> None:
+        # Safe from any thread; None ends the stream
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, token)
+
+    def close(self, error: Exception | None = None) -> None:
+        self.error = error
+        self.put(None)
+
+    def __aiter__(self) -> "TokenStream":
+        return self
+
+    async def __anext__(self) -> str:
+        if (token := await self.queue.get()) is None:
+            # Leave the end marker for anyone iterating again
+            self.queue.put_nowait(None)
+            if self.error is not None:
+                raise self.error
+            raise StopAsyncIteration
+
+        return token
+
+
+class GenerationWorker:
+    # One long-lived thread per model for its blocking calls, run in submission order
+    def __init__(self, name: str) -> None:
+        self.jobs = queue.Queue()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self.jobs.get()()
+
+    def run(self, func: Callable, *args) -> asyncio.Future:
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def settle(result: Any, error: Exception | None) -> None:
+            if future.cancelled():
+                return
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+        def job() -> None:
+            try:
+                result = func(*args)
+            except Exception as e:
+                loop.call_soon_threadsafe(settle, None, e)
+            else:
+                loop.call_soon_threadsafe(settle, result, None)
+
+        self.jobs.put(job)
+        return future
+
+    def stream(self, produce: Callable, *args) -> TokenStream:
+        # produce(*args, emit) runs on the worker and emits tokens as it generates them
+        stream = TokenStream()
+
+        def job() -> None:
+            try:
+                produce(*args, stream.put)
+            except Exception as e:
+                stream.close(e)
+            else:
+                stream.close()
+
+        self.jobs.put(job)
+        return stream
+
+    def iterate(self, produce: Callable, *args) -> Generator[str, None, None]:
+        # Blocking counterpart of stream() for callers without an event loop
+        if threading.current_thread() is self.thread:
+            tokens = []
+            produce(*args, tokens.append)
+            yield from tokens
+            return
+
+        tokens = queue.Queue()
+        errors = []
+
+        def job() -> None:
+            try:
+                produce(*args, tokens.put)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                tokens.put(None)
+
+        self.jobs.put(job)
+        while (token := tokens.get()) is not None:
+            yield token
+        if errors:
+            raise errors[0]
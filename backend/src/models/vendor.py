@@ -0,0 +1,172 @@
+import aiohttp
+import asyncio
+import json
+
+from collections.abc import AsyncGenerator, Callable, Mapping
+from contextlib import AsyncExitStack
+from .base import CancelToken
+
+
+class VendorError(Exception):
+    def __init__(self, status: int, message: str, headers: Mapping | None = None):
+        super().__init__(f"Vendor request failed with {status}: {message}")
+        self.status = status
+        self.headers = headers or {}
+
+
+class RateLimited(VendorError):
+    pass
+
+
+class SSEParser:
+    def __init__(self) -> None:
+        self.buffer = bytearray()
+        self.data = []
+
+    def feed(self, chunk: bytes) -> list[str]:
+        # Return the data of every event completed by this chunk
+        self.buffer.extend(chunk)
+        events = []
+
+        while (end := self.buffer.find(b"\n")) != -1:
+            line = bytes(self.buffer[:end]).rstrip(b"\r").decode("utf-8")
+            del self.buffer[: end + 1]
+
+            # A blank line dispatches the event collected so far
+            if not line:
+                if self.data:
+                    events.append("\n".join(self.data))
+                    self.data = []
+                continue
+
+            if line.startswith(":"):
+                continue
+
+            field, _, value = line.partition(":")
+            if field == "data":
+                self.data.append(value[1:] if value.startswith(" ") else value)
+
+        return events
+
+
+class VendorClient:
+    def __init__(
+        self,
+        base_url: str,
+        pool_size: int = 32,
+        keepalive_timeout: float = 30.0,
+        connect_timeout: float = 2.0,
+        read_timeout: float = 10.0,
+    ) -> None:
+        self.base_url = base_url
+        self.pool_size = pool_size
+        self.keepalive_timeout = keepalive_timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.session = None
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # Created lazily so the pool binds to the running event loop
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=self.keepalive_timeout,
+                ttl_dns_cache=300,
+            )
+            self.session = aiohttp.ClientSession(connector=connector)
+
+        return self.session
+
+    def _timeout(self, total: float | None) -> aiohttp.ClientTimeout:
+        return aiohttp.ClientTimeout(
+            total=total,
+            sock_connect=self.connect_timeout,
+            sock_read=self.read_timeout,
+        )
+
+    async def _check(
+        self,
+        response: aiohttp.ClientResponse,
+        on_headers: Callable[[Mapping], None] | None,
+    ) -> None:
+        if response.status == 200:
+            if on_headers is not None:
+                on_headers(response.headers)
+            return
+
+        message = await response.text()
+        if response.status == 429:
+            raise RateLimited(response.status, message, response.headers)
+        raise VendorError(response.status, message, response.headers)
+
+    async def post(
+        self,
+        payload: dict,
+        headers: dict,
+        total_timeout: float | None = None,
+        on_headers: Callable[[Mapping], None] | None = None,
+    ) -> dict:
+        async with self._get_session().post(
+            self.base_url,
+            json=payload,
+            headers=headers,
+            timeout=self._timeout(total_timeout),
+        ) as response:
+            await self._check(response, on_headers)
+            return await response.json()
+
+    async def stream(
+        self,
+        payload: dict,
+        headers: dict,
+        on_headers: Callable[[Mapping], None] | None = None,
+        cancel: CancelToken | None = None,
+        first_byte_timeout: float | None = None,
+    ) -> AsyncGenerator[dict, None]:
+        async with AsyncExitStack() as stack:
+            # Only the headers and the first chunk are bounded; after that a caption
+            # runs as long as it keeps streaming within the read timeout
+            first_byte = asyncio.timeout(first_byte_timeout)
+            try:
+                async with first_byte:
+                    response = await stack.enter_async_context(
+                        self._get_session().post(
+                            self.base_url,
+                            json=payload,
+                            headers=headers,
+                            timeout=self._timeout(None),
+                        )
+                    )
+                    await self._check(response, on_headers)
+                    chunks = response.content.iter_any()
+                    chunk = await anext(chunks, None)
+            except TimeoutError:
+                # Connect and read timeouts from aiohttp pass through as they are
+                if not first_byte.expired():
+                    raise
+                raise TimeoutError(
+                    f"No data from the stream within {first_byte_timeout:.2f}s"
+                ) from None
+
+            # Parse events as bytes arrive instead of waiting for whole lines
+            parser = SSEParser()
+            while chunk is not None:
+                # Drop the connection rather than draining a caption nobody wants
+                if cancel is not None and cancel.cancelled:
+                    response.close()
+                    return
+
+                for data in parser.feed(chunk):
+                    if data == "[DONE]":
+                        return
+
+                    try:
+                        yield json.loads(data)
+                    except json.JSONDecodeError:
+                        continue
+
+                chunk = await anext(chunks, None)
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
@@ -0,0 +1,166 @@
+import asyncio
+import json
+import struct
+
+from collections.abc import Callable
+from enum import IntEnum
+from models.base import FrameStatus
+
+# Binary messages: 1-byte type, 2-byte stream id, then a type-specific payload
+HEADER = struct.Struct("!BH")
+
+# Largest coalescing window a client may ask for, in seconds
+MAX_COALESCE_WINDOW = 0.25
+
+# Flush coalesced tokens early once this many bytes are buffered
+MAX_COALESCE_BYTES = 512
+
+
+class MessageType(IntEnum):
+    Token = 1
+    End = 2
+    Hazard = 3
+    Error = 4
+
+
+class EndReason(IntEnum):
+    Complete = 0
+    Preempted = 1
+    Truncated = 2
+
+
+def encode(message_type: MessageType, stream_id: int, payload: bytes = b"") -> bytes:
+    return HEADER.pack(message_type, stream_id) + payload
+
+
+def decode(data: bytes | memoryview) -> tuple[MessageType, int, memoryview]:
+    message_type, stream_id = HEADER.unpack_from(data)
+    return MessageType(message_type), stream_id, memoryview(data)[HEADER.size :]
+
+
+def parse_hello(text: str) -> dict | None:
+    # Clients opt into binary framing with {"type": "hello", "framing": "binary"}
+    try:
+        message = json.loads(text)
+    except json.JSONDecodeError:
+        return None
+
+    if not isinstance(message, dict) or message.get("type") != "hello":
+        return None
+    return message
+
+
+class TextStream:
+    # Legacy framing: every token is a TEXT message prefixed with the caption id
+    def __init__(self, send: Callable[[bytes], None], caption_id: str) -> None:
+        self.send = send
+        self.caption_id = caption_id
+
+        # Tokens held back while the client's socket is backed up
+        self.held = False
+        self.buffer = []
+        self.buffered_bytes = 0
+
+    def token(self, text: str) -> None:
+        if self.held:
+            self.buffer.append(text)
+            self.buffered_bytes += len(text)
+            return
+
+        self.send(f"{self.caption_id}|{text}".encode("utf-8"))
+
+    def hold(self) -> None:
+        self.held = True
+
+    def release(self) -> None:
+        # Tokens concatenate on the client, so held ones go out as a single message
+        self.held = False
+        if self.buffer:
+            self.token("".join(self.buffer))
+            self.buffer = []
+            self.buffered_bytes = 0
+
+    def end(self, reason: EndReason = EndReason.Complete) -> None:
+        # No end reasons in this framing; clients only see that the caption is over
+        self.release()
+        self.send(f"{self.caption_id}|<end>".encode("utf-8"))
+
+    def error(self, message: str) -> None:
+        # No error message exists in this framing, so just close the caption
+        self.end()
+
+
+class BinaryStream:
+    def __init__(
+        self,
+        send: Callable[[bytes], None],
+        stream_id: int,
+        caption_id: str,
+        status: FrameStatus,
+        coalesce_window: float = 0.0,
+    ) -> None:
+        self.send = send
+        self.stream_id = stream_id
+        self.coalesce_window = min(coalesce_window, MAX_COALESCE_WINDOW)
+
+        self.buffer = []
+        self.buffered_bytes = 0
+        self.flush_handle = None
+
+        # While held, tokens only accumulate; they go out together on release
+        self.held = False
+
+        # Opening message binds the small stream id to the client's caption id
+        flag = b"\x01" if status == FrameStatus.Hazard else b"\x00"
+        self.send(
+            encode(MessageType.Hazard, stream_id, flag + caption_id.encode("utf-8"))
+        )
+
+    def token(self, text: str) -> None:
+        payload = text.encode("utf-8")
+        if self.held:
+            self.buffer.append(payload)
+            self.buffered_bytes += len(payload)
+            return
+
+        if not self.coalesce_window:
+            self.send(encode(MessageType.Token, self.stream_id, payload))
+            return
+
+        # Pack tokens that arrive within the latency budget into one frame
+        self.buffer.append(payload)
+        self.buffered_bytes += len(payload)
+        if self.buffered_bytes >= MAX_COALESCE_BYTES:
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_running_loop().call_later(
+                self.coalesce_window, self.flush
+            )
+
+    def hold(self) -> None:
+        self.held = True
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+    def release(self) -> None:
+        self.held = False
+        self.flush()
+
+    def flush(self) -> None:
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+
+        if self.buffer:
+            self.send(encode(MessageType.Token, self.stream_id, b"".join(self.buffer)))
+            self.buffer = []
+            self.buffered_bytes = 0
+
+    def end(self, reason: EndReason = EndReason.Complete) -> None:
+        self.release()
+        self.send(encode(MessageType.End, self.stream_id, bytes([reason])))
+
+    def error(self, message: str) -> None:
+        self.release()
+        self.send(encode(MessageType.Error, self.stream_id, message.encode("utf-8")))
@@ -0,0 +1,72 @@
+import time
+
+from config import RateConfig
+
+
+class RateController:
+    # Recommends how often, and how large, a client should send frames: as fast as
+    # allowed while hazards are likely, slower when most frames go unused or the
+    # server is saturated
+    def __init__(self, config: RateConfig) -> None:
+        self.config = config
+        self.alpha = 2 / (config.window + 1)
+
+        # Smoothed share of received frames that were superseded or similar
+        self.redundant_rate = 0.0
+        self.received = 0
+        self.redundant = 0
+
+        self.sent = None
+        self.sent_at = 0.0
+
+    def observe(self, received: int, redundant: int) -> None:
+        # Fold in the frames received since the last call
+        new = received - self.received
+        if new <= 0:
+            return
+
+        ratio = min(1.0, (redundant - self.redundant) / new)
+        self.received = received
+        self.redundant = redundant
+        self.redundant_rate += self.alpha * (ratio - self.redundant_rate)
+
+    def recommend(self, hazard_rate: float, load: float) -> tuple[int, int]:
+        config = self.config
+        if hazard_rate >= config.hazard_rate_threshold:
+            interval = config.min_interval
+            size = config.max_size
+        else:
+            # Back off in proportion to how much of what the client sends is thrown away
+            span = config.max_interval - config.min_interval
+            interval = config.min_interval + span * self.redundant_rate
+            static = self.redundant_rate >= 0.5 or load > 1.0
+            size = config.min_size if static else config.max_size
+
+        # A saturated server slows everyone down, hazards included
+        interval *= max(1.0, load)
+        return round(min(interval, config.max_interval) * 1000), size
+
+    def update(self, hazard_rate: float, load: float) -> dict | None:
+        # A control message once the recommendation moves enough, at most once per min_update
+        interval_ms, size = self.recommend(hazard_rate, load)
+        now = time.monotonic()
+        if self.sent is not None:
+            last_interval_ms, last_size = self.sent
+            if now - self.sent_at < self.config.min_update:
+                return None
+            if size == last_size and abs(interval_ms - last_interval_ms) < (
+                last_interval_ms * self.config.hysteresis
+            ):
+                return None
+
+        self.sent = (interval_ms, size)
+        self.sent_at = now
+        return {"type": "rate", "interval_ms": interval_ms, "size": size}
+
+    def as_dict(self) -> dict:
+        interval_ms, size = self.sent or (None, None)
+        return {
+            "interval_ms": interval_ms,
+            "size": size,
+            "redundant_rate": round(self.redundant_rate, 3),
+        }
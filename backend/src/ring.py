@@ -0,0 +1,59 @@
+import mmap
+import os
+import tempfile
+import uuid
+
+# tmpfs, so the ring never touches disk; other platforms fall back to the temp dir
+RING_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+
+
+class FrameRing:
+    # Fixed-size frame slots in one shared mapping. A front end creates it and copies
+    # each frame in once; the inference process maps the same pages and reads in place
+    def __init__(
+        self, path: str, slots: int, slot_bytes: int, create: bool = False
+    ) -> None:
+        self.path = path
+        self.slots = slots
+        self.slot_bytes = slot_bytes
+
+        with open(path, "w+b" if create else "r+b") as f:
+            if create:
+                f.truncate(slots * slot_bytes)
+            self.map = mmap.mmap(f.fileno(), slots * slot_bytes)
+        self.buffer = memoryview(self.map)
+
+    @classmethod
+    def create(cls, slots: int, slot_bytes: int) -> "FrameRing":
+        path = os.path.join(RING_DIR, f"iris-ring-{uuid.uuid4().hex}")
+        return cls(path, slots, slot_bytes, create=True)
+
+    def write(self, slot: int, data: bytes | memoryview) -> int:
+        length = len(data)
+        if length > self.slot_bytes:
+            raise ValueError(
+                f"Frame of {length} bytes exceeds the {self.slot_bytes} byte ring slot"
+            )
+
+        offset = slot * self.slot_bytes
+        self.buffer[offset : offset + length] = data
+        return length
+
+    def view(self, slot: int, length: int) -> memoryview:
+        offset = slot * self.slot_bytes
+        return self.buffer[offset : offset + length]
+
+    def unlink(self) -> None:
+        # Existing mappings stay valid; this only stops the file outliving both processes
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+    def close(self) -> None:
+        try:
+            self.buffer.release()
+            self.map.close()
+        except BufferError:
+            # A frame view is still alive somewhere; the mapping goes when it does
+            pass
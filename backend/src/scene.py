@@ -0,0 +1,192 @@
+import cv2
+import numpy as np
+
+from PIL import Image
+from typing import NamedTuple
+from config import SceneConfig
+
+# Same geometry as imagehash.phash: an 8x8 low-frequency block of a 32x32 DCT
+HASH_SIZE = 8
+PHASH_SIZE = HASH_SIZE * 4
+
+
+def _dct_matrix(n: int) -> np.ndarray:
+    # Unnormalized DCT-II, matching scipy.fftpack.dct's default scaling
+    k = np.arange(n)[:, None]
+    i = np.arange(n)[None, :]
+    return 2.0 * np.cos(np.pi * k * (2 * i + 1) / (2 * n))
+
+
+DCT = _dct_matrix(PHASH_SIZE)[:HASH_SIZE]
+
+# Per-byte popcounts for NumPy builds without bitwise_count
+POPCOUNT_TABLE = np.array([bin(n).count("1") for n in range(256)], dtype=np.uint8)
+
+
+def popcount(values: np.ndarray) -> np.ndarray:
+    values = np.asarray(values, dtype=np.uint64)
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+
+    as_bytes = values.reshape(-1, 1).view(np.uint8)
+    return POPCOUNT_TABLE[as_bytes].sum(axis=1).reshape(values.shape)
+
+
+def pack_bits(bits: np.ndarray) -> np.ndarray:
+    # (N, 64) booleans -> N big-endian packed uint64 hashes
+    return np.packbits(bits, axis=1).view(">u8").astype(np.uint64).ravel()
+
+
+def thumbnails(images: list[Image.Image], size: tuple[int, int]) -> np.ndarray:
+    # Grayscale with PIL's luma weights, then area-downsample to (width, height)
+    return np.stack(
+        [
+            cv2.resize(
+                np.asarray(image.convert("L"), dtype=np.float32),
+                size,
+                interpolation=cv2.INTER_AREA,
+            )
+            for image in images
+        ]
+    )
+
+
+def phash_batch(pixels: np.ndarray) -> np.ndarray:
+    # Only the low-frequency rows/columns of the 2D DCT are computed
+    low = DCT @ pixels @ DCT.T
+    low = low.reshape(len(pixels), -1)
+    return pack_bits(low > np.median(low, axis=1, keepdims=True))
+
+
+def dhash_batch(pixels: np.ndarray) -> np.ndarray:
+    # Horizontal gradient signs over a (HASH_SIZE + 1) x HASH_SIZE thumbnail
+    bits = pixels[:, :, 1:] > pixels[:, :, :-1]
+    return pack_bits(bits.reshape(len(pixels), -1))
+
+
+def phash(images: list[Image.Image]) -> np.ndarray:
+    return phash_batch(thumbnails(images, (PHASH_SIZE, PHASH_SIZE)))
+
+
+def dhash(images: list[Image.Image]) -> np.ndarray:
+    return dhash_batch(thumbnails(images, (HASH_SIZE + 1, HASH_SIZE)))
+
+
+class Region(NamedTuple):
+    # Box as fractions of the frame, so it applies to the upload at any resolution
+    x: float
+    y: float
+    width: float
+    height: float
+
+    @property
+    def area(self) -> float:
+        return self.width * self.height
+
+    @property
+    def direction(self) -> str:
+        center = self.x + self.width / 2
+        if center < 1 / 3:
+            return "left"
+        if center > 2 / 3:
+            return "right"
+        return "center"
+
+
+def change_map(previous: np.ndarray, current: np.ndarray, tiles: int) -> np.ndarray:
+    # Mean absolute luma difference per tile of two square grayscale thumbnails
+    size = len(current) // tiles
+    diff = np.abs(current - previous)[: size * tiles, : size * tiles]
+    return diff.reshape(tiles, size, tiles, size).mean(axis=(1, 3))
+
+
+def change_region(changes: np.ndarray, config: SceneConfig) -> Region | None:
+    # Bounding box of the changed tiles
+    changed = changes >= config.tile_threshold
+    if not changed.any():
+        return None
+
+    tiles = len(changes)
+    rows = np.flatnonzero(changed.any(axis=1))
+    columns = np.flatnonzero(changed.any(axis=0))
+    top, bottom = int(rows[0]), int(rows[-1]) + 1
+    left, right = int(columns[0]), int(columns[-1]) + 1
+
+    region = Region(
+        left / tiles, top / tiles, (right - left) / tiles, (bottom - top) / tiles
+    )
+    if region.area > config.max_region_area:
+        return None
+    return region
+
+
+class HashRing:
+    def __init__(self, size: int) -> None:
+        self.hashes = np.zeros(size, dtype=np.uint64)
+        self.count = 0
+        self.index = 0
+
+    def distances(self, value: np.uint64) -> np.ndarray:
+        return popcount(self.hashes[: self.count] ^ value)
+
+    def push(self, value: np.uint64) -> None:
+        self.hashes[self.index] = value
+        self.index = (self.index + 1) % len(self.hashes)
+        self.count = min(self.count + 1, len(self.hashes))
+
+
+class SceneChange(NamedTuple):
+    similar: bool
+    significant: bool
+    hash: int | None
+
+    # Part of the frame that changed, unless the whole scene did
+    region: Region | None = None
+
+
+class SceneDetector:
+    def __init__(self, config: SceneConfig) -> None:
+        self.config = config
+        self.phashes = HashRing(config.history)
+        self.dhashes = HashRing(config.history)
+
+        # Thumbnail of the last accepted frame, for the per-tile change map
+        self.previous = None
+
+    def differs(self, image: Image.Image, reference: int) -> bool:
+        # Compares without touching the history, so it can run beside check()
+        distance = popcount(phash([image])[0] ^ np.uint64(reference))
+        return bool(distance >= self.config.different_threshold)
+
+    def check(self, image: Image.Image) -> SceneChange:
+        # Cheap gradient hash first; near-duplicates never reach the DCT
+        if self.config.dhash_threshold is not None:
+            new_dhash = dhash([image])[0]
+            distances = self.dhashes.distances(new_dhash)
+            if distances.size and distances.min() <= self.config.dhash_threshold:
+                return SceneChange(True, False, None)
+
+        pixels = thumbnails([image], (PHASH_SIZE, PHASH_SIZE))
+        new_hash = phash_batch(pixels)[0]
+        distances = self.phashes.distances(new_hash)
+
+        # Too similar to any recent frame
+        if distances.size and distances.min() <= self.config.similar_threshold:
+            return SceneChange(True, False, int(new_hash))
+
+        # "Very different" from at least one recent frame
+        significant = bool(
+            distances.size and distances.max() >= self.config.different_threshold
+        )
+
+        region = None
+        if self.previous is not None:
+            changes = change_map(self.previous, pixels[0], self.config.tiles)
+            region = change_region(changes, self.config)
+
+        self.phashes.push(new_hash)
+        if self.config.dhash_threshold is not None:
+            self.dhashes.push(new_dhash)
+        self.previous = pixels[0]
+
+        return SceneChange(False, significant, int(new_hash), region)
@@ -0,0 +1,90 @@
+import asyncio
+
+from collections.abc import AsyncGenerator, AsyncIterator
+from config import SpeculationConfig
+from models.base import FrameStatus
+
+
+class SpeculationStats:
+    def __init__(self) -> None:
+        self.speculated = 0
+        self.committed = 0
+        self.discarded = 0
+
+    def as_dict(self) -> dict[str, int]:
+        return {
+            "speculated": self.speculated,
+            "committed": self.committed,
+            "discarded": self.discarded,
+        }
+
+
+# Process-wide totals across every connection's policy
+SPECULATION_TOTALS = SpeculationStats()
+
+
+class SpeculationPolicy:
+    def __init__(
+        self, config: SpeculationConfig, totals: SpeculationStats = SPECULATION_TOTALS
+    ) -> None:
+        self.config = config
+
+        # Start out assuming hazards so the first frames get the fast path
+        self.hazard_rate = 1.0
+        self.alpha = 2 / (config.window + 1)
+
+        self.stats = SpeculationStats()
+        self.totals = totals
+
+    def _count(self, name: str) -> None:
+        setattr(self.stats, name, getattr(self.stats, name) + 1)
+        setattr(self.totals, name, getattr(self.totals, name) + 1)
+
+    def should_speculate(self, significant: bool) -> bool:
+        if self.config.mode == "never":
+            return False
+
+        # A significant change is captioned whatever the verdict, so it never wastes work
+        if self.config.mode == "always" or significant:
+            return True
+
+        return self.hazard_rate >= self.config.hazard_rate_threshold
+
+    def record(self, status: FrameStatus) -> None:
+        # Exponentially weighted hazard rate over roughly the last `window` verdicts
+        hazard = 1.0 if status == FrameStatus.Hazard else 0.0
+        self.hazard_rate += self.alpha * (hazard - self.hazard_rate)
+
+    def speculated(self) -> None:
+        self._count("speculated")
+
+    def committed(self) -> None:
+        self._count("committed")
+
+    def discarded(self) -> None:
+        self._count("discarded")
+
+
+class TokenBuffer:
+    # Runs a caption ahead of its verdict, holding tokens until they are claimed
+    def __init__(self, tokens: AsyncGenerator[str, None]) -> None:
+        self.queue = asyncio.Queue()
+        self.task = asyncio.get_running_loop().create_task(self._fill(tokens))
+
+    async def _fill(self, tokens: AsyncGenerator[str, None]) -> None:
+        try:
+            async for token in tokens:
+                self.queue.put_nowait(token)
+        except Exception as e:
+            self.queue.put_nowait(e)
+        else:
+            self.queue.put_nowait(None)
+
+    async def drain(self) -> AsyncIterator[str]:
+        while (item := await self.queue.get()) is not None:
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def cancel(self) -> None:
+        self.task.cancel()
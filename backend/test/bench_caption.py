@@ -0,0 +1,106 @@
+import argparse
+import statistics
+import sys
+import threading
+import time
+
+sys.path.insert(0, "src")
+
+from models.batching import BatchDecoder, CaptionEngine, Sequence
+
+
+class StubDecoder(BatchDecoder):
+    # Simulates a decoder whose step cost is dominated by a fixed per-step overhead
+    def __init__(self, prefill_ms: float, step_ms: float, per_seq_ms: float) -> None:
+        self.prefill_ms = prefill_ms
+        self.step_ms = step_ms
+        self.per_seq_ms = per_seq_ms
+        self.eos_token_ids = {0}
+
+    def prefill(self, sequence: Sequence) -> int:
+        time.sleep(self.prefill_ms / 1000)
+        return 1
+
+    def decode(self, sequences: list[Sequence]) -> list[int]:
+        time.sleep((self.step_ms + self.per_seq_ms * len(sequences)) / 1000)
+        return [len(sequence.token_ids) + 1 for sequence in sequences]
+
+    def detokenize(self, token_ids: list[int]) -> str:
+        return " ".join(str(token_id) for token_id in token_ids) + " "
+
+
+def run(engine: CaptionEngine, make_request, clients: int, captions: int) -> dict:
+    first_token_times = []
+    lock = threading.Lock()
+
+    def client() -> None:
+        for _ in range(captions):
+            sequence = engine.submit(make_request())
+            for _ in sequence:
+                pass
+
+            with lock:
+                first_token_times.append(
+                    sequence.first_token_at - sequence.submitted_at
+                )
+
+    start = time.perf_counter()
+    threads = [threading.Thread(target=client) for _ in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    tokens = engine.stats.tokens
+    return {
+        "tokens_per_sec": tokens / elapsed,
+        "ttft_p50_ms": statistics.median(first_token_times) * 1000,
+        "ttft_max_ms": max(first_token_times) * 1000,
+        "mean_batch_size": engine.stats.as_dict()["mean_batch_size"],
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--llava", action="store_true", help="Use LlavaModel")
+    parser.add_argument("--clients", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--captions", type=int, default=4)
+    parser.add_argument("--prefill-ms", type=float, default=30.0)
+    parser.add_argument("--step-ms", type=float, default=15.0)
+    parser.add_argument("--per-seq-ms", type=float, default=1.0)
+    args = parser.parse_args()
+
+    if args.llava:
+        import io
+
+        from models.base import Frame
+        from models.llava import LlavaModel
+        from PIL import Image
+
+        model = LlavaModel()
+        buffer = io.BytesIO()
+        Image.new("RGB", (128, 128), color="white").save(buffer, format="PNG")
+
+        # A fresh frame per caption, so each one pays for its own vision pass
+        decoder = model
+        make_request = lambda: Frame(buffer.getvalue())
+    else:
+        decoder = StubDecoder(args.prefill_ms, args.step_ms, args.per_seq_ms)
+        make_request = lambda: None
+
+    for clients in args.clients:
+        for max_batch_size in sorted({1, clients}):
+            engine = CaptionEngine(decoder, max_batch_size=max_batch_size)
+            result = run(engine, make_request, clients, args.captions)
+            print(
+                f"clients={clients} max_batch_size={max_batch_size} "
+                f"tokens/s={result['tokens_per_sec']:.1f} "
+                f"ttft_p50={result['ttft_p50_ms']:.1f}ms "
+                f"ttft_max={result['ttft_max_ms']:.1f}ms "
+                f"batch={result['mean_batch_size']:.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
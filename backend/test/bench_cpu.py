@@ -0,0 +1,122 @@
+import argparse
+import statistics
+import sys
+import time
+import cv2
+import torch
+
+sys.path.insert(0, "src")
+
+from models.base import Frame
+from models.device import DeviceBackend
+from models.llava import LlavaModel
+
+
+class AttentionPool(torch.nn.Module):
+    # Shaped like SigLIP's pooling head: attention whose out_proj is a Linear subclass
+    def __init__(self, width: int = 64) -> None:
+        super().__init__()
+        self.attention = torch.nn.MultiheadAttention(width, 4, batch_first=True)
+        self.mlp = torch.nn.Linear(width, width)
+        self.head = torch.nn.Linear(width, 8)
+
+    def get_output_embeddings(self) -> torch.nn.Module:
+        return self.head
+
+    def forward(self, x: torch.Tensor) -> torch.Tensor:
+        x, _ = self.attention(x, x, x)
+        return self.head(self.mlp(x))
+
+
+def check_quantized_forward() -> None:
+    # One forward through an int8 model before spending minutes loading the real one
+    torch.manual_seed(0)
+    model = AttentionPool()
+    inputs = torch.randn(1, 16, 64)
+    with torch.inference_mode():
+        expected = model(inputs)
+        quantized = DeviceBackend("cpu", quantize=True).prepare(model)
+        error = (quantized(inputs) - expected).abs().max().item()
+    print(f"int8 smoke forward: max abs error {error:.4f}")
+
+
+def load_frames(video_path: str, count: int) -> list[bytes]:
+    # Evenly spaced JPEG frames, encoded the same way test/video.py sends them
+    capture = cv2.VideoCapture(video_path)
+    total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or count
+    step = max(1, total // count)
+
+    frames = []
+    index = 0
+    while len(frames) < count:
+        ret, frame = capture.read()
+        if not ret:
+            break
+
+        if index % step == 0:
+            ret, buffer = cv2.imencode(".jpg", frame)
+            if ret:
+                frames.append(buffer.tobytes())
+        index += 1
+
+    capture.release()
+    return frames
+
+
+def measure(model: LlavaModel, frames: list[bytes]) -> dict:
+    classify_times = []
+    first_token_times = []
+    caption_times = []
+
+    for data in frames:
+        # Fresh frames so the shared image features aren't reused across timings
+        start = time.perf_counter()
+        model.classify(Frame(data))
+        classify_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        first_token = None
+        for _ in model.caption(Frame(data)):
+            first_token = first_token or time.perf_counter()
+        caption_times.append(time.perf_counter() - start)
+        first_token_times.append((first_token or time.perf_counter()) - start)
+
+    return {
+        "classify_ms": statistics.median(classify_times) * 1000,
+        "caption_ttft_ms": statistics.median(first_token_times) * 1000,
+        "caption_ms": statistics.median(caption_times) * 1000,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--video", default="data/video/broll.mp4")
+    parser.add_argument("--frames", type=int, default=10)
+    parser.add_argument("--threads", type=int, default=None)
+    args = parser.parse_args()
+
+    check_quantized_forward()
+    frames = load_frames(args.video, args.frames)
+    if not frames:
+        print(f"{args.video}: no frames decoded")
+        return
+
+    baseline = None
+    for name, quantize in [("fp32", False), ("int8", True)]:
+        model = LlavaModel(device="cpu", quantize=quantize, threads=args.threads)
+        model.warmup()
+
+        result = measure(model, frames)
+        baseline = baseline or result
+        speedups = " ".join(
+            f"{key}={baseline[key] / value:.2f}x" for key, value in result.items()
+        )
+        print(
+            f"{name} threads={model.backend.threads}: "
+            + " ".join(f"{key}={value:.1f}" for key, value in result.items())
+            + f" speedup vs fp32: {speedups}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import argparse
+import io
+import sys
+import time
+import uuid
+import cv2
+import numpy as np
+
+sys.path.insert(0, "src")
+
+from PIL import Image
+from models.base import Frame
+from models.decode import RAW_HEADER, PixelFormat, parse_raw
+
+
+def load_payloads(video_path: str, count: int) -> list[bytes]:
+    # Encode frames the same way test/video.py does before sending them
+    capture = cv2.VideoCapture(video_path)
+    total = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or count
+    step = max(1, total // count)
+
+    payloads = []
+    index = 0
+    while len(payloads) < count:
+        ret, frame = capture.read()
+        if not ret:
+            break
+
+        if index % step == 0:
+            ret, buffer = cv2.imencode(".jpg", frame)
+            if ret:
+                payloads.append(f"{uuid.uuid4()}|".encode() + buffer.tobytes())
+        index += 1
+
+    capture.release()
+    return payloads
+
+
+def raw_payloads(payloads: list[bytes], format: PixelFormat) -> list[bytes]:
+    # What a raw-upload client sends instead: pixels already resized to 128x128
+    raws = []
+    for payload in payloads:
+        caption_id, data = payload.split(b"|", 1)
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        frame = cv2.resize(frame, (128, 128), interpolation=cv2.INTER_AREA)
+        if format == PixelFormat.RGB:
+            pixels = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        else:
+            pixels = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+        header = RAW_HEADER.pack(format, 128, 128)
+        raws.append(caption_id + b"|" + header + pixels.tobytes())
+    return raws
+
+
+def legacy(payload: bytes) -> Image.Image:
+    parts = payload.split(b"|", 1)
+    image = Image.open(io.BytesIO(parts[1])).convert("RGB").resize((128, 128))
+    return image
+
+
+def fast(payload: bytes) -> Image.Image:
+    separator = payload.find(b"|", 0, 64)
+    return Frame(memoryview(payload)[separator + 1 :]).as_image()
+
+
+def raw(payload: bytes) -> Image.Image:
+    separator = payload.find(b"|", 0, 64)
+    layout, pixels = parse_raw(memoryview(payload)[separator + 1 :])
+    return Frame(pixels, layout).as_image()
+
+
+def measure(func, payloads: list[bytes], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for payload in payloads:
+            func(payload)
+    return (time.perf_counter() - start) / (repeat * len(payloads)) * 1000
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "videos", nargs="*", default=["data/video/broll.mp4", "data/video/nyc.mp4"]
+    )
+    parser.add_argument("--frames", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    for video_path in args.videos:
+        payloads = load_payloads(video_path, args.frames)
+        if not payloads:
+            print(f"{video_path}: no frames decoded")
+            continue
+
+        size = Image.open(io.BytesIO(payloads[0].split(b"|", 1)[1])).size
+        legacy_ms = measure(legacy, payloads, args.repeat)
+        fast_ms = measure(fast, payloads, args.repeat)
+        rgb_ms = measure(raw, raw_payloads(payloads, PixelFormat.RGB), args.repeat)
+        yuv_ms = measure(raw, raw_payloads(payloads, PixelFormat.YUV420), args.repeat)
+        print(
+            f"{video_path} {size[0]}x{size[1]}: legacy={legacy_ms:.2f}ms "
+            f"fast={fast_ms:.2f}ms speedup={legacy_ms / fast_ms:.1f}x "
+            f"raw rgb={rgb_ms:.3f}ms yuv420={yuv_ms:.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+import argparse
+import asyncio
+import io
+import random
+import statistics
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, "src")
+
+from PIL import Image
+from concurrent.futures import ThreadPoolExecutor
+from config import ServerConfig, SpeculationConfig
+from main import Server
+from models.base import CancelToken, DeviceModel, Frame, FrameStatus
+from models.registry import ModelRegistry
+
+
+class StubModel(DeviceModel):
+    # Classification costs a fixed round trip; captions prefill, then stream steadily
+    def __init__(
+        self,
+        classify_ms: float,
+        prefill_ms: float,
+        token_ms: float,
+        tokens: int,
+        hazard_rate: float,
+    ) -> None:
+        self.classify_ms = classify_ms
+        self.prefill_ms = prefill_ms
+        self.token_ms = token_ms
+        self.tokens = tokens
+        self.hazard_rate = hazard_rate
+        self.caption_tokens = 0
+
+    def warmup(self) -> None:
+        pass
+
+    def classify(self, frame: Frame) -> FrameStatus:
+        time.sleep(self.classify_ms / 1000)
+        if random.random() < self.hazard_rate:
+            return FrameStatus.Hazard
+        return FrameStatus.Safe
+
+    def caption(self, frame: Frame, cancel: CancelToken | None = None):
+        time.sleep(self.prefill_ms / 1000)
+        for i in range(self.tokens):
+            if cancel is not None and cancel.cancelled:
+                return
+            time.sleep(self.token_ms / 1000)
+            self.caption_tokens += 1
+            yield f"token{i} "
+
+
+class RecordingTransport:
+    def __init__(self) -> None:
+        self.first_message_at = None
+
+    def send(self, msg_type, payload: bytes) -> None:
+        if self.first_message_at is None:
+            self.first_message_at = time.perf_counter()
+
+
+def noise_frames(count: int) -> list[bytes]:
+    # Independent noise images are neither similar nor significantly different
+    frames = []
+    for _ in range(count):
+        pixels = np.random.randint(0, 256, (128, 128, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG")
+        frames.append(buffer.getvalue())
+    return frames
+
+
+async def run(
+    mode: str, captioner: StubModel, classifier: StubModel, frames: list[bytes]
+) -> dict:
+    config = ServerConfig(speculation=SpeculationConfig(mode=mode))
+    executor = ThreadPoolExecutor(4)
+
+    # Separate caption and classify models, as by default, so a device model's
+    # worker isn't shared and a speculative caption runs alongside classification
+    server = Server(ModelRegistry.loaded(captioner, classifier), executor, config)
+    server.transport = RecordingTransport()
+    server.connected = True
+    server.loop = asyncio.get_running_loop()
+
+    captioner.caption_tokens = 0
+    first_token_times = []
+    for i, data in enumerate(frames):
+        server.transport.first_message_at = None
+        start = time.perf_counter()
+        await server.handle_frame(Frame(data), str(i), start)
+        if server.transport.first_message_at is not None:
+            first_token_times.append(server.transport.first_message_at - start)
+
+    # Let cancelled speculative captions settle before counting their tokens
+    executor.shutdown(wait=True)
+    return {
+        "captions": len(first_token_times),
+        "ttft_p50_ms": (
+            statistics.median(first_token_times) * 1000 if first_token_times else None
+        ),
+        "caption_tokens": captioner.caption_tokens,
+        **server.speculation.stats.as_dict(),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--frames", type=int, default=40)
+    parser.add_argument("--classify-ms", type=float, default=300.0)
+    parser.add_argument("--prefill-ms", type=float, default=150.0)
+    parser.add_argument("--token-ms", type=float, default=20.0)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--hazard-rates", type=float, nargs="+", default=[0.1, 0.5])
+    args = parser.parse_args()
+
+    frames = noise_frames(args.frames)
+    for hazard_rate in args.hazard_rates:
+        for mode in ["never", "auto", "always"]:
+            random.seed(0)
+            captioner, classifier = (
+                StubModel(
+                    args.classify_ms,
+                    args.prefill_ms,
+                    args.token_ms,
+                    args.tokens,
+                    hazard_rate,
+                )
+                for _ in range(2)
+            )
+            result = asyncio.run(run(mode, captioner, classifier, frames))
+            print(f"hazard_rate={hazard_rate} mode={mode}: {result}")
+
+
+if __name__ == "__main__":
+    main()
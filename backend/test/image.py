@@ -3,6 +3,7 @@ import time
 import picows
 import uvloop
 import argparse
+import uuid
 
 from pathlib import Path
 
@@ -14,6 +15,7 @@ class Client(picows.WSListener):
         self.start_time = None
         self.first_token_time = None
         self.transport = None
+        self.caption_id = str(uuid.uuid4())
 
     def on_ws_connected(self, transport: picows.WSTransport):
         self.transport = transport
@@ -29,14 +31,18 @@ class Client(picows.WSListener):
 
             print("Connected to server, sending image...")
             self.start_time = time.perf_counter()
-            transport.send(picows.WSMsgType.BINARY, image_bytes)
+            transport.send(
+                picows.WSMsgType.BINARY, f"{self.caption_id}|".encode() + image_bytes
+            )
         except Exception as e:
             print(f"Error reading image: {e}")
             transport.disconnect()
 
     def on_ws_frame(self, transport: picows.WSTransport, frame: picows.WSFrame):
         if frame.msg_type == picows.WSMsgType.TEXT:
-            token = frame.get_payload_as_ascii_text()
+            caption_id, token = frame.get_payload_as_utf8_text().split("|", 1)
+            if caption_id != self.caption_id:
+                return
 
             if token == "<end>":
                 total_time = time.perf_counter() - self.start_time
@@ -57,17 +63,16 @@ class Client(picows.WSListener):
             transport.send_pong(frame.get_payload_as_bytes())
 
 
-async def main(image_path: str):
-    transport, _ = await picows.ws_connect(
-        lambda: Client(image_path), "ws://127.0.0.1:9001"
-    )
+async def main(image_path: str, url: str):
+    transport, _ = await picows.ws_connect(lambda: Client(image_path), url)
     await transport.wait_disconnected()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument("image_path", help="Path to the image file to caption")
+    parser.add_argument("--url", default="ws://127.0.0.1:2222")
     args = parser.parse_args()
 
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
-    asyncio.run(main(args.image_path))
+    asyncio.run(main(args.image_path, args.url))
@@ -0,0 +1,525 @@
+import argparse
+import asyncio
+import io
+import json
+import multiprocessing
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import cv2
+import numpy as np
+import picows
+import uvloop
+
+sys.path.insert(0, "src")
+
+from PIL import Image
+from bench_caption import StubDecoder
+from models.base import CancelToken, DeviceModel, Frame, FrameStatus
+from models.decode import RAW_HEADER, PixelFormat
+from models.batching import CaptionEngine
+from protocol import EndReason, MessageType, decode
+
+
+class StubModel(DeviceModel):
+    # Classifies with a fixed delay and captions through the real batching engine
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.model_id = "stub"
+        self.classify_ms = args.classify_ms
+        self.classify_per_frame_ms = args.classify_per_frame_ms
+        self.hazard_rate = args.hazard_rate
+
+        # Forward passes share one device, so concurrent classifies queue up like on a GPU
+        self.device = threading.Lock()
+        self.engine = CaptionEngine(
+            StubDecoder(args.prefill_ms, args.step_ms, args.per_seq_ms),
+            max_batch_size=args.max_batch_size,
+        )
+
+    def warmup(self) -> None:
+        pass
+
+    def verdict(self) -> FrameStatus:
+        if random.random() < self.hazard_rate:
+            return FrameStatus.Hazard
+        return FrameStatus.Safe
+
+    def classify(self, frame: Frame) -> FrameStatus:
+        with self.device:
+            time.sleep(self.classify_ms / 1000)
+        return self.verdict()
+
+    def classify_batch(self, frames: list[Frame]) -> list[FrameStatus]:
+        # A batched pass costs one fixed overhead plus a little per extra frame
+        extra = self.classify_per_frame_ms * (len(frames) - 1)
+        with self.device:
+            time.sleep((self.classify_ms + extra) / 1000)
+        return [self.verdict() for _ in frames]
+
+    def caption(self, frame: Frame, cancel: CancelToken | None = None):
+        yield from self.engine.submit(None, cancel)
+
+    def stream_caption(self, frame: Frame, cancel: CancelToken | None, worker):
+        return self.engine.submit(None, cancel, asyncio.get_running_loop())
+
+
+def serve_stub(port: int, args: argparse.Namespace, socket_path: str = None) -> None:
+    # Runs in its own process so the server's loop doesn't share a core with the clients
+    from concurrent.futures import ThreadPoolExecutor
+    from batcher import ClassifyBatcher
+    from config import BatchConfig, CacheConfig, InferenceConfig, ServerConfig
+    from main import Server, main as serve_front_end
+    from models.registry import ModelRegistry
+
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    if socket_path is not None:
+        # Front end only; the stub model lives in the inference process
+        config = ServerConfig(
+            port=port,
+            metrics_port=0,
+            cache=CacheConfig(enabled=False),
+            inference=InferenceConfig(socket=socket_path, frontends=args.frontends),
+        )
+        asyncio.run(serve_front_end(config))
+        return
+
+    model = StubModel(args)
+    config = ServerConfig(port=port)
+    executor = ThreadPoolExecutor(config.workers, thread_name_prefix="inference")
+    batcher = None
+    if not args.no_classify_batching:
+        batcher = ClassifyBatcher(BatchConfig())
+
+    async def serve() -> None:
+        # One registry for every connection, so they share the model's worker
+        models = ModelRegistry.loaded(model, model)
+        server = await picows.ws_create_server(
+            lambda _: Server(models, executor, config, batcher=batcher),
+            "127.0.0.1",
+            port,
+        )
+        await server.serve_forever()
+
+    asyncio.run(serve())
+
+
+def serve_stub_inference(socket_path: str, args: argparse.Namespace) -> None:
+    from config import BatchConfig, InferenceConfig, ServerConfig
+    from inference import serve_inference
+    from models.registry import ModelRegistry
+
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")
+
+    model = StubModel(args)
+    config = ServerConfig(
+        metrics_port=0,
+        batching=BatchConfig(enabled=not args.no_classify_batching),
+        inference=InferenceConfig(socket=socket_path),
+    )
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(serve_inference(ModelRegistry.loaded(model, model), config))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def synthetic_frames(count: int, size: int) -> list[bytes]:
+    # Independent noise images: never similar, so every frame reaches classification
+    frames = []
+    for _ in range(count):
+        pixels = np.random.randint(0, 256, (size, size, 3), dtype=np.uint8)
+        buffer = io.BytesIO()
+        Image.fromarray(pixels).save(buffer, format="JPEG")
+        frames.append(buffer.getvalue())
+    return frames
+
+
+def video_frames(video_path: str, fps: float, size: int | None) -> list[bytes]:
+    # Sample the video at the replay rate so scene changes happen at real-world pace
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise ValueError(f"Error opening video file {video_path}")
+
+    video_fps = capture.get(cv2.CAP_PROP_FPS) or 30
+    step = max(1, round(video_fps / fps))
+
+    frames = []
+    index = 0
+    while True:
+        ret, frame = capture.read()
+        if not ret:
+            break
+
+        if index % step == 0:
+            if size:
+                frame = cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+            ret, buffer = cv2.imencode(".jpg", frame)
+            if ret:
+                frames.append(buffer.tobytes())
+        index += 1
+
+    capture.release()
+    return frames
+
+
+def raw_frames(frames: list[bytes], upload: str) -> list[bytes]:
+    # The same frames as a raw-upload client would send them, already at frame size
+    raws = []
+    for data in frames:
+        frame = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        height, width = frame.shape[:2]
+        if upload == "yuv420":
+            format = PixelFormat.YUV420
+            pixels = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+        else:
+            format = PixelFormat.RGB
+            pixels = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        raws.append(RAW_HEADER.pack(format, width, height) + pixels.tobytes())
+    return raws
+
+
+class FrameRecord:
+    def __init__(self, sent_at: float) -> None:
+        self.sent_at = sent_at
+        self.detected_at = None
+        self.first_token_at = None
+        self.ended_at = None
+        self.tokens = 0
+        self.preempted = False
+        self.truncated = False
+        self.error = False
+
+
+class Headset(picows.WSListener):
+    # One simulated headset streaming frames at a fixed rate
+    def __init__(
+        self, frames: list[bytes], args: argparse.Namespace, done: asyncio.Future
+    ) -> None:
+        super().__init__()
+        self.frames = frames
+        self.args = args
+        self.done = done
+
+        self.records = {}
+        self.streams = {}
+
+        # Changed by the server's rate messages when rate control is on
+        self.interval = 1 / args.fps
+        self.bytes_sent = 0
+
+    def on_ws_connected(self, transport: picows.WSTransport) -> None:
+        raw = self.args.upload != "jpeg"
+        if self.args.framing == "binary" or self.args.rate_control or raw:
+            hello = {
+                "type": "hello",
+                "framing": self.args.framing,
+                "coalesce_ms": self.args.coalesce_ms,
+                "rate_control": self.args.rate_control,
+                "upload": "raw" if raw else "jpeg",
+            }
+            transport.send(picows.WSMsgType.TEXT, json.dumps(hello).encode())
+
+        asyncio.get_running_loop().create_task(self.send_frames(transport))
+
+    def on_ws_disconnected(self, transport: picows.WSTransport) -> None:
+        if not self.done.done():
+            self.done.set_result(self)
+
+    async def send_frames(self, transport: picows.WSTransport) -> None:
+        # Random phase and starting frame so headsets don't move in lockstep
+        await asyncio.sleep(random.random() * self.interval)
+        index = random.randrange(len(self.frames))
+
+        start = time.perf_counter()
+        next_send = start
+        while next_send - start < self.args.duration:
+            caption_id = str(uuid.uuid4())
+            self.records[caption_id] = FrameRecord(time.perf_counter())
+            payload = f"{caption_id}|".encode() + self.frames[index]
+            transport.send(picows.WSMsgType.BINARY, payload)
+            self.bytes_sent += len(payload)
+
+            index = (index + 1) % len(self.frames)
+            next_send += self.interval
+            await asyncio.sleep(max(0.0, next_send - time.perf_counter()))
+
+        # Give in-flight captions time to finish before hanging up
+        await asyncio.sleep(self.args.drain)
+        transport.disconnect()
+
+    def on_token(self, record: FrameRecord, now: float) -> None:
+        if record.first_token_at is None:
+            record.first_token_at = now
+        record.tokens += 1
+
+    def on_ws_frame(self, transport: picows.WSTransport, frame: picows.WSFrame) -> None:
+        now = time.perf_counter()
+
+        if frame.msg_type == picows.WSMsgType.BINARY:
+            message_type, stream_id, payload = decode(frame.get_payload_as_bytes())
+            if message_type == MessageType.Hazard:
+                caption_id = bytes(payload[1:]).decode("utf-8")
+                self.streams[stream_id] = self.records.get(caption_id)
+                if self.streams[stream_id] is not None:
+                    self.streams[stream_id].detected_at = now
+                return
+
+            record = self.streams.get(stream_id)
+            if record is None:
+                return
+
+            if message_type == MessageType.Token:
+                self.on_token(record, now)
+            elif message_type == MessageType.End:
+                record.ended_at = now
+                record.preempted = payload[0] == EndReason.Preempted
+                record.truncated = payload[0] == EndReason.Truncated
+                del self.streams[stream_id]
+            elif message_type == MessageType.Error:
+                record.error = True
+                del self.streams[stream_id]
+        elif frame.msg_type == picows.WSMsgType.TEXT:
+            payload = frame.get_payload_as_utf8_text()
+            if payload.startswith("{"):
+                # Frame sizes are fixed by the replayed frames, so only the cadence adapts
+                message = json.loads(payload)
+                if message.get("type") == "rate":
+                    self.interval = message["interval_ms"] / 1000
+                return
+
+            # Legacy framing has no open message, so detection is the first token
+            caption_id, token = payload.split("|", 1)
+            if (record := self.records.get(caption_id)) is None:
+                return
+
+            if token == "<end>":
+                record.ended_at = now
+                return
+
+            record.detected_at = record.detected_at or now
+            self.on_token(record, now)
+
+
+def percentiles(values: list[float]) -> dict:
+    if not values:
+        return {"count": 0, "p50": None, "p95": None, "p99": None}
+
+    p50, p95, p99 = np.percentile(np.array(values) * 1000, [50, 95, 99])
+    return {
+        "count": len(values),
+        "p50": round(float(p50), 2),
+        "p95": round(float(p95), 2),
+        "p99": round(float(p99), 2),
+    }
+
+
+def summarize(records: list[FrameRecord], elapsed: float, args) -> dict:
+    started = [record for record in records if record.detected_at is not None]
+    completed = [record for record in started if record.ended_at is not None]
+
+    return {
+        "clients": args.clients,
+        "fps": args.fps,
+        "duration_s": args.duration,
+        "source": args.source,
+        "framing": args.framing,
+        "rate_control": args.rate_control,
+        "upload": args.upload,
+        "classify_batching": not args.no_classify_batching,
+        "frames_sent": len(records),
+        "captions_started": len(started),
+        "captions_completed": len(completed),
+        "preempted": sum(record.preempted for record in completed),
+        "truncated": sum(record.truncated for record in completed),
+        "errors": sum(record.error for record in started),
+        # Superseded, skipped as similar or safe, or unanswered before disconnect
+        "drop_rate": round(1 - len(started) / len(records), 4) if records else None,
+        "ttd_ms": percentiles([r.detected_at - r.sent_at for r in started]),
+        "ttft_ms": percentiles(
+            [r.first_token_at - r.sent_at for r in started if r.first_token_at]
+        ),
+        "caption_ms": percentiles([r.ended_at - r.sent_at for r in completed]),
+        "throughput": {
+            "frames_per_sec": round(len(records) / elapsed, 2),
+            "captions_per_sec": round(len(completed) / elapsed, 2),
+            "tokens_per_sec": round(sum(r.tokens for r in started) / elapsed, 2),
+        },
+    }
+
+
+def regressions(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    # p95 latencies and drop rate may not grow by more than the tolerance
+    failures = []
+    for metric in ("ttd_ms", "ttft_ms", "caption_ms"):
+        current, previous = report[metric]["p95"], baseline[metric]["p95"]
+        if current is not None and previous and current > previous * (1 + tolerance):
+            failures.append(f"{metric} p95 {current:.1f}ms > baseline {previous:.1f}ms")
+
+    if (
+        report["drop_rate"] is not None
+        and baseline.get("drop_rate") is not None
+        and report["drop_rate"] > baseline["drop_rate"] + tolerance
+    ):
+        failures.append(
+            f"drop_rate {report['drop_rate']} > baseline {baseline['drop_rate']}"
+        )
+
+    return failures
+
+
+async def connect(url: str, factory, timeout: float = 60.0):
+    # The stub server may still be importing when the first headset dials in
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await picows.ws_connect(factory, url)
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.2)
+
+
+async def run(url: str, frames: list[bytes], args: argparse.Namespace) -> dict:
+    loop = asyncio.get_running_loop()
+    futures = [loop.create_future() for _ in range(args.clients)]
+
+    for done in futures:
+        await connect(url, lambda done=done: Headset(frames, args, done))
+    start = time.perf_counter()
+
+    results = await asyncio.gather(*futures)
+    elapsed = time.perf_counter() - start - args.drain
+
+    records = [record for headset in results for record in headset.records.values()]
+    report = summarize(records, elapsed, args)
+    report["upload_kb"] = round(
+        sum(headset.bytes_sent for headset in results) / 1024, 1
+    )
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--url", help="Benchmark a running server instead of stubs")
+    parser.add_argument("--clients", type=int, default=8)
+    parser.add_argument("--fps", type=float, default=2.0)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument(
+        "--drain", type=float, default=3.0, help="Seconds to wait for captions"
+    )
+    parser.add_argument(
+        "--source",
+        default="data/video/broll.mp4",
+        help='Video to replay, or "synthetic" for noise frames',
+    )
+    parser.add_argument("--size", type=int, default=128, help="Frame size in pixels")
+    parser.add_argument("--framing", choices=["text", "binary"], default="binary")
+    parser.add_argument("--coalesce-ms", type=int, default=0)
+    parser.add_argument(
+        "--rate-control",
+        action="store_true",
+        help="Let the server adjust each headset's frame interval",
+    )
+    parser.add_argument("--output", help="Also write the JSON report here")
+    parser.add_argument("--baseline", help="Fail if p95s regress past this report")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    parser.add_argument("--verbose", action="store_true", help="Show server logs")
+    parser.add_argument(
+        "--frontends",
+        type=int,
+        default=0,
+        help="Serve through this many front ends and a separate model process",
+    )
+
+    # Stub model timings
+    parser.add_argument("--classify-ms", type=float, default=50.0)
+    parser.add_argument(
+        "--classify-per-frame-ms",
+        type=float,
+        default=5.0,
+        help="Added cost of each extra frame in a classify batch",
+    )
+    parser.add_argument("--no-classify-batching", action="store_true")
+    parser.add_argument("--hazard-rate", type=float, default=0.5)
+    parser.add_argument("--prefill-ms", type=float, default=30.0)
+    parser.add_argument("--step-ms", type=float, default=15.0)
+    parser.add_argument("--per-seq-ms", type=float, default=1.0)
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument(
+        "--upload",
+        choices=["jpeg", "rgb", "yuv420"],
+        default="jpeg",
+        help="Send JPEG or pre-resized raw pixels",
+    )
+    args = parser.parse_args()
+
+    if args.source == "synthetic":
+        frames = synthetic_frames(64, args.size)
+    else:
+        frames = video_frames(args.source, args.fps, args.size)
+    if args.upload != "jpeg":
+        frames = raw_frames(frames, args.upload)
+
+    servers = []
+    url = args.url
+    if url is None:
+        port = free_port()
+        url = f"ws://127.0.0.1:{port}"
+        context = multiprocessing.get_context("spawn")
+        if args.frontends:
+            socket_path = os.path.join(tempfile.gettempdir(), f"iris-load-{port}.sock")
+            servers.append(
+                context.Process(
+                    target=serve_stub_inference, args=(socket_path, args), daemon=True
+                )
+            )
+            servers += [
+                context.Process(
+                    target=serve_stub, args=(port, args, socket_path), daemon=True
+                )
+                for _ in range(args.frontends)
+            ]
+        else:
+            servers.append(
+                context.Process(target=serve_stub, args=(port, args), daemon=True)
+            )
+
+        for server in servers:
+            server.start()
+
+    try:
+        asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+        report = asyncio.run(run(url, frames, args))
+    finally:
+        for server in servers:
+            server.terminate()
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            failures = regressions(report, json.load(f), args.tolerance)
+        for failure in failures:
+            print(f"Regression: {failure}", file=sys.stderr)
+        if failures:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
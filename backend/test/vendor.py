@@ -0,0 +1,63 @@
+import argparse
+import asyncio
+import sys
+import time
+import uvloop
+
+sys.path.insert(0, "src")
+
+from models.base import Frame
+from models.groq import LlamaVisionModel
+
+
+async def main(image_path: str, base_url: str, requests: int, rpm: float) -> None:
+    model = LlamaVisionModel(base_url=base_url, requests_per_minute=rpm)
+
+    with open(image_path, "rb") as f:
+        frame = Frame(f.read())
+
+    async def run(index: int) -> None:
+        start = time.perf_counter()
+        first_token = None
+        tokens = []
+
+        try:
+            status = await model.classify(frame)
+            classified = time.perf_counter() - start
+
+            async for token in model.caption(frame):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                tokens.append(token)
+        except Exception as e:
+            print(f"[{index}] failed after {time.perf_counter() - start:.3f}s: {e}")
+            return
+
+        total = time.perf_counter() - start
+        print(
+            f"[{index}] {status} classify={classified:.3f}s "
+            f"first_token={first_token or 0:.3f}s total={total:.3f}s "
+            f"caption={''.join(tokens)!r}"
+        )
+
+    # Requests run concurrently over the model's shared connection pool
+    await asyncio.gather(*(run(index) for index in range(requests)))
+    await model.client.close()
+
+    print(f"Key pool: {model.pool.stats()}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("image_path", help="Path to the image file to send")
+    parser.add_argument(
+        "--base-url", default="http://127.0.0.1:8088/openai/v1/chat/completions"
+    )
+    parser.add_argument("--requests", type=int, default=4)
+    parser.add_argument("--requests-per-minute", type=float, default=30.0)
+    args = parser.parse_args()
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    asyncio.run(
+        main(args.image_path, args.base_url, args.requests, args.requests_per_minute)
+    )
@@ -0,0 +1,89 @@
+import argparse
+import asyncio
+import json
+import random
+
+from aiohttp import web
+
+
+class VendorStub:
+    def __init__(
+        self,
+        rate_limit_every: int,
+        retry_after: float,
+        token_delay: float,
+        first_token_delay: float = 0.0,
+    ) -> None:
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.token_delay = token_delay
+        self.first_token_delay = first_token_delay
+        self.requests = 0
+
+    async def completions(self, request: web.Request) -> web.StreamResponse:
+        payload = await request.json()
+        self.requests += 1
+
+        # Reject every Nth request the way the vendor does when a key is exhausted
+        if self.rate_limit_every and self.requests % self.rate_limit_every == 0:
+            return web.json_response(
+                {"error": {"message": "Rate limit reached"}},
+                status=429,
+                headers={
+                    "retry-after": str(self.retry_after),
+                    "x-ratelimit-remaining-requests": "0",
+                    "x-ratelimit-reset-requests": f"{self.retry_after}s",
+                },
+            )
+
+        if not payload.get("stream"):
+            answer = random.choice(["yes", "no"])
+            content = json.dumps({"reasoning": "stub", "answer": answer})
+            return web.json_response(
+                {"choices": [{"message": {"role": "assistant", "content": content}}]}
+            )
+
+        # A slow vendor: headers go out at once, the first token takes a while
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        await asyncio.sleep(self.first_token_delay)
+
+        for word in "A stub caption of a sidewalk with a cone ahead .".split():
+            chunk = {"choices": [{"delta": {"content": f"{word} "}}]}
+            event = f"data: {json.dumps(chunk)}\n\n".encode("utf-8")
+
+            # Split events across writes so clients must parse incrementally
+            middle = len(event) // 2
+            await response.write(event[:middle])
+            await asyncio.sleep(self.token_delay)
+            await response.write(event[middle:])
+
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8088)
+    parser.add_argument(
+        "--rate-limit-every", type=int, default=0, help="Answer every Nth with 429"
+    )
+    parser.add_argument("--retry-after", type=float, default=1.0)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--first-token-delay", type=float, default=0.0)
+    args = parser.parse_args()
+
+    stub = VendorStub(
+        args.rate_limit_every,
+        args.retry_after,
+        args.token_delay,
+        args.first_token_delay,
+    )
+    app = web.Application()
+    app.router.add_post("/openai/v1/chat/completions", stub.completions)
+    web.run_app(app, host="127.0.0.1", port=args.port)
+
+
+if __name__ == "__main__":
+    main()
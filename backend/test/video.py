@@ -2,19 +2,73 @@ import picows
 import asyncio
 import uvloop
 import uuid
+import json
+import sys
+import argparse
 import cv2
 
+sys.path.insert(0, "src")
+
+from models.decode import RAW_HEADER, PixelFormat
+from protocol import MessageType, decode
+
 
 class VideoClient(picows.WSListener):
-    def __init__(self) -> None:
+    def __init__(
+        self,
+        framing: str = "binary",
+        coalesce_ms: int = 30,
+        rate_control: bool = True,
+        upload: str = "rgb",
+    ) -> None:
         super().__init__()
         self.transport = None
+        self.framing = framing
+        self.coalesce_ms = coalesce_ms
+
+        # Raw uploads only start once the server has acknowledged them in its hello
+        self.upload = upload
+        self.frame_size = 128
+        self.acknowledged = asyncio.Event()
+
+        # Frame cadence and size, adjusted by the server's rate messages
+        self.rate_control = rate_control
+        self.interval = 2.0
+        self.size = None
+        self.bytes_sent = 0
+        self.finished = False
 
         # Caption metadata
         self.captions = {}
         self.curr_caption_id = None
 
+        # Binary framing maps small stream ids back to caption ids
+        self.streams = {}
+
+    def encode(self, frame) -> bytes | None:
+        if self.upload == "jpeg":
+            if self.size:
+                frame = cv2.resize(
+                    frame, (self.size, self.size), interpolation=cv2.INTER_AREA
+                )
+            ret, buffer = cv2.imencode(".jpg", frame)
+            return buffer.tobytes() if ret else None
+
+        # Resize on the client and send the pixels as they are, nothing to decode
+        size = self.size or self.frame_size
+        frame = cv2.resize(frame, (size, size), interpolation=cv2.INTER_AREA)
+        if self.upload == "yuv420":
+            format = PixelFormat.YUV420
+            pixels = cv2.cvtColor(frame, cv2.COLOR_BGR2YUV_I420)
+        else:
+            format = PixelFormat.RGB
+            pixels = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        return RAW_HEADER.pack(format, size, size) + pixels.tobytes()
+
     async def send_frames(self, transport: picows.WSTransport) -> None:
+        if self.upload != "jpeg":
+            await self.acknowledged.wait()
+
         # Open the video file
         capture = cv2.VideoCapture("data/video/broll.mp4")
         if not capture.isOpened():
@@ -22,47 +76,112 @@ class VideoClient(picows.WSListener):
 
         # Retrieve FPS of video
         fps = capture.get(cv2.CAP_PROP_FPS) if capture.get(cv2.CAP_PROP_FPS) > 0 else 30
-        interval = int(round(fps * 2))
-        print(f"Video FPS: {fps}, frames to skip: {interval}")
+        print(f"Video FPS: {fps}, sending every {self.interval}s")
         current_frame = 0
+        next_frame = 0
 
-        # Begin sending frames to server at 2 FPS
+        # Play the video back in real time, sampling it like a camera would
         while True:
             # Read the next frame from the video
             ret, frame = capture.read()
             if not ret:
                 break
 
-            # Send the current frame once per second
-            if current_frame % interval == 0:
-                ret, buffer = cv2.imencode(".jpg", frame)
-                if ret:
+            if current_frame >= next_frame:
+                data = self.encode(frame)
+                if data is not None:
                     self.curr_caption_id = str(uuid.uuid4())
-                    transport.send(
-                        picows.WSMsgType.BINARY,
-                        f"{self.curr_caption_id}|".encode() + buffer.tobytes(),
-                    )
+                    payload = f"{self.curr_caption_id}|".encode() + data
+                    transport.send(picows.WSMsgType.BINARY, payload)
+                    self.bytes_sent += len(payload)
+
+                # The interval may change while waiting, so skip ahead by the one just used
+                interval = self.interval
+                await asyncio.sleep(interval)
+                next_frame += max(1, round(fps * interval))
 
             current_frame += 1
 
         capture.release()
+        self.finished = True
+        print(f"Sent {self.bytes_sent} bytes")
 
     def on_ws_connected(self, transport: picows.WSTransport) -> None:
         print("Established connection to server")
         self.transport = transport
+
+        # Opt into binary token framing, raw uploads and rate control before any frames
+        if self.framing == "binary" or self.upload != "jpeg" or self.rate_control:
+            hello = {
+                "type": "hello",
+                "framing": self.framing,
+                "coalesce_ms": self.coalesce_ms,
+                "rate_control": self.rate_control,
+                "upload": "jpeg" if self.upload == "jpeg" else "raw",
+                "regions": True,
+            }
+            transport.send(picows.WSMsgType.TEXT, json.dumps(hello).encode())
+
         asyncio.create_task(self.send_frames(transport))
 
+    def on_caption_end(self, transport: picows.WSTransport, caption_id: str) -> None:
+        if self.finished and caption_id == self.curr_caption_id:
+            print("Received final caption, initiating disconnection")
+            transport.disconnect()
+
+    def on_control(self, message: dict) -> None:
+        if message.get("type") == "rate":
+            # Follow the server's recommended cadence and frame size
+            self.interval = message["interval_ms"] / 1000
+            self.size = message["size"]
+            print(f"Server rate: every {self.interval}s at {self.size}px")
+        elif message.get("type") == "region":
+            print(f"Change on the {message['direction']} for {message['caption_id']}")
+        else:
+            print(f"Server hello: {message}")
+
+            # An older server ignores the request and keeps expecting JPEG
+            if message.get("upload") != "raw":
+                self.upload = "jpeg"
+            elif message.get("frame_size"):
+                self.frame_size = message["frame_size"][0]
+            self.acknowledged.set()
+
+    def on_binary_message(self, transport: picows.WSTransport, data: bytes) -> None:
+        message_type, stream_id, payload = decode(data)
+
+        if message_type == MessageType.Hazard:
+            status = "hazard" if payload[0] else "safe"
+            caption_id = bytes(payload[1:]).decode("utf-8")
+            self.streams[stream_id] = caption_id
+            self.captions[caption_id] = ""
+            print(f"--- {status} frame {caption_id} (stream {stream_id})")
+        elif message_type == MessageType.Token:
+            caption_id = self.streams[stream_id]
+            self.captions[caption_id] += bytes(payload).decode("utf-8")
+            print(f"---\n{self.captions}")
+        elif message_type == MessageType.End:
+            self.on_caption_end(transport, self.streams.pop(stream_id))
+        elif message_type == MessageType.Error:
+            print(f"Server error: {bytes(payload).decode('utf-8')}")
+            if stream_id in self.streams:
+                self.on_caption_end(transport, self.streams.pop(stream_id))
+
     def on_ws_frame(self, transport: picows.WSTransport, frame: picows.WSFrame) -> None:
-        if frame.msg_type == picows.WSMsgType.TEXT:
-            payload = frame.get_payload_as_ascii_text()
-            caption_id, token = payload.split("|")
+        if frame.msg_type == picows.WSMsgType.BINARY:
+            self.on_binary_message(transport, frame.get_payload_as_bytes())
+        elif frame.msg_type == picows.WSMsgType.TEXT:
+            payload = frame.get_payload_as_utf8_text()
+            if payload.startswith("{"):
+                self.on_control(json.loads(payload))
+                return
+
+            caption_id, token = payload.split("|", 1)
             token = token.strip()
 
             # If token is the <end> token, the caption has been completed
             if token == "<end>":
-                if caption_id == self.curr_caption_id:
-                    print("Received final caption, initiating disconnection")
-                    transport.disconnect()
+                self.on_caption_end(transport, caption_id)
                 return
 
             if caption_id not in self.captions:
@@ -73,11 +192,32 @@ class VideoClient(picows.WSListener):
             print(f"---\n{self.captions}")
 
 
-async def main() -> None:
-    transport, _ = await picows.ws_connect(VideoClient, "ws://0.0.0.0:2222")
+async def main(framing: str, coalesce_ms: int, rate_control: bool, upload: str) -> None:
+    transport, _ = await picows.ws_connect(
+        lambda: VideoClient(framing, coalesce_ms, rate_control, upload),
+        "ws://0.0.0.0:2222",
+    )
     await transport.wait_disconnected()
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--framing", choices=["text", "binary"], default="binary")
+    parser.add_argument(
+        "--coalesce-ms", type=int, default=30, help="Token coalescing window"
+    )
+    parser.add_argument(
+        "--fixed-rate",
+        action="store_true",
+        help="Ignore the server's rate messages and send every 2 seconds",
+    )
+    parser.add_argument(
+        "--upload",
+        choices=["jpeg", "rgb", "yuv420"],
+        default="rgb",
+        help="Send JPEG or raw pixels resized on the client",
+    )
+    args = parser.parse_args()
+
     asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
-    asyncio.run(main())
+    asyncio.run(main(args.framing, args.coalesce_ms, not args.fixed_rate, args.upload))
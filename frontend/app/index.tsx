@@ -8,6 +8,17 @@ import { v4 as uuidv4 } from "uuid";
 import * as Speech from "expo-speech";
 import * as ImageManipulator from 'expo-image-manipulator';
 
+// Binary token framing: 1-byte message type, 2-byte big-endian stream id
+const MESSAGE_TOKEN = 1;
+const MESSAGE_END = 2;
+const MESSAGE_HAZARD = 3;
+const MESSAGE_ERROR = 4;
+const END_COMPLETE = 0;
+
+// Frame cadence and size until the server recommends otherwise
+const DEFAULT_INTERVAL_MS = 2000;
+const DEFAULT_FRAME_SIZE = 128;
+
 function base64ToArrayBuffer(base64: string) {
   const binaryString = atob(base64);
   const len = binaryString.length;
@@ -24,32 +35,73 @@ export default function Index() {
   const [isRecording, setIsRecording] = useState(false);
   const ws = useRef<WebSocket | null>(null);
   const [captions, setCaptions] = useState<Record<string, string>>({});
-  const visitedUIDs = useRef<Set<string>>(new Set());
+  const streams = useRef<Record<number, string>>({});
+  const decoder = new TextDecoder();
   const speechQueue = useRef<string[]>([]);
   const isSpeaking = useRef<boolean>(false);
+  const frameInterval = useRef<number>(DEFAULT_INTERVAL_MS);
+  const frameSize = useRef<number>(DEFAULT_FRAME_SIZE);
 
   useEffect(() => {
     ws.current = new WebSocket("ws://209.20.159.34:2222");
+    ws.current.binaryType = "arraybuffer";
     ws.current.onopen = () => {
       console.log("Connected to WebSocket server");
+
+      // Opt into binary framing with a small token coalescing window
+      // and let the server pace our frames
+      ws.current?.send(
+        JSON.stringify({
+          type: "hello",
+          framing: "binary",
+          coalesce_ms: 50,
+          rate_control: true,
+        })
+      );
     };
     ws.current.onmessage = (event) => {
-      const message = event.data;
-      const [uid, token] = message.split("|");
+      // Hello acknowledgement and frame rate control
+      if (typeof event.data === "string") {
+        const message = JSON.parse(event.data);
+        if (message.type == "rate") {
+          frameInterval.current = message.interval_ms;
+          frameSize.current = message.size;
+        }
+        return;
+      }
+
+      const view = new DataView(event.data);
+      const type = view.getUint8(0);
+      const streamId = view.getUint16(1);
+      const payload = new Uint8Array(event.data, 3);
 
-      if (!visitedUIDs.current.has(uid)) {
-        visitedUIDs.current.add(uid);
-        Haptics.notificationAsync(Haptics.NotificationFeedbackType.Error);
+      if (type == MESSAGE_HAZARD) {
+        const uid = decoder.decode(payload.subarray(1));
+        streams.current[streamId] = uid;
+        captions[uid] = "";
+
+        if (payload[0] == 1) {
+          Haptics.notificationAsync(Haptics.NotificationFeedbackType.Error);
+        }
+        return;
       }
 
-      if (token.trim() == "<end>") {
-        startSpeech(captions[uid]);
+      const uid = streams.current[streamId];
+      if (uid === undefined) {
+        return;
       }
 
-      if (captions[uid]) {
-        captions[uid] = captions[uid] + " " + token;
-      } else {
-        captions[uid] = token;
+      if (type == MESSAGE_TOKEN) {
+        captions[uid] += decoder.decode(payload);
+      } else if (type == MESSAGE_END) {
+        // Captions preempted by a newer scene are stale, so don't read them out
+        if (payload[0] == END_COMPLETE) {
+          startSpeech(captions[uid].trim());
+        }
+        delete streams.current[streamId];
+      } else if (type == MESSAGE_ERROR) {
+        console.error("Caption error:", decoder.decode(payload));
+        delete streams.current[streamId];
       }
     };
     ws.current.onerror = (error) => {
@@ -86,47 +138,60 @@ export default function Index() {
   }
 
   useEffect(() => {
-    let interval: string | number | NodeJS.Timeout | undefined;
-    if (isRecording) {
-      interval = setInterval(async () => {
-        if (cameraRef.current) {
-          try {
-            const uniqueId = uuidv4();
-            const photo = await cameraRef.current.takePictureAsync({
-              quality: 0.5,
-              base64: true,
-              skipProcessing: true,
-              shutterSound: false,
-            });
-            if (photo && photo.base64) {
-              const resizedPhoto = await ImageManipulator.manipulateAsync(
-                photo.uri,
-                [{ resize: { width: 128, height: 128 } }],
-                { base64: true }
+    let timeout: string | number | NodeJS.Timeout | undefined;
+    let stopped = false;
+
+    // Reschedule after every capture so interval changes apply right away
+    const capture = async () => {
+      if (cameraRef.current) {
+        try {
+          const uniqueId = uuidv4();
+          const photo = await cameraRef.current.takePictureAsync({
+            quality: 0.5,
+            base64: true,
+            skipProcessing: true,
+            shutterSound: false,
+          });
+          if (photo && photo.base64) {
+            const size = frameSize.current;
+            const resizedPhoto = await ImageManipulator.manipulateAsync(
+              photo.uri,
+              [{ resize: { width: size, height: size } }],
+              { base64: true }
+            );
+            if (resizedPhoto && resizedPhoto.base64) {
+              const imageBuffer = base64ToArrayBuffer(resizedPhoto.base64);
+              const idBuffer = new TextEncoder().encode(uniqueId + "|");
+              const combinedBuffer = new Uint8Array(
+                idBuffer.length + imageBuffer.byteLength
               );
-              if (resizedPhoto && resizedPhoto.base64) {
-                const imageBuffer = base64ToArrayBuffer(resizedPhoto.base64);
-                const idBuffer = new TextEncoder().encode(uniqueId + "|");
-                const combinedBuffer = new Uint8Array(
-                  idBuffer.length + imageBuffer.byteLength
-                );
-
-                combinedBuffer.set(idBuffer, 0);
-                combinedBuffer.set(new Uint8Array(imageBuffer), idBuffer.length);
-
-                if (ws.current && ws.current.readyState === WebSocket.OPEN) {
-                  console.log("Sending binary data to WebSocket");
-                  ws.current.send(combinedBuffer);
-                }
+
+              combinedBuffer.set(idBuffer, 0);
+              combinedBuffer.set(new Uint8Array(imageBuffer), idBuffer.length);
+
+              if (ws.current && ws.current.readyState === WebSocket.OPEN) {
+                console.log("Sending binary data to WebSocket");
+                ws.current.send(combinedBuffer);
               }
             }
-          } catch (error) {
-            console.error("Error taking pic:", error);
           }
+        } catch (error) {
+          console.error("Error taking pic:", error);
         }
-      }, 2000);
+      }
+
+      if (!stopped) {
+        timeout = setTimeout(capture, frameInterval.current);
+      }
+    };
+
+    if (isRecording) {
+      timeout = setTimeout(capture, frameInterval.current);
     }
-    return () => clearInterval(interval);
+    return () => {
+      stopped = true;
+      clearTimeout(timeout);
+    };
   }, [isRecording]);
 
   return (